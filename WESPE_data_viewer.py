@@ -7,6 +7,9 @@ email:  dmitrii.potorochin@desy.de
         dmitrii.potorochin@physik.tu-freiberg.de
         dm.potorochin@gmail.com
 """
+from time import perf_counter
+# Startup time of the window is measured from here (see startup_benchmark.py)
+start_time = perf_counter()
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
@@ -16,32 +19,42 @@ from kivy.uix.textinput import TextInput
 from kivy.config import Config
 from kivy.uix.popup import Popup
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.image import Image
+from kivy.clock import Clock
 import os
 import json
+import threading
 import numpy as np
-from IPython import get_ipython
 import calendar
 from time import gmtime
 from datetime import datetime
-from types import SimpleNamespace
-import matplotlib.pyplot as plt
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 os.chdir(dir_path)
 from packages.WESPE_data_OOP import create_batch
 from packages.WESPE_data_OOP import map_cut
 from packages.WESPE_data_OOP import plot_files
+from packages.WESPE_data_OOP import live_plot
+from packages.WESPE_data_OOP import quick_looks
+from packages.WESPE_data_OOP import quick_look_path
+from packages.WESPE_data_OOP import spec_map
+from packages.WESPE_data_OOP import job_queue
+from packages.WESPE_data_OOP import lazy_import
+# Settings shared with the analysis module, reloaded on file changes
+from packages.WESPE_data_OOP import config
+
+# pyplot and IPython are loaded on first use, not before the window appears
+plt = lazy_import('matplotlib.pyplot')
+
+
+def get_ipython():
+    '''
+    Returns the running IPython shell (None outside of IPython).
+    '''
+    from IPython import get_ipython as ipython_shell
+    return ipython_shell()
 
-# Loading configs from json file.
-try:
-    with open('config.json', 'r') as json_file:
-        config = json.load(json_file)
-except FileNotFoundError:
-    with open('packages/config.json', 'r') as json_file:
-        config = json.load(json_file)
-config = json.dumps(config)
-config = json.loads(config,
-                    object_hook=lambda d: SimpleNamespace(**d))
 
 # Dictionary for colors
 color_dict = {
@@ -58,9 +71,36 @@ color_dict = {
 
 
 class MainApp(App):
+    # Settings shown in the settings popup (config key, value type).
+    # The text inputs are stored as self.{config key}_value.
+    settings_fields = [('kivy_font', str), ('kivy_font_size', float),
+                       ('kivy_font_size_title', float), ('font_family', str),
+                       ('font_size', float), ('font_size_axis', float),
+                       ('dpi', float), ('fig_width', float),
+                       ('fig_height', float), ('axes_linewidth', float),
+                       ('cmap', str), ('map_scale', float),
+                       ('line_type_d', str), ('marker', str),
+                       ('line_width_d', float), ('marker_size_d', float),
+                       ('line_op_d', float), ('line_type_grid_d', str),
+                       ('line_width_grid_d', float),
+                       ('line_op_grid_d', float), ('line_type_t0_line', str),
+                       ('line_width_t0_line', float),
+                       ('line_op_t0_line', float)]
+
     def build(self):
         # returns a window object with all it's widgets
         self.title = 'WESPE data viewer'
+        # one figure updated in place by Sections III and IV
+        self.live_plot = live_plot()
+        # created on the first opening (see build_settings_popup)
+        self.settings_popup = None
+        # cancel event of the running map calculation (see callback_2)
+        self.map_job = None
+        # the latest upload started by callback_1
+        self.upload_job = None
+        # queued map and export jobs (see jobs_callback)
+        self.jobs = job_queue(workers=config.get('job_workers', 2))
+        self.jobs_popup = None
         self.window = BoxLayout(orientation='vertical',
                                 spacing=10, padding=10)
         self.top = BoxLayout(orientation='horizontal',
@@ -192,12 +232,24 @@ class MainApp(App):
                           font_name=config.kivy_font,
                           font_size=config.kivy_font_size_title,
                           color=config.kivy_color_white,
-                          size_hint=(0.8, 1),
+                          size_hint=(0.6, 1),
                           pos_hint={"center_x": 0.5, "center_y": 0.5}
                           )
         self.upload_runs.bind(on_press=self.callback_1)
         self.box3.add_widget(self.upload_runs)
 
+        quick_look_button = Button(text='Quick look',
+                                   bold=True,
+                                   background_color=config.kivy_color_button,
+                                   font_name=config.kivy_font,
+                                   font_size=config.kivy_font_size_title,
+                                   color=config.kivy_color_white,
+                                   size_hint=(0.2, 1),
+                                   pos_hint={"center_x": 0.5, "center_y": 0.5}
+                                   )
+        quick_look_button.bind(on_press=self.quick_look_callback)
+        self.box3.add_widget(quick_look_button)
+
         settings_popup = Button(text='App settings',
                                 bold=True,
                                 background_color='#09ff00',
@@ -423,7 +475,7 @@ class MainApp(App):
                                  font_name=config.kivy_font,
                                  font_size=config.kivy_font_size_title,
                                  color=config.kivy_color_white,
-                                 size_hint=(0.8, 1),
+                                 size_hint=(0.65, 1),
                                  pos_hint={"center_x": 0.5, "center_y": 0.5}
                                  )
         self.create_map.bind(on_press=self.callback_2_0)
@@ -445,6 +497,18 @@ class MainApp(App):
         self.map_mode.bind(on_press=self.create_plot_mode_callback)
         self.box7.add_widget(self.map_mode)
 
+        jobs_button = Button(text="Jobs",
+                             bold=True,
+                             background_color=config.kivy_color_button,
+                             font_name=config.kivy_font,
+                             font_size=config.kivy_font_size_title,
+                             color=config.kivy_color_white,
+                             size_hint=(0.15, 1),
+                             pos_hint={"center_x": 0.5, "center_y": 0.5}
+                             )
+        jobs_button.bind(on_press=self.jobs_callback)
+        self.box7.add_widget(jobs_button)
+
         '''
         DELAY-ENERGY PLOT PARAMETERS
         '''
@@ -943,6 +1007,10 @@ class MainApp(App):
         return self.window
 
     def callback_1(self, instance):
+        '''
+        Opens the summary popup and uploads the runs in a background
+        thread (see upload_worker), the summary grows with every run.
+        '''
         try:
             file_dir = self.directory_input.text
             run_numbers = self.run_numbers_input.text.split(',')
@@ -951,10 +1019,9 @@ class MainApp(App):
                 self.DLD = 'DLD4Q'
             else:
                 self.DLD = 'DLD1Q'
-            batch = create_batch(file_dir, run_numbers, DLD=self.DLD)
 
             Popup_run_info = BoxLayout(orientation='vertical', spacing=1)
-            Popup_output = batch.short_info + batch.full_info
+            Popup_output = f'Uploading run {run_numbers[0]}...'
             length = Popup_output.count('\n')/7.5
 
             Run_info = Label(text=Popup_output,
@@ -980,57 +1047,428 @@ class MainApp(App):
                               )
             Popup_run_info.add_widget(close_button)
 
-            popupWindow = Popup(title="Popup Window",
+            popupWindow = Popup(title=f"Uploaded 0 of {len(run_numbers)} runs",
                                 content=Popup_run_info)
             close_button.bind(on_press=lambda x: popupWindow.dismiss())
             popupWindow.open()
-            self.batch = batch
+            job = object()
+            self.upload_job = job
+            threading.Thread(target=self.upload_worker,
+                             args=(job, file_dir, run_numbers, self.DLD,
+                                   popupWindow, Run_info),
+                             daemon=True).start()
+        except Exception as err:
+            print('Unable to open file(s)!')
+            print('Full error message:')
+            print(err)
+
+    def upload_worker(self, job, file_dir, run_numbers, DLD, popup, label):
+        '''
+        Uploading of runs outside of the event thread. The summary is
+        passed to the popup with Clock after every run, the batch
+        replaces the current one when all runs are read.
+        '''
+        summary = ['']
+
+        def progress(batch, done, total):
+            text = batch.short_info + batch.full_info
+            summary[0] = text + '\n\n'
+            if done < total:
+                text = text + f'\n\nUploading run {run_numbers[done]}...'
+            title = f'Uploaded {done} of {total} runs'
+            Clock.schedule_once(lambda dt: self.upload_progress(popup, label,
+                                                                text, title))
+
+        try:
+            batch = create_batch(file_dir, run_numbers, DLD=DLD,
+                                 progress=progress)
+            Clock.schedule_once(lambda dt: self.upload_done(job, batch))
         except Exception as err:
             print('Unable to open file(s)!')
             print('Full error message:')
             print(err)
+            text = summary[0] + f'Unable to open file(s)!\n{err}'
+            Clock.schedule_once(lambda dt: self.upload_progress(popup, label,
+                                                                text,
+                                                                'Upload failed'))
+
+    def upload_progress(self, popup, label, text, title):
+        label.text = text
+        label.size_hint_y = 0.25*text.count('\n')/7.5
+        popup.title = title
+
+    def upload_done(self, job, batch):
+        # a newer upload started in the meantime wins
+        if self.upload_job is job:
+            self.upload_job = None
+            self.batch = batch
       
+    def quick_look_callback(self, instance):
+        '''
+        Shows thumbnails of all runs in the file directory (see quick_looks)
+        for selecting the runs to upload. The thumbnails are created
+        outside of the event thread (see quick_look_worker) and added
+        to the gallery one by one.
+        '''
+        try:
+            file_dir = self.directory_input.text.strip()
+            if self.DLD_toggle.state == 'down':
+                DLD = 'DLD4Q'
+            else:
+                DLD = 'DLD1Q'
+
+            Popup_quick_look = BoxLayout(orientation='vertical', spacing=5)
+            gallery = GridLayout(cols=4, spacing=5, size_hint_y=None)
+            gallery.bind(minimum_height=gallery.setter('height'))
+            selected = self.run_numbers_input.text.split(',')
+            selected = [i.strip() for i in selected]
+            toggles = {}
+
+            gallery_scroll = ScrollView()
+            gallery_scroll.add_widget(gallery)
+            Popup_quick_look.add_widget(gallery_scroll)
+
+            buttons = BoxLayout(orientation='horizontal', spacing=5,
+                                size_hint=(1, 0.1))
+            select_button = Button(
+                              text="Use selected runs",
+                              bold=True,
+                              background_color=config.kivy_color_button,
+                              font_name=config.kivy_font,
+                              font_size=config.kivy_font_size_title,
+                              color=config.kivy_color_white
+                              )
+            close_button = Button(
+                              text="Close",
+                              bold=True,
+                              background_color=config.kivy_color_button,
+                              font_name=config.kivy_font,
+                              font_size=config.kivy_font_size_title,
+                              color=config.kivy_color_white
+                              )
+            buttons.add_widget(select_button)
+            buttons.add_widget(close_button)
+            Popup_quick_look.add_widget(buttons)
+
+            popupWindow = Popup(title="Quick look (creating thumbnails...)",
+                                content=Popup_quick_look)
+
+            def select_runs(instance):
+                runs = [str(run) for run, toggle in toggles.items()
+                        if toggle.state == 'down']
+                if len(runs) > 0:
+                    self.run_numbers_input.text = ','.join(runs)
+                popupWindow.dismiss()
+
+            select_button.bind(on_press=select_runs)
+            close_button.bind(on_press=lambda x: popupWindow.dismiss())
+            popupWindow.open()
+            threading.Thread(target=self.quick_look_worker,
+                             args=(file_dir, DLD, gallery, toggles,
+                                   selected, popupWindow),
+                             daemon=True).start()
+        except Exception as err:
+            print('Unable to create quick looks!')
+            print('Full error message:')
+            print(err)
+
+    def quick_look_worker(self, file_dir, DLD, gallery, toggles, selected,
+                          popup):
+        '''
+        Creation of quick looks outside of the event thread. Every
+        finished thumbnail is passed to the gallery with Clock.
+        '''
+        def progress(run, summary):
+            Clock.schedule_once(lambda dt: self.quick_look_add(
+                file_dir, DLD, gallery, toggles, selected, run, summary))
+
+        try:
+            quick_looks(file_dir, DLD=DLD, progress=progress)
+            Clock.schedule_once(lambda dt: setattr(popup, 'title',
+                                                   'Quick look'))
+        except Exception as err:
+            print('Unable to create quick looks!')
+            print('Full error message:')
+            print(err)
+
+    def quick_look_add(self, file_dir, DLD, gallery, toggles, selected, run,
+                       summary):
+        thumbnail = BoxLayout(orientation='vertical',
+                              size_hint_y=None, height=200)
+        thumbnail.add_widget(Image(source=quick_look_path(file_dir, run, DLD)
+                                   + '.png',
+                                   nocache=True,
+                                   allow_stretch=True,
+                                   keep_ratio=False))
+        events = summary['Events']
+        if summary['Static']:
+            text = f'{run} (static, {events} e)'
+        else:
+            text = f'{run} ({events} e)'
+        if str(run) in selected:
+            state = 'down'
+        else:
+            state = 'normal'
+        toggles[run] = ToggleButton(text=text,
+                                    state=state,
+                                    font_name=config.kivy_font,
+                                    font_size=config.kivy_font_size,
+                                    size_hint=(1, 0.2)
+                                    )
+        thumbnail.add_widget(toggles[run])
+        gallery.add_widget(thumbnail)
+
     def callback_2_0(self, instance):
-        self.create_map.text = 'Loading...'
+        if self.map_job is None:
+            self.create_map.text = 'Loading...'
+        else:
+            self.create_map.text = 'Cancelling...'
 
     def callback_2(self, instance):
+        '''
+        Starts the calculation of the delay-energy map in a background
+        thread (see map_worker), pressing the button again cancels it.
+        '''
+        if self.map_job is not None:
+            self.map_job.set()
+            return
         try:
-            if self.f2.state == 'down':
-                for i in self.batch.batch_list:
-                    B_range = self.f3.text.split(',')
-                    B_range = [float(i) for i in B_range]
-                    i.Bunch_filter(B_range, B_type='MacroBunch')
-
-            if self.f5.state == 'down':
-                for i in self.batch.batch_list:
-                    B_range = self.f6.text.split(',')
-                    B_range = [float(i) for i in B_range]
-                    i.Bunch_filter(B_range, B_type='MicroBunch')
-
-            energy_step = float(self.e3.text)
-            delay_step = float(self.e6.text)
-            t0 = float(self.d3.text)
-
-            if self.map_mode.state == 'down':
-                ordinate = 'MB_ID'
-                delay_step = 1
-            else:
-                ordinate = 'delay'
+            source = self.batch
+            spec = self.map_spec(source)
+            batch = source.map_copy()
+        except Exception as err:
+            print('Unable to open file(s)!')
+            print('Full error message:')
+            print(err)
+            self.create_map.text = "Calculate delay-energy map"
+            return
+        cancel = threading.Event()
+        self.map_job = cancel
+        threading.Thread(target=self.map_worker,
+                         args=(source, batch, spec, cancel),
+                         daemon=True).start()
+
+    def map_spec(self, batch):
+        '''
+        Returns the spec (see render_figure) of the delay-energy map
+        set in the GUI for the uploaded runs.
+        '''
+        B_filters = []
+        if self.f2.state == 'down':
+            B_range = self.f3.text.split(',')
+            B_range = [float(i) for i in B_range]
+            B_filters.append([B_range, 'MacroBunch'])
+
+        if self.f5.state == 'down':
+            B_range = self.f6.text.split(',')
+            B_range = [float(i) for i in B_range]
+            B_filters.append([B_range, 'MicroBunch'])
+
+        view = {'energy_step': float(self.e3.text),
+                'delay_step': float(self.e6.text),
+                'ordinate': 'delay', 'B_filters': B_filters,
+                'BE': self.d5.state == 'down', 't0': None}
+        if self.map_mode.state == 'down':
+            view['ordinate'] = 'MB_ID'
+            view['delay_step'] = 1
+        if self.d2.state == 'down':
+            view['t0'] = float(self.d3.text)
+        else:
+            view['time_axis'] = 'Delay stage values'
+        if view['BE']:
+            view['energy_axis'] = 'Binding energy'
+        return {'runs': [i.run_num for i in batch.batch_list], 'view': view}
+
+    def view_spec(self):
+        '''
+        Returns the visualization settings of Section III
+        as the view keys of a spec (see apply_view).
+        '''
+        view = {'background': config.get('background', 'off'),
+                'norm_total_e': self.j2.state == 'down',
+                'dif_map': self.h3.state == 'down'}
+        if self.h2.state == 'down':
+            view['time_axis'] = 'Delay relative t0'
+        else:
+            view['time_axis'] = 'Delay stage values'
+        if self.h4.state == 'down':
+            view['energy_axis'] = 'Kinetic energy'
+        else:
+            view['energy_axis'] = 'Binding energy'
+        # norm_11 does not change a map normalized to 0-1
+        if self.j3.state == 'down':
+            view['norm'] = '01'
+        elif self.j4.state == 'down':
+            view['norm'] = '11'
+        for name, toggle, limits in [('ROI_E', self.i2, self.i3),
+                                     ('ROI_D', self.i5, self.i6)]:
+            if toggle.state == 'down':
+                try:
+                    view[name] = [float(i) for i in limits.text.split(',')]
+                except ValueError:
+                    pass  # the whole range as in callback_3
+        return view
+
+    def map_worker(self, source, batch, spec, cancel):
+        '''
+        Calculation of the delay-energy map on a copy of the batch outside
+        of the event thread. Progress and the result are passed to
+        the event thread with Clock, the batch is replaced in map_done.
+        Maps calculated before (also by jobs) are taken from map_results.
+        '''
+        def progress(done, total, run_num, events, elapsed):
+            rate = events/elapsed if elapsed > 0 else 0
+            text = f'Run {run_num} ({done}/{total}), '
+            text += f'{rate/1e6:.2f} M events/s - press to cancel'
+            Clock.schedule_once(lambda dt: self.map_progress(cancel, text))
+
+        try:
+            batch = spec_map(source.file_dir, spec,
+                             DLD=source.batch_list[0].DLD, batch=batch,
+                             progress=progress, cancel=cancel)
+            done = batch is not None
+            Clock.schedule_once(lambda dt: self.map_done(source, batch,
+                                                         cancel, done))
+        except Exception as err:
+            Clock.schedule_once(lambda dt, err=err: self.map_failed(cancel,
+                                                                    err))
+
+    def jobs_callback(self, instance):
+        '''
+        Shows the job list; the map set in the GUI can be queued
+        for calculation or export with a priority.
+        '''
+        if self.jobs_popup is None:
+            self.build_jobs_popup()
+        self.refresh_jobs()
+        self.jobs_refresh = Clock.schedule_interval(self.refresh_jobs, 0.5)
+        self.jobs_popup.open()
+
+    def build_jobs_popup(self):
+        Popup_jobs = BoxLayout(orientation='vertical', spacing=5)
+        self.jobs_list = GridLayout(cols=2, spacing=5, size_hint_y=None)
+        self.jobs_list.bind(minimum_height=self.jobs_list.setter('height'))
+        self.job_rows = {}
+        jobs_scroll = ScrollView()
+        jobs_scroll.add_widget(self.jobs_list)
+        Popup_jobs.add_widget(jobs_scroll)
+
+        buttons = BoxLayout(orientation='horizontal', spacing=5,
+                            size_hint=(1, 0.1))
+        priority = Label(text='Priority',
+                         font_size=config.kivy_font_size_title,
+                         color=config.kivy_color_white,
+                         font_name=config.kivy_font,
+                         size_hint=(0.5, 1)
+                         )
+        self.job_priority = TextInput(text='0',
+                                      multiline=False,
+                                      size_hint=(0.3, 1),
+                                      font_name=config.kivy_font,
+                                      font_size=config.kivy_font_size
+                                      )
+        buttons.add_widget(priority)
+        buttons.add_widget(self.job_priority)
+        for text, callback in [("Queue map",
+                                lambda x: self.queue_job_callback('map')),
+                               ("Queue export",
+                                lambda x: self.queue_job_callback('export')),
+                               ("Clear finished",
+                                lambda x: self.clear_jobs()),
+                               ("Close",
+                                lambda x: self.jobs_popup.dismiss())]:
+            button = Button(
+                            text=text,
+                            bold=True,
+                            background_color=config.kivy_color_button,
+                            font_name=config.kivy_font,
+                            font_size=config.kivy_font_size_title,
+                            color=config.kivy_color_white
+                            )
+            button.bind(on_press=callback)
+            buttons.add_widget(button)
+        Popup_jobs.add_widget(buttons)
 
-            for i in self.batch.batch_list:
-                i.create_map(energy_step, delay_step, ordinate=ordinate,
-                             save=config.save_nc)
-                if self.d5.state == 'down':
-                    i.set_BE()
+        self.jobs_popup = Popup(title="Jobs", content=Popup_jobs)
+        self.jobs_popup.bind(on_dismiss=lambda x: self.jobs_refresh.cancel())
 
-            self.batch.create_map()
-            if self.d2.state == 'down':
-                self.batch.create_dif_map()
+    def queue_job_callback(self, kind):
+        try:
+            spec = self.map_spec(self.batch)
+            spec['view'].update(self.view_spec())
+            priority = int(self.job_priority.text or 0)
+            self.jobs.submit(kind, self.batch.file_dir, spec,
+                             DLD=self.batch.batch_list[0].DLD,
+                             priority=priority)
+            self.refresh_jobs()
+        except Exception as err:
+            print('Unable to queue the job!')
+            print('Full error message:')
+            print(err)
 
-            if self.d2.state == 'down':
-                self.batch.time_zero(t0)
+    def clear_jobs(self):
+        self.jobs.clear()
+        self.refresh_jobs()
 
-            self.batch.ROI([0, self.batch.en_threshold], 'Energy axis')
+    def refresh_jobs(self, dt=None):
+        '''
+        Updates the status and the timings in the job list.
+        '''
+        jobs = {job.number: job for job in self.jobs.jobs}
+        for number in list(self.job_rows):
+            if number not in jobs:
+                for widget in self.job_rows.pop(number):
+                    self.jobs_list.remove_widget(widget)
+        for number, job in jobs.items():
+            if number not in self.job_rows:
+                label = Label(font_size=config.kivy_font_size,
+                              color=config.kivy_color_white,
+                              font_name=config.kivy_font,
+                              size_hint=(0.85, None), height=40
+                              )
+                cancel = Button(
+                                text="Cancel",
+                                background_color=config.kivy_color_button,
+                                font_name=config.kivy_font,
+                                font_size=config.kivy_font_size,
+                                color=config.kivy_color_white,
+                                size_hint=(0.15, None), height=40
+                                )
+                cancel.bind(on_press=lambda x, job=job: self.jobs.cancel(job))
+                self.jobs_list.add_widget(label)
+                self.jobs_list.add_widget(cancel)
+                self.job_rows[number] = (label, cancel)
+            label, cancel = self.job_rows[number]
+            label.text = job.summary()
+            cancel.disabled = job.status not in ('queued', 'running')
+
+    def map_progress(self, cancel, text):
+        if self.map_job is cancel and not cancel.is_set():
+            self.create_map.text = text
+
+    def map_failed(self, cancel, err):
+        self.map_job = None
+        print('Unable to open file(s)!')
+        print('Full error message:')
+        print(err)
+        self.create_map.text = "Calculate delay-energy map"
+
+    def map_done(self, source, batch, cancel, done):
+        '''
+        Replaces the batch with the calculated one and plots the map.
+        The result is dropped if the calculation was cancelled or
+        other runs were uploaded in the meantime.
+        '''
+        self.map_job = None
+        self.create_map.text = "Calculate delay-energy map"
+        if not done or cancel.is_set():
+            print('Calculation of delay-energy map cancelled')
+            return
+        if self.batch is not source:
+            print('Runs were uploaded again, the calculated map is dropped')
+            return
+        self.batch = batch
+        try:
             if config.matplotlib == 'qt':
                 get_ipython().run_line_magic('matplotlib', 'qt')
                 self.dpi = config.dpi/config.dpi_scale
@@ -1065,12 +1503,25 @@ class MainApp(App):
                            fig_height=self.fig_height)
             if config.matplotlib != 'qt':
                 plt.show()
-            self.create_map.text = "Calculate delay-energy map"
         except Exception as err:
-            print('Unable to open file(s)!')
+            print('Unable to plot the delay-energy map!')
             print('Full error message:')
             print(err)
-            self.create_map.text = "Calculate delay-energy map"
+
+    def show_plot(self, objects, save_mode=False):
+        '''
+        Plots the objects in a new figure (plot_files) or, for interactive
+        figures with persistent_figure on, updates the figure
+        kept between the calls (live_plot).
+        '''
+        if (save_mode is False and config.matplotlib == 'qt' and
+                config.get('persistent_figure', 'off') == 'on'):
+            return self.live_plot.plot(objects, dpi=self.dpi,
+                                       fig_width=self.fig_width,
+                                       fig_height=self.fig_height)
+        return plot_files(objects, dpi=self.dpi,
+                          fig_width=self.fig_width,
+                          fig_height=self.fig_height)
 
     def callback_3(self, instance):
         try:
@@ -1088,6 +1539,9 @@ class MainApp(App):
                     self.fig_height = config.fig_height*1.5
 
             self.batch.delay_energy_map_plot = self.batch.delay_energy_map
+            background = config.get('background', 'off')
+            if background != 'off':
+                self.batch.subtract_background(background)
 
             if self.j2.state == 'down':
                 self.batch.norm_total_e()
@@ -1106,7 +1560,7 @@ class MainApp(App):
                 self.batch.set_BE()
 
             if self.h3.state == 'down':
-                self.batch.create_dif_map()
+                self.batch.create_dif_map(config.get('dif_ref_window', 'auto'))
                 self.batch.set_dif_map()
 
             if self.j3.state == 'down':
@@ -1136,9 +1590,8 @@ class MainApp(App):
                     print(ROI_D)
                 self.batch.ROI(ROI_D, 'Time axis')
 
-            plot_files(self.batch, dpi=self.dpi,
-                       fig_width=self.fig_width,
-                       fig_height=self.fig_height)
+            self.show_plot(self.batch,
+                           self.create_plot_mode.state == 'down')
 
             if self.create_plot_mode.state == 'down':
                 path = self.directory_input.text.strip() + os.sep
@@ -1214,15 +1667,12 @@ class MainApp(App):
             if self.k4.state == 'down':
                 self.cut.waterfall()
 
+            save_mode = self.create_cut_plot_mode.state == 'down'
             if add_map is True:
-                plot = plot_files([self.batch, self.cut], dpi=self.dpi,
-                                  fig_width=self.fig_width,
-                                  fig_height=self.fig_height)
+                plot = self.show_plot([self.batch, self.cut], save_mode)
                 plot.span_plot(self.cut)
             else:
-                plot = plot_files(self.cut, dpi=self.dpi,
-                                  fig_width=self.fig_width,
-                                  fig_height=self.fig_height)
+                plot = self.show_plot(self.cut, save_mode)
 
             if self.k6.state == 'down':
                 plot.legend_plot()
@@ -1293,16 +1743,13 @@ class MainApp(App):
                 self.cut.derivative()
             self.cut.voigt_fit()
 
+            save_mode = self.create_cut_plot_mode.state == 'down'
             if add_map is True:
-                plot = plot_files([self.batch, self.cut], dpi=self.dpi,
-                                  fig_width=self.fig_width,
-                                  fig_height=self.fig_height)
+                plot = self.show_plot([self.batch, self.cut], save_mode)
                 plot.legend_plot()
                 plot.span_plot(self.cut)
             else:
-                plot = plot_files(self.cut, dpi=self.dpi,
-                                  fig_width=self.fig_width,
-                                  fig_height=self.fig_height)
+                plot = self.show_plot(self.cut, save_mode)
                 plot.legend_plot()
 
             if self.create_cut_plot_mode.state == 'down':
@@ -1342,12 +1789,40 @@ class MainApp(App):
             print('Full error message:')
             print(err)
 
+    def on_start(self):
+        # scheduled callbacks run after the first frame is drawn
+        Clock.schedule_once(self.startup_done, 0)
+
+    def startup_done(self, dt):
+        '''
+        Reports the time from the start of the import to the first frame.
+        With WESPE_STARTUP_BENCHMARK=1 the app is closed afterwards.
+        '''
+        self.startup_time = perf_counter() - start_time
+        print(f'Window is ready in {self.startup_time:.2f} s')
+        if os.environ.get('WESPE_STARTUP_BENCHMARK') == '1':
+            self.stop()
+
     def settings_popup_callback(self, instance):
-        with open('packages/config.json', 'r') as json_file:
-            self.config = json.load(json_file)
-        config = json.dumps(self.config)
-        config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
+        self.config = config.as_dict()
+        if self.settings_popup is None:
+            self.build_settings_popup()
+        self.refresh_settings(self.config)
+        self.settings_popup.open()
 
+    def refresh_settings(self, values):
+        '''
+        Shows the values (a dictionary) in the text inputs
+        of the settings popup.
+        '''
+        for name, value_type in self.settings_fields:
+            getattr(self, f'{name}_value').text = str(values[name])
+
+    def build_settings_popup(self):
+        '''
+        Creates the settings popup. It happens once, on the first opening;
+        afterwards the popup is only refreshed (see refresh_settings).
+        '''
         Settings_window = BoxLayout(orientation='vertical',
                                     spacing=10, padding=5,
                                     size_hint=(0.5, 1))
@@ -1970,72 +2445,20 @@ class MainApp(App):
 
         Settings_window.add_widget(bottom)
 
-        popupWindow = Popup(title="Settings",
-                            content=Settings_window)
-        close_button.bind(on_press=lambda x: popupWindow.dismiss())
-        popupWindow.open()
+        self.settings_popup = Popup(title="Settings",
+                                    content=Settings_window)
+        close_button.bind(on_press=lambda x: self.settings_popup.dismiss())
 
     def callback_save_settings(self, instance):
-        self.config['kivy_font'] = self.kivy_font_value.text
-        self.config['kivy_font_size'] = float(self.kivy_font_size_value.text)
-        self.config['kivy_font_size_title'] = float(self.kivy_font_size_title_value.text)
-        self.config['font_family'] = self.font_family_value.text
-        self.config['font_size'] = float(self.font_size_value.text)
-        self.config['font_size_axis'] = float(self.font_size_axis_value.text)
-        self.config['dpi'] = float(self.dpi_value.text)
-        self.config['fig_width'] = float(self.fig_width_value.text)
-        self.config['fig_height'] = float(self.fig_height_value.text)
-        self.config['axes_linewidth'] = float(self.axes_linewidth_value.text)
-        self.config['cmap'] = self.cmap_value.text
-        self.config['map_scale'] = float(self.map_scale_value.text)
-        self.config['line_type_d'] = self.line_type_d_value.text
-        self.config['marker'] = self.marker_value.text
-        self.config['line_width_d'] = float(self.line_width_d_value.text)
-        self.config['marker_size_d'] = float(self.marker_size_d_value.text)
-        self.config['line_op_d'] = float(self.line_op_d_value.text)
-        self.config['line_type_grid_d'] = self.line_type_grid_d_value.text
-        self.config['line_width_grid_d'] = float(self.line_width_grid_d_value.text)
-        self.config['line_op_grid_d'] = float(self.line_op_grid_d_value.text)
-        self.config['line_type_t0_line'] = self.line_type_t0_line_value.text
-        self.config['line_width_t0_line'] = float(self.line_width_t0_line_value.text)
-        self.config['line_op_t0_line'] = float(self.line_op_t0_line_value.text)
-
-        with open('packages/config.json', 'w') as json_file:
-            json.dump(self.config, json_file)
-
-        global config
-        config = json.dumps(self.config)
-        config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
+        for name, value_type in self.settings_fields:
+            self.config[name] = value_type(getattr(self, f'{name}_value').text)
+
+        config.save(self.config)
 
     def callback_load_settings(self, instance):
         with open('packages/default_config.json', 'r') as json_file:
             self.config = json.load(json_file)
-        config = json.dumps(self.config)
-        config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
-
-        self.kivy_font_value.text = str(config.kivy_font)
-        self.kivy_font_size_value.text = str(config.kivy_font_size)
-        self.kivy_font_size_title_value.text = str(config.kivy_font_size_title)
-        self.font_family_value.text = str(config.font_family)
-        self.font_size_value.text = str(config.font_size)
-        self.font_size_axis_value.text = str(config.font_size_axis)
-        self.dpi_value.text = str(config.dpi)
-        self.fig_width_value.text = str(config.fig_width)
-        self.fig_height_value.text = str(config.fig_height)
-        self.axes_linewidth_value.text = str(config.axes_linewidth)
-        self.cmap_value.text = str(config.cmap)
-        self.map_scale_value.text = str(config.map_scale)
-        self.line_type_d_value.text = str(config.line_type_d)
-        self.marker_value.text = str(config.marker)
-        self.line_width_d_value.text = str(config.line_width_d)
-        self.marker_size_d_value.text = str(config.marker_size_d)
-        self.line_op_d_value.text = str(config.line_op_d)
-        self.line_type_grid_d_value.text = str(config.line_type_grid_d)
-        self.line_width_grid_d_value.text = str(config.line_width_grid_d)
-        self.line_op_grid_d_value.text = str(config.line_op_grid_d)
-        self.line_type_t0_line_value.text = str(config.line_type_t0_line)
-        self.line_width_t0_line_value.text = str(config.line_width_t0_line)
-        self.line_op_t0_line_value.text = str(config.line_op_t0_line)
+        self.refresh_settings(self.config)
 
     def callback_d2(self, instance):
         if self.d2.state == 'down':
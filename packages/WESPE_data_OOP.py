@@ -9,26 +9,205 @@ email:  dmitrii.potorochin@desy.de
 """
 
 # This section is supposed for importing necessary modules.
-import matplotlib.pyplot as plt
+# Heavy modules (matplotlib, xarray) are loaded on first use (see lazy_import),
+# scipy, lmfit, PIL and mpl_toolkits are imported in the functions using them.
 import numpy as np
 import os
+import sys
 import math
 import h5py
 import json
+import copy
+import inspect
+import heapq
 import calendar
+import threading
+import importlib.util
+import importlib.machinery
 from types import SimpleNamespace
-from time import gmtime
+from time import gmtime, monotonic
 from datetime import datetime
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-from matplotlib.ticker import MultipleLocator
-import matplotlib
-from scipy.signal import savgol_filter
-import xarray as xr
-from PIL import Image, ImageDraw, ImageFont
-from lmfit.models import VoigtModel, ConstantModel
-import matplotlib.colors as colors
 
 from timeit import default_timer as timer
+from functools import lru_cache, wraps
+from collections import OrderedDict
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def module_spec(name):
+    '''
+    Returns the spec of the module name without executing its parent
+    packages (importlib.util.find_spec imports them).
+    '''
+    path = None
+    if '.' in name:
+        path = module_spec(name.rsplit('.', 1)[0]).submodule_search_locations
+    return importlib.machinery.PathFinder.find_spec(name, path)
+
+
+def lazy_import(name):
+    '''
+    Returns the module name, which is executed only on the first access
+    to its attributes, so importing this module (and starting the GUI)
+    does not wait for heavy dependencies.
+    Parent packages are imported lazily as well.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    if '.' in name:
+        lazy_import(name.rsplit('.', 1)[0])
+    spec = module_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    if '.' in name:
+        parent, child = name.rsplit('.', 1)
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+matplotlib = lazy_import('matplotlib')
+colors = lazy_import('matplotlib.colors')
+ticker = lazy_import('matplotlib.ticker')
+plt = lazy_import('matplotlib.pyplot')
+xr = lazy_import('xarray')
+
+
+class config_file:
+    '''
+    The object for access to settings stored in config.json
+    (the first existing file from paths). Settings are available as
+    attributes, e.g. config.dpi. The file is parsed again only when its
+    modification time or size changes, so all modules see the current
+    settings without reading the file on every call. The file is checked
+    at most once per interval (s).
+    Settings missing in the file (e.g. config files of older versions)
+    are taken from default_config.json next to this module.
+    '''
+    paths = ['config.json', 'packages/config.json']
+    defaults = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'default_config.json')
+    fields = ['path', 'stamp', 'values', 'listeners', 'checked',
+              'default_values']
+    interval = 0.5
+
+    def __init__(self, paths=None):
+        if paths is not None:
+            self.paths = paths
+        self.path = None
+        self.stamp = None
+        self.values = None
+        self.listeners = []
+        self.checked = None
+        self.default_values = None
+
+    def load(self):
+        '''
+        Method returning the settings (SimpleNamespace).
+        Functions registered with subscribe are called after every
+        reading of the file.
+        '''
+        now = monotonic()
+        if self.checked is not None and now - self.checked < self.interval:
+            return self.values
+        self.checked = now
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if path != self.path or stamp != self.stamp:
+                with open(path, 'r') as json_file:
+                    values = json.load(json_file, object_hook=lambda d:
+                                       SimpleNamespace(**d))
+                for name, value in self.load_defaults().items():
+                    if not hasattr(values, name):
+                        setattr(values, name, value)
+                self.path, self.stamp, self.values = path, stamp, values
+                for callback in self.listeners:
+                    callback(values)
+            return self.values
+        if self.values is None:
+            raise FileNotFoundError('config.json is not found')
+        return self.values
+
+    def load_defaults(self):
+        '''
+        Method returning the default settings (dictionary) read once
+        from default_config.json; empty if the file is missing.
+        '''
+        if self.default_values is None:
+            try:
+                with open(self.defaults, 'r') as json_file:
+                    self.default_values = json.load(json_file)
+            except FileNotFoundError:
+                self.default_values = {}
+        return self.default_values
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in self.fields:
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def get(self, name, default=None):
+        '''
+        Method returning a setting or default if it is missing
+        (e.g. in config files of older versions).
+        '''
+        return getattr(self.load(), name, default)
+
+    def as_dict(self):
+        '''
+        Method returning a copy of the settings as a dictionary.
+        '''
+        return dict(vars(self.load()))
+
+    def save(self, values, path=None):
+        '''
+        Method for writing settings (a dictionary) to the config file
+        (by default the one load resolves, so the saved settings are not
+        shadowed by a file earlier in paths) and reloading them.
+        '''
+        if path is None:
+            self.checked = None
+            try:
+                self.load()
+            except FileNotFoundError:
+                pass
+            path = self.path or self.paths[-1]
+        with open(path, 'w') as json_file:
+            json.dump(values, json_file)
+        self.stamp = None
+        self.checked = None
+        self.load()
+
+    def subscribe(self, callback):
+        '''
+        Method for registering a function called with the new settings
+        whenever the config file is read.
+        '''
+        self.listeners.append(callback)
+        if self.values is not None:
+            callback(self.values)
+
+
+def update_rc_params(values):
+    '''
+    Applies the font and axes settings to matplotlib.
+    '''
+    matplotlib.rcParams.update({'font.size': values.font_size,
+                                'font.family': values.font_family,
+                                'axes.linewidth': values.axes_linewidth})
+
+
+# Settings shared by all modules
+config = config_file()
+config.subscribe(update_rc_params)
+
 
 # Dictionary for colors
 color_dict = {
@@ -44,14 +223,45 @@ color_dict = {
 }
 
 
-def scan_hdf5(hdf5_obj, hdf5_path=[]):
+def line_color(i):
+    '''
+    Function returning the color of the i-th line.
+    Colors of color_dict are repeated for long lists of lines.
+    '''
+    return color_dict[i % len(color_dict)]
+
+
+def output_folder(path):
+    '''
+    Creates a folder named by the current date and time in path and
+    returns it with a trailing separator. A number is appended to the
+    name if the folder exists, e.g. for two exports within one second.
+    '''
+    os.makedirs(path, exist_ok=True)
+    ts = calendar.timegm(gmtime())
+    date_time = datetime.fromtimestamp(ts)
+    str_date_time = date_time.strftime("%d.%m.%Y_%H-%M-%S")
+    name = str_date_time
+    counter = 1
+    while True:
+        try:
+            os.mkdir(path + os.sep + name)
+            return path + os.sep + name + os.sep
+        except FileExistsError:
+            counter += 1
+            name = f'{str_date_time}_{counter}'
+
+
+def scan_hdf5(hdf5_obj, hdf5_path=None):
     '''
     This function helps to adapt to changing structure
     of hdf5 files from WESPE.
     '''
+    if hdf5_path is None:
+        hdf5_path = []
     if type(hdf5_obj) in [h5py._hl.group.Group, h5py._hl.files.File]:
         for counter, key in enumerate(hdf5_obj.keys()):
-            scan_hdf5(hdf5_obj[key])
+            scan_hdf5(hdf5_obj[key], hdf5_path)
     elif type(hdf5_obj) == h5py._hl.dataset.Dataset:
         full_path = hdf5_obj.name
         dataset_name = full_path.replace(hdf5_obj.parent.name, '')
@@ -66,6 +276,8 @@ def text_phantom(text, size):
     This function helps to create a dummy image with an error message
     if something goes wrong with data handling.
     '''
+    from PIL import Image, ImageDraw, ImageFont
+
     # Availability is platform dependent
     font = 'arial'
 
@@ -88,23 +300,904 @@ def text_phantom(text, size):
     return (255 - np.asarray(canvas)) / 255.0
 
 
+def float_dtype(values):
+    '''
+    Determines the floating point type used for derived arrays.
+    In the 'float32' precision mode (opt-in in config.json, the default
+    is 'float64') it is always float32.
+    '''
+    if config.get('precision', 'float64') == 'float32':
+        return np.dtype(np.float32)
+    if np.issubdtype(values.dtype, np.floating):
+        return values.dtype
+    return np.dtype(np.float64)
+
+
+def analysis_array(values):
+    '''
+    Converts an array to the floating point type of the precision mode.
+    Arrays are returned unchanged in the 'float64' mode.
+    '''
+    values = np.asarray(values)
+    if config.get('precision', 'float64') == 'float32':
+        return values.astype(np.float32, copy=False)
+    return values
+
+
+def counts_array(values):
+    '''
+    Stores counts in the smallest sufficient unsigned integer type
+    in the 'float32' precision mode.
+    '''
+    values = np.asarray(values)
+    if config.get('precision', 'float64') != 'float32' or values.size == 0:
+        return values
+    if values.dtype.kind == 'f':
+        if np.any(values % 1 != 0) or np.nanmin(values) < 0:
+            return values.astype(np.float32)
+    elif values.dtype.kind not in 'iu':
+        return values
+    return values.astype(np.min_scalar_type(int(values.max())))
+
+
+def norm_total_e_array(values, axis=1):
+    '''
+    Normalization of every line of a 2D array to the mean of the line sums.
+    One reduction pass and a single allocation for the result.
+    '''
+    norm = np.nansum(values, axis=axis, keepdims=True, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norm = np.mean(norm) / norm
+    return np.multiply(values, norm, dtype=float_dtype(values),
+                       casting='unsafe')
+
+
+def norm_01_array(values, axis=None):
+    '''
+    Normalization of an array to [0, 1] as [min, max].
+    axis=None normalizes the whole array, otherwise every line separately.
+    '''
+    norm_min = np.nanmin(values, axis=axis, keepdims=True)
+    norm_max = np.nanmax(values, axis=axis, keepdims=True)
+    new_values = np.subtract(values, norm_min, dtype=float_dtype(values),
+                             casting='unsafe')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new_values /= norm_max - norm_min
+    return new_values
+
+
+def norm_11_array(values, axis=None):
+    '''
+    Normalization of an array to the maximal value between abs(min)
+    and abs(max).
+    '''
+    norm_min = np.nanmin(values, axis=axis, keepdims=True)
+    norm_max = np.nanmax(values, axis=axis, keepdims=True)
+    norm = np.maximum(np.abs(norm_min), np.abs(norm_max))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.divide(values, norm, dtype=float_dtype(values),
+                         casting='unsafe')
+
+
+@lru_cache(maxsize=32)
+def savgol_kernel(window_length=3, polyorder=1, cycles=1):
+    '''
+    Convolution kernel equivalent to several cycles of
+    the Savitzky–Golay filter (the filter kernel convolved with itself).
+    '''
+    from scipy.signal import savgol_coeffs
+
+    kernel = savgol_coeffs(window_length, polyorder, use='conv')
+    composite = kernel
+    for i in range(cycles - 1):
+        composite = np.convolve(composite, kernel)
+    return composite
+
+
+def savgol_array(values, window_length=3, polyorder=1, cycles=1, axis=-1):
+    '''
+    Savitzky–Golay smoothing of all lines of an array along axis
+    in one convolution with the composite kernel of all cycles.
+    The result is the same as cycles passes of scipy savgol_filter
+    (mode='nearest'). Every pass extends the lines with their edge
+    values, so the points within reach of the edges are calculated
+    with successive passes over the edge regions only.
+    '''
+    from scipy.ndimage import convolve1d
+
+    values = np.asarray(values)
+    values = values.astype(float_dtype(values), copy=False)
+    if cycles < 1:
+        return values.copy()
+
+    def passes(part):
+        kernel = savgol_kernel(window_length, polyorder).astype(part.dtype)
+        for i in range(cycles):
+            part = convolve1d(part, kernel, axis=-1, mode='nearest')
+        return part
+
+    values = np.moveaxis(values, axis, -1)
+    n = values.shape[-1]
+    # points differing from the composite convolution and the length
+    # of the edge regions they depend on
+    reach = (cycles - 1)*(window_length//2)
+    edge = reach + cycles*(window_length//2)
+    if reach > 0 and n <= 2*edge:
+        return np.moveaxis(passes(values), -1, axis)
+    kernel = savgol_kernel(window_length, polyorder, cycles)
+    result = convolve1d(values, kernel.astype(values.dtype), axis=-1,
+                        mode='nearest')
+    if reach > 0:
+        result[..., :reach] = passes(values[..., :edge])[..., :reach]
+        result[..., -reach:] = passes(values[..., -edge:])[..., -reach:]
+    return np.moveaxis(result, -1, axis)
+
+
+def background_array(values, energy, model='shirley', axis=1, n_avg=3,
+                     max_iter=50, tol=1e-6):
+    '''
+    Background of all energy dispersive curves of a 2D array at once.
+    energy - kinetic energy values along axis
+    model - 'shirley' (iterative), 'linear' (a line between the averaged
+    end points of every curve) or 'constant' (the lower end point)
+    Shirley iterations are done for all curves simultaneously: the area
+    above the background on the high kinetic energy side of every point
+    is a reversed cumulative sum.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    energy = np.asarray(energy)
+    values = np.moveaxis(values, axis, -1)
+    flip = energy.shape[0] > 1 and energy[0] > energy[-1]
+    if flip:  # the calculation is done for ascending kinetic energy
+        values = values[..., ::-1]
+    y = np.nan_to_num(values)
+    n_avg = max(1, min(n_avg, y.shape[-1]))
+    low_ke = y[..., :n_avg].mean(axis=-1, keepdims=True)
+    high_ke = y[..., -n_avg:].mean(axis=-1, keepdims=True)
+
+    if model == 'constant':
+        background = np.minimum(low_ke, high_ke)*np.ones_like(y)
+    elif model == 'linear':
+        weight = np.linspace(0, 1, y.shape[-1])
+        background = low_ke + (high_ke - low_ke)*weight
+    else:
+        background = np.zeros_like(y) + high_ke
+        for i in range(max_iter):
+            signal = y - background
+            # area on the high kinetic energy side of every point
+            area = np.cumsum(signal[..., ::-1], axis=-1)[..., ::-1]
+            area = area - signal
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = area/area[..., :1]
+            ratio = np.nan_to_num(ratio, nan=0, posinf=0, neginf=0)
+            new_background = high_ke + (low_ke - high_ke)*ratio
+            change = np.max(np.abs(new_background - background))
+            background = new_background
+            if change <= tol*(np.max(np.abs(y)) + 1e-300):
+                break
+    if flip:
+        background = background[..., ::-1]
+    return np.moveaxis(background, -1, axis)
+
+
+def robust_limits(values, low=0.5, high=99.5, max_samples=262144):
+    '''
+    Approximate percentiles of an array for color scale limits.
+    Large arrays are subsampled at random (seeded, so the limits of
+    a map do not change between redraws) before partitioning, so the cost
+    does not depend on the map size. A random sample does not alias
+    onto a few columns like a regular stride can.
+    '''
+    values = np.ravel(values)
+    if values.size > max_samples:
+        rng = np.random.default_rng(0)
+        values = values[rng.integers(0, values.size, max_samples)]
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return np.nan, np.nan
+    k_low = int(round(low/100*(values.size - 1)))
+    k_high = int(round(high/100*(values.size - 1)))
+    values = np.partition(values, [k_low, k_high])
+    return float(values[k_low]), float(values[k_high])
+
+
+def block_reduce(values, factors, method='mean'):
+    '''
+    Reduces a 2D array by aggregating blocks of factors[0] x factors[1]
+    elements with their mean or maximum value.
+    The last rows and columns which do not fill a whole block are cropped,
+    so all the blocks have the same size (see map_display.reduce).
+    '''
+    for axis, factor in enumerate(factors):
+        if factor <= 1:
+            continue
+        n = values.shape[axis]//factor
+        values = np.take(values, np.arange(n*factor), axis=axis)
+        shape = values.shape[:axis] + (n, factor) + values.shape[axis+1:]
+        if method == 'max':
+            values = np.fmax.reduce(values.reshape(shape), axis=axis+1)
+        else:
+            values = values.reshape(shape).mean(axis=axis+1)
+    return values
+
+
+def voigt_params(model, x, y, step):
+    '''
+    Initial values and bounds of Voigt+constant fit parameters
+    guessed from the curve.
+    step - coordinate step used for the width limits
+    '''
+    amplitude_g = np.max(y)/2
+    center_g = x[np.argmax(y)]
+    c_g = np.median(y)
+
+    # create parameters with initial values
+    params = model.make_params(amplitude=amplitude_g, center=center_g,
+                               sigma=abs(step)*2,
+                               gamma=abs(step)*2, c=c_g)
+
+    # maybe place bounds on some parameters
+    params['center'].min = np.min(x)
+    params['center'].max = np.max(x)
+    params['sigma'].min = abs(step)
+    params['sigma'].max = abs(step)*200
+    params['gamma'].min = abs(step)
+    params['gamma'].max = abs(step)*200
+    if amplitude_g != 0:
+        params['amplitude'].min = amplitude_g/10
+        params['amplitude'].max = amplitude_g*100
+    if np.min(y) + np.max(y) != 0:
+        params['c'].min = np.min(y)
+        params['c'].max = np.max(y)
+    return params
+
+
+fit_names = {'center': 'Center', 'fwhm': 'FWHM', 'amplitude': 'Amplitude',
+             'sigma': 'Sigma', 'gamma': 'Gamma', 'c': 'Background'}
+
+
+def voigt_fit_lines(x, lines, step):
+    '''
+    Voigt+constant fits of the lines of a 2D array one after another.
+    Every fit is warm-started from the result of the previous line.
+    Returns a list of dictionaries with values and stderr of parameters.
+    '''
+    from lmfit.models import VoigtModel, ConstantModel
+
+    model = VoigtModel() + ConstantModel()
+    rows = []
+    previous = None
+    for y in lines:
+        params = voigt_params(model, x, y, step)
+        if previous is not None:
+            for name, param in params.items():
+                if param.vary and param.expr is None:
+                    param.value = np.clip(previous[name].value,
+                                          param.min, param.max)
+        result = model.fit(y, params, x=x)
+        row = {'Reduced chi-square': result.redchi}
+        for name, label in fit_names.items():
+            row[label] = result.params[name].value
+            stderr = result.params[name].stderr
+            row[f'{label} stderr'] = np.nan if stderr is None else stderr
+        rows.append(row)
+        if result.success:
+            previous = result.params
+    return rows
+
+
+def voigt_profile(x, center, sigma, gamma, jacobian=False):
+    '''
+    Area-normalized Voigt profile (the same as in lmfit VoigtModel)
+    calculated with the Faddeeva function.
+    center can be an array of shape (n, 1) giving n lines at once.
+    jacobian=True returns also the derivatives of the profile
+    with respect to center, sigma and gamma.
+    '''
+    from scipy.special import wofz
+
+    z = (x - center + 1j*gamma)/(sigma*np.sqrt(2))
+    w = wofz(z)
+    norm = 1/(sigma*np.sqrt(2*np.pi))
+    profile = w.real*norm
+    if jacobian is False:
+        return profile
+    # dw/dz = -2zw + 2i/sqrt(pi)
+    dw = -2*z*w + 2j/np.sqrt(np.pi)
+    d_center = -dw.real*norm/(sigma*np.sqrt(2))
+    d_sigma = -(dw*z).real*norm/sigma - profile/sigma
+    d_gamma = -dw.imag*norm/(sigma*np.sqrt(2))
+    return profile, d_center, d_sigma, d_gamma
+
+
+def voigt_fwhm(sigma, gamma):
+    '''
+    FWHM of the Voigt profile (the approximation used by lmfit)
+    and its derivatives with respect to sigma and gamma.
+    '''
+    root = np.sqrt(0.8664*gamma**2 + 5.545083*sigma**2)
+    fwhm = 1.0692*gamma + root
+    return fwhm, 5.545083*sigma/root, 1.0692 + 0.8664*gamma/root
+
+
+def global_voigt_fit(x, lines, max_iter=200, tol=1e-10):
+    '''
+    Simultaneous fit of all lines of a 2D array with Voigt + constant
+    curves sharing sigma and gamma (global parameters) while amplitude,
+    center and background are fitted for every line (local parameters).
+    Levenberg-Marquardt steps are calculated from analytic Jacobians of
+    the whole array. The normal equations are block-diagonal in the local
+    parameters, so they are reduced to the 2x2 Schur complement of
+    the global parameters plus batched 3x3 solves for every line.
+    NaN points are excluded from the fit.
+    Returns a dictionary with the parameters, their stderr and the fit.
+    success is True only if the relative decrease of the cost fell
+    below tol; message tells why the iterations stopped.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    lines = np.asarray(lines, dtype=np.float64)
+    valid = ~np.isnan(lines)
+    weight = valid.astype(np.float64)
+    y = np.where(valid, lines, 0)
+    has_data = valid.any(axis=1)
+    step = np.abs(np.gradient(x)).mean()
+
+    # initial guess from the mean line and the maxima of every line
+    mean_line = np.nanmean(lines[has_data], axis=0)
+    half = (np.nanmax(mean_line) + np.nanmin(mean_line))/2
+    fwhm = max(np.sum(mean_line > half)*step, 2*step)
+    glob = np.array([fwhm/3.6, fwhm/3.6])  # sigma, gamma
+    background = np.where(has_data, np.nanmin(np.where(valid, lines, np.inf),
+                                              axis=1), 0)
+    background[~np.isfinite(background)] = 0
+    peak = np.argmax(np.where(valid, lines, -np.inf), axis=1)
+    height = y[np.arange(y.shape[0]), peak] - background
+    amplitude = height/voigt_profile(0, 0, glob[0], glob[1])
+    loc = np.stack([amplitude, x[peak], background], axis=1)
+    glob_min = step*1e-3
+
+    def residual(loc, glob, jacobian=False):
+        result = voigt_profile(x, loc[:, 1:2], glob[0], glob[1], jacobian)
+        if jacobian is False:
+            return (loc[:, 0:1]*result + loc[:, 2:3] - y)*weight
+        profile, d_center, d_sigma, d_gamma = result
+        amp = loc[:, 0:1]
+        res = (amp*profile + loc[:, 2:3] - y)*weight
+        jac_loc = np.stack([profile, amp*d_center,
+                            np.ones_like(profile)], axis=-1)
+        jac_glob = np.stack([amp*d_sigma, amp*d_gamma], axis=-1)
+        jac_loc *= weight[..., None]
+        jac_glob *= weight[..., None]
+        return res, jac_loc, jac_glob
+
+    def normal_equations(jac_loc, jac_glob, res):
+        V = np.einsum('nmi,nmj->nij', jac_loc, jac_loc)
+        W = np.einsum('nmi,nmj->nij', jac_glob, jac_loc)
+        U = np.einsum('nmi,nmj->ij', jac_glob, jac_glob)
+        g_loc = np.einsum('nmi,nm->ni', jac_loc, res)
+        g_glob = np.einsum('nmi,nm->i', jac_glob, res)
+        return V, W, U, g_loc, g_glob
+
+    def schur(V, W, U, damping):
+        # a small ridge keeps empty lines solvable
+        ridge = 1e-12*(np.abs(V).max() + 1)
+        diag_V = np.einsum('nii->ni', V)
+        V = V + np.eye(3)*(damping*diag_V + ridge)[:, None, :]
+        U = U + np.diag(damping*np.diag(U))
+        V_inv = np.linalg.inv(V)
+        WV_inv = np.einsum('nij,njk->nik', W, V_inv)
+        S = U - np.einsum('nik,njk->ij', WV_inv, W)
+        return V_inv, WV_inv, S
+
+    res, jac_loc, jac_glob = residual(loc, glob, True)
+    cost = np.sum(res**2)
+    damping = 1e-3
+    success = False
+    message = 'Maximum number of iterations reached'
+    for iteration in range(max_iter):
+        V, W, U, g_loc, g_glob = normal_equations(jac_loc, jac_glob, res)
+        while True:
+            V_inv, WV_inv, S = schur(V, W, U, damping)
+            rhs = -g_glob + np.einsum('nik,nk->i', WV_inv, g_loc)
+            d_glob = np.linalg.solve(S, rhs)
+            d_loc = -np.einsum('nij,nj->ni', V_inv,
+                               g_loc + np.einsum('nij,i->nj', W, d_glob))
+            new_glob = np.maximum(glob + d_glob, glob_min)
+            new_loc = loc + d_loc
+            new_cost = np.sum(residual(new_loc, new_glob)**2)
+            if new_cost <= cost:
+                damping = max(damping/10, 1e-12)
+                break
+            damping = damping*10
+            if damping > 1e12:
+                break
+        if damping > 1e12:
+            # no step decreases the cost, but tol was not reached
+            message = 'Stalled: the cost can not be decreased'
+            break
+        decrease = cost - new_cost
+        loc, glob, cost = new_loc, new_glob, new_cost
+        res, jac_loc, jac_glob = residual(loc, glob, True)
+        if decrease <= tol*cost:
+            success = True
+            message = 'Converged'
+            break
+
+    # covariance from the undamped normal equations
+    n_free = max(int(valid.sum()) - loc.size - glob.size, 1)
+    redchi = cost/n_free
+    V, W, U, g_loc, g_glob = normal_equations(jac_loc, jac_glob, res)
+    V_inv, WV_inv, S = schur(V, W, U, 0)
+    S_inv = np.linalg.inv(S)
+    cov_glob = S_inv*redchi
+    cov_loc = V_inv + np.einsum('nai,ab,nbj->nij', WV_inv, S_inv, WV_inv)
+    std_loc = np.sqrt(np.abs(np.einsum('nii->ni', cov_loc))*redchi)
+    std_glob = np.sqrt(np.abs(np.diag(cov_glob)))
+    fwhm, d_sigma, d_gamma = voigt_fwhm(glob[0], glob[1])
+    grad = np.array([d_sigma, d_gamma])
+    fwhm_std = np.sqrt(np.abs(grad @ cov_glob @ grad))
+
+    loc[~has_data] = np.nan
+    std_loc[~has_data] = np.nan
+    fit = loc[:, 0:1]*voigt_profile(x, loc[:, 1:2], glob[0], glob[1])
+    fit = fit + loc[:, 2:3]
+    return {'amplitude': loc[:, 0], 'center': loc[:, 1],
+            'background': loc[:, 2],
+            'amplitude_std': std_loc[:, 0], 'center_std': std_loc[:, 1],
+            'background_std': std_loc[:, 2],
+            'sigma': glob[0], 'gamma': glob[1], 'fwhm': fwhm,
+            'sigma_std': std_glob[0], 'gamma_std': std_glob[1],
+            'fwhm_std': fwhm_std, 'fit': fit, 'redchi': redchi,
+            'iterations': iteration + 1, 'success': success,
+            'message': message}
+
+
+def replica_counts(index, weights=None):
+    '''
+    Returns delay-energy map counts (in 'Delay', 'Energy' order) built
+    from the events of create_batch.bootstrap_index with a single
+    np.bincount. weights - weight of every macrobunch, None for the
+    measured counts.
+    '''
+    size = index['shape'][0]*index['shape'][1]
+    if weights is not None:
+        weights = weights[index['block']]
+    counts = np.bincount(index['flat'], weights=weights, minlength=size)
+    return counts.reshape(index['shape'])
+
+
+def record_view(method, values=True):
+    '''
+    Returns a version of the method which records its call with all
+    arguments by view_step of the object before applying it, so
+    the operation can be repeated on maps built from other counts
+    (see replay_cut). Calls with mod_map=False only return an array
+    and are not recorded.
+    values - False for operations which only switch coordinates
+    '''
+    signature = inspect.signature(method)
+
+    @wraps(method)
+    def recorded(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        if bound.arguments.get('mod_map', True) is True:
+            self.view_step(method.__name__,
+                           *list(bound.arguments.values())[1:],
+                           values=values)
+        return method(self, *args, **kwargs)
+    return recorded
+
+
+def replay_cut(batch, values, cut):
+    '''
+    Returns a map_cut object made from delay-energy map values
+    (in the order of batch.delay_energy_map dimensions) after repeating
+    all operations recorded for the map (see create_batch.view_step) and
+    for the slices (see map_cut.view_step) described by the cut dict.
+    '''
+    batch = batch.replay_view(values, cut['view_steps'])
+    cut_obj = map_cut(batch, cut['positions'], cut['deltas'],
+                      cut['axis'], cut['approach'])
+    for name, args in cut['cut_steps']:
+        getattr(cut_obj, name)(*args)
+    return cut_obj
+
+
+def bootstrap_replicas(index, batch, cut, x, step, seed, n_replicas):
+    '''
+    Bootstrap replicas of a map slice fitted with Voigt+constant curves.
+    Macrobunches are drawn with replacement, so every event gets
+    the weight of its macrobunch and a replica map is one weighted
+    np.bincount of the event positions (see create_batch.bootstrap_index).
+    Every replica map goes through the same operations as the visualized
+    map and the slices (see replay_cut) before the first slice is fitted.
+    batch - create_batch object without runs (see map_cut.voigt_bootstrap)
+    '''
+    rng = np.random.default_rng(seed)
+    n_blocks = index['n_blocks']
+    transpose = batch.delay_energy_map.dims[0] != 'Delay'
+    lines = []
+    for i in range(n_replicas):
+        draw = rng.integers(0, n_blocks, n_blocks)
+        counts = replica_counts(index, np.bincount(draw, minlength=n_blocks))
+        if transpose:
+            counts = counts.T
+        lines.append(replay_cut(batch, counts, cut).cuts[0])
+    return voigt_fit_lines(x, np.array(lines), step)
+
+
+class fit_cache:
+    '''
+    LRU cache of fit results keyed by a hash of the fitted curve,
+    the x axis, the model and the initial parameters with their bounds.
+    Entries can be persisted as json files in a directory,
+    so the results survive restarts of the program.
+    '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # entries are shared by the worker threads of job_queue
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def key(x, y, model, params):
+        '''
+        Method returning the hash of the fit input.
+        '''
+        md5 = hashlib.md5()
+        md5.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        md5.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        md5.update(model.name.encode())
+        for name, param in params.items():
+            description = (name, param.value, param.min, param.max,
+                           param.vary, param.expr)
+            md5.update(repr(description).encode())
+        return md5.hexdigest()
+
+    def get(self, key, path=None):
+        '''
+        Method returning a stored entry or None.
+        path - directory checked when the entry is not in memory
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if path is not None:
+            try:
+                with open(path + os.sep + f'{key}.json', 'r') as json_file:
+                    entry = json.load(json_file)
+            except (FileNotFoundError, ValueError):
+                return None
+            self.put(key, entry)
+            return entry
+        return None
+
+    def put(self, key, entry, path=None):
+        '''
+        Method for storing an entry (a json serializable dictionary).
+        path - directory where the entry is saved as well
+        '''
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if path is not None:
+            if os.path.isdir(path) is False:
+                os.makedirs(path)
+            with open(path + os.sep + f'{key}.json', 'w') as json_file:
+                json.dump(entry, json_file)
+
+
+class map_store:
+    '''
+    LRU store of delay-energy maps (create_batch objects) keyed by
+    map_key. The stored objects are not modified, spec_map returns
+    their copies.
+    '''
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # entries are shared by the worker threads of job_queue
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        '''
+        Method returning the stored map or None.
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, batch):
+        '''
+        Method for storing a map; the least recently used maps are
+        dropped above maxsize.
+        '''
+        with self.lock:
+            self.entries[key] = batch
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Method for dropping all stored maps.
+        '''
+        with self.lock:
+            self.entries.clear()
+
+
+# Fit results shared by all map_cut objects
+fit_results = fit_cache()
+# Delay-energy maps of the GUI and job_queue (see spec_map)
+map_results = map_store(maxsize=8)
+
+
+class map_display:
+    '''
+    The object for showing a delay-energy map image aggregated to
+    the pixel grid of the axes (see block_reduce), which keeps rendering
+    of fine maps fast. The full resolution image is kept, so after
+    zooming only the visible window is aggregated again.
+    method is 'mean', 'max' or 'off' (no aggregation).
+    '''
+
+    def __init__(self, image_data, extent, method='mean'):
+        self.image_data = image_data
+        self.extent = extent
+        self.method = method
+        self.im = None
+        self.busy = False
+
+    @staticmethod
+    def index_range(lim, start, end, n):
+        '''
+        Method returning the range of n pixels spanning from start
+        to end which covers the interval lim.
+        '''
+        if lim is None or start == end:
+            return 0, n
+        i = np.sort((np.array(lim) - start)/(end - start)*n)
+        i_0 = int(np.clip(np.floor(i[0]), 0, n))
+        i_1 = int(np.clip(np.ceil(i[1]), 0, n))
+        if i_1 <= i_0:
+            return 0, n
+        return i_0, i_1
+
+    @staticmethod
+    def edge(start, end, i, n):
+        '''
+        Method returning the position of the i-th pixel edge.
+        '''
+        if i == 0:
+            return start
+        if i == n:
+            return end
+        return start + i/n*(end - start)
+
+    def window(self, xlim=None, ylim=None):
+        '''
+        Method returning the part of the full resolution image
+        within xlim and ylim and its extent.
+        '''
+        x_start, x_end, y_start, y_end = self.extent
+        n_y, n_x = self.image_data.shape
+        c_0, c_1 = self.index_range(xlim, x_start, x_end, n_x)
+        # origin='upper': the first row is shown at y_end
+        r_0, r_1 = self.index_range(ylim, y_end, y_start, n_y)
+        extent = [self.edge(x_start, x_end, c_0, n_x),
+                  self.edge(x_start, x_end, c_1, n_x),
+                  self.edge(y_end, y_start, r_1, n_y),
+                  self.edge(y_end, y_start, r_0, n_y)]
+        return self.image_data[r_0:r_1, c_0:c_1], extent
+
+    def reduce(self, axs, xlim=None, ylim=None):
+        '''
+        Method returning the image within xlim and ylim aggregated
+        to the pixel size of axs and its extent.
+        The extent is reduced to the rows and columns kept by block_reduce.
+        '''
+        image_data, extent = self.window(xlim, ylim)
+        if self.method in ['mean', 'max']:
+            n_y, n_x = image_data.shape
+            factors = [n_y//max(int(axs.bbox.height), 1),
+                       n_x//max(int(axs.bbox.width), 1)]
+            image_data = block_reduce(image_data, factors, self.method)
+            x_start, x_end, y_start, y_end = extent
+            n_x_kept = image_data.shape[1]*max(factors[1], 1)
+            n_y_kept = image_data.shape[0]*max(factors[0], 1)
+            # origin='upper': the cropped rows are at y_start
+            extent = [x_start, self.edge(x_start, x_end, n_x_kept, n_x),
+                      self.edge(y_end, y_start, n_y_kept, n_y), y_end]
+        return image_data, extent
+
+    def connect(self, im):
+        '''
+        Method for aggregating the image of im again whenever
+        the limits of its axes change (e.g., zoom).
+        '''
+        self.im = im
+        im.display = self
+        self.callbacks = []
+        self.set_method(self.method)
+
+    def set_method(self, method):
+        '''
+        Method for changing the aggregation method. The callbacks on
+        the axes limits are connected only if the image is aggregated,
+        the full resolution image does not depend on the zoom.
+        '''
+        self.method = method
+        callbacks = self.im.axes.callbacks
+        if method not in ['mean', 'max']:
+            for i in self.callbacks:
+                callbacks.disconnect(i)
+            self.callbacks = []
+        elif len(self.callbacks) == 0:
+            self.callbacks = [callbacks.connect('xlim_changed', self.zoom),
+                              callbacks.connect('ylim_changed', self.zoom)]
+
+    def zoom(self, axs):
+        '''
+        Method showing the visible window of the full resolution image
+        (the whole image without aggregation).
+        '''
+        if self.busy:
+            return
+        self.busy = True
+        try:
+            if self.method in ['mean', 'max']:
+                image_data, extent = self.reduce(axs, axs.get_xlim(),
+                                                 axs.get_ylim())
+            else:
+                image_data, extent = self.image_data, self.extent
+            self.im.set_data(image_data)
+            self.im.set_extent(extent)
+        finally:
+            self.busy = False
+
+
+class coord_index:
+    '''
+    The object for storing positional indexes of delay-energy map
+    coordinates. It allows resolving value limits with np.searchsorted
+    instead of xarray label-based selection.
+    '''
+    coord_names = {'Delay': ['Delay stage values', 'Delay relative t0'],
+                   'Energy': ['Kinetic energy', 'Binding energy']}
+
+    def __init__(self, arr=None):
+        '''
+        arr - delay-energy map (xarray) which coordinates are indexed
+        '''
+        self.values = {}
+        self.direction = {}
+        if arr is None:
+            return
+        for dim, names in self.coord_names.items():
+            for name in names:
+                try:
+                    values = np.asarray(arr.coords[name].values)
+                except KeyError:
+                    continue
+                self.add(name, values)
+
+    def add(self, name, values):
+        '''
+        Method for registering a coordinate.
+        direction is 1 for ascending, -1 for descending and
+        0 for non-monotonic coordinates.
+        '''
+        self.values[name] = values
+        step = np.diff(values)
+        if np.all(step >= 0):
+            self.direction[name] = 1
+        elif np.all(step <= 0):
+            self.direction[name] = -1
+        else:
+            self.direction[name] = 0
+
+    def positions(self, name, min_val, max_val):
+        '''
+        Method for conversion of value limits to positions.
+        Returns a slice for monotonic coordinates (zero-copy selection)
+        and an array of positions otherwise.
+        '''
+        values = self.values[name]
+        length = values.shape[0]
+        if self.direction[name] == 1:
+            start = np.searchsorted(values, min_val, side='left')
+            stop = np.searchsorted(values, max_val, side='right')
+            return slice(int(start), int(max(start, stop)))
+        elif self.direction[name] == -1:
+            values = values[::-1]
+            start = np.searchsorted(values, min_val, side='left')
+            stop = np.searchsorted(values, max_val, side='right')
+            stop = max(start, stop)
+            return slice(int(length - stop), int(length - start))
+        else:
+            return np.nonzero((values >= min_val) & (values <= max_val))[0]
+
+    def windows(self, name, min_vals, max_vals):
+        '''
+        Vectorized version of positions for arrays of value limits.
+        Returns arrays of start and stop positions or None
+        for non-monotonic coordinates.
+        '''
+        values = self.values[name]
+        length = values.shape[0]
+        if self.direction[name] == 1:
+            start = np.searchsorted(values, min_vals, side='left')
+            stop = np.searchsorted(values, max_vals, side='right')
+            return start, np.maximum(start, stop)
+        elif self.direction[name] == -1:
+            values = values[::-1]
+            start = np.searchsorted(values, min_vals, side='left')
+            stop = np.searchsorted(values, max_vals, side='right')
+            stop = np.maximum(start, stop)
+            return length - stop, length - start
+        else:
+            return None
+
+    def sub(self, dim, selection):
+        '''
+        Method for creating the index of a sub-array
+        without scanning the coordinates again.
+        '''
+        new_index = coord_index()
+        for name, values in self.values.items():
+            new_index.values[name] = values
+            new_index.direction[name] = self.direction[name]
+            if name in self.coord_names[dim]:
+                new_index.values[name] = values[selection]
+                if not isinstance(selection, slice):
+                    new_index.add(name, values[selection])
+        return new_index
+
+
 class create_batch:
     '''
     The object for storing data of combined runs.
     '''
 
-    def __init__(self, file_dir, run_list, DLD='DLD4Q'):
+    def __init__(self, file_dir, run_list, DLD='DLD4Q', progress=None):
         '''
         This initialization happens on 'Upload runs'.
+        progress - a function called after every uploaded run as
+            progress(batch, done, total)
+        the summary (short_info, full_info) is already updated then.
         '''
         self.file_dir = file_dir
         self.batch_dir, self.batch_list = [], []
-        for run_number in run_list:
-            file_name = f'{run_number}' + os.sep + f'{run_number}_energy.mat'
-            file_full = file_dir + os.sep + file_name
-            self.batch_list.append(read_file(file_full, DLD=DLD))
-            self.batch_dir.append(file_full)
+        for counter, run_number in enumerate(run_list):
+            self.add_run(run_number, DLD=DLD)
+            if progress is not None:
+                progress(self, counter + 1, len(run_list))
+
+    def add_run(self, run_number, DLD='DLD4Q'):
+        '''
+        Method for reading one more run into the batch.
+        The summary and the checks are updated with update_info.
+        '''
+        file_name = f'{run_number}' + os.sep + f'{run_number}_energy.mat'
+        file_full = self.file_dir + os.sep + file_name
+        self.batch_list.append(read_file(file_full, DLD=DLD))
+        self.batch_dir.append(file_full)
+        self.update_info()
 
+    def update_info(self):
+        '''
+        Method for updating the summary (short_info, full_info),
+        the static/region/mono checks and the static cut list
+        for the runs in the batch.
+        '''
         full_info = []
         for i in self.batch_list:
             full_info.append(i.info)
@@ -156,6 +1249,7 @@ class create_batch:
                 static_cut = np.mean(self.batch_list[counter].DLD_delay)
                 static_cut_list.append(static_cut)
         self.static_cut_list = static_cut_list
+        self.clear_caches()
         short_info = [title, run_num, is_static_s, KE_s, mono_s]
         self.short_info = '\n'.join(short_info) + '\n\n'
 
@@ -169,6 +1263,7 @@ class create_batch:
         self.delay_energy_map.coords['Delay relative t0'] = t0_coord
         self.delay_energy_map.coords['Delay'] = t0_coord
         self.delay_energy_map.attrs['Time axis'] = 'Delay relative t0'
+        self.map_index_cache = None
 
     def create_map(self):
         '''
@@ -181,7 +1276,8 @@ class create_batch:
         attrs = self.batch_list[0].delay_energy_map.attrs
         for counter, i in enumerate(self.batch_list):
             if counter == 0:
-                total_map = i.delay_energy_map
+                dtype = np.result_type(i.delay_energy_map.dtype, np.int64)
+                total_map = i.delay_energy_map.astype(dtype)
             else:
                 total_map = total_map + i.delay_energy_map
         total_map.attrs = attrs
@@ -217,23 +1313,184 @@ class create_batch:
         self.delay_energy_map = self.delay_energy_map.where(self.delay_energy_map.coords['Kinetic energy'].notnull(), drop=True)
         if np.median(np.gradient(self.delay_energy_map.coords['Binding energy'].values)) > 0:
             self.delay_energy_map=self.delay_energy_map.isel(Energy=slice(None, None, -1))
+        values = counts_array(self.delay_energy_map.values)
+        self.delay_energy_map = self.delay_energy_map.copy(data=values)
         self.delay_energy_map_plot = self.delay_energy_map
+        self.map_index_cache = None
 
-    def create_dif_map(self):
+    def map_copy(self):
         '''
-        This method generates a difference map by averaging data before
-        -0.25 ps and subtracting it from the delay-energy map.
+        Returns a copy of the batch with copies of all runs, so bunch
+        filtering and map creation can be done in the background while
+        the original batch stays untouched and usable.
+        Event arrays are shared, since they are replaced, not modified.
+        The delay-energy map is copied, since the visualization methods
+        change its coordinates in place.
         '''
-        attrs = self.delay_energy_map_plot.attrs
-        t_axis_step = self.delay_energy_map_plot.coords['Delay'].values
-        try:
-            t_axis_step = abs(np.median(np.gradient(t_axis_step)))
-        except ValueError:
-            t_axis_step = 1
-        t_axis_step = int(-2.5*t_axis_step)
-        norm = self.delay_energy_map_plot.loc[t_axis_step:].mean('Delay')
-        self.delay_energy_map_dif = self.delay_energy_map_plot - norm
-        self.delay_energy_map_dif.attrs = attrs
+        batch = copy.copy(self)
+        batch.batch_list = [copy.copy(i) for i in self.batch_list]
+        batch.static_cut_list = list(self.static_cut_list)
+        if hasattr(self, 'delay_energy_map'):
+            batch.delay_energy_map = self.delay_energy_map.copy()
+            if self.delay_energy_map_plot is self.delay_energy_map:
+                batch.delay_energy_map_plot = batch.delay_energy_map
+            else:
+                batch.delay_energy_map_plot = self.delay_energy_map_plot.copy()
+            if getattr(self, 'dif_base', None) is self.delay_energy_map:
+                batch.dif_base = batch.delay_energy_map
+            batch.dif_map = None
+            batch.clear_caches()
+        return batch
+
+    def clear_caches(self):
+        '''
+        Method for dropping all results cached for the current maps.
+        '''
+        self.map_index_cache = None
+        self.prefix_cache = None
+        self.bootstrap_cache = None
+        self.background_cache = None
+        self.ref_cache = None
+        self.clim_cache = None
+
+    def view_step(self, name, *args, values=True):
+        '''
+        Method for recording an operation applied to the visualized map
+        (method name and arguments), so it can be repeated on maps built
+        from other counts (see replay_view).
+        The record starts again when the visualized map is reset to
+        delay_energy_map. Coordinate switches (values=False) made on
+        delay_energy_map itself are kept in its coordinates anyway.
+        '''
+        if self.delay_energy_map_plot is self.delay_energy_map:
+            self.view_steps = ()
+            if values is False:
+                return
+        self.view_steps = getattr(self, 'view_steps', ()) + ((name, args),)
+
+    def replay_view(self, values, view_steps):
+        '''
+        Returns a copy of the batch where delay_energy_map holds other
+        values (e.g. a bootstrap replica of counts) with the recorded
+        operations (see view_step) applied to it in the same order.
+        '''
+        batch = copy.copy(self)
+        batch.batch_list = []
+        batch.delay_energy_map = self.delay_energy_map.copy(data=values)
+        batch.delay_energy_map_plot = batch.delay_energy_map
+        batch.view_steps = ()
+        batch.dif_map = None
+        batch.clear_caches()
+        for name, args in view_steps:
+            getattr(batch, name)(*args)
+        return batch
+
+    def create_maps(self, energy_step=0.05, delay_step=0.1, ordinate='delay',
+                    save=True, B_filters=(), BE=False, progress=None,
+                    cancel=None):
+        '''
+        Bunch filtering and creation of delay-energy maps of all runs
+        followed by summation (create_map) in one call.
+        B_filters - a list of (B_range, B_type) pairs for Bunch_filter
+        BE - switches the maps of the runs to 'Binding energy'
+        progress - a function called after every run as
+            progress(done, total, run_num, events, elapsed)
+        cancel - an object with is_set() (e.g. threading.Event),
+        checked before every run
+        Returns False if the calculation was cancelled, otherwise True.
+        '''
+        for B_range, B_type in B_filters:
+            for i in self.batch_list:
+                i.Bunch_filter(B_range, B_type=B_type)
+        start = timer()
+        events = 0
+        total = len(self.batch_list)
+        for counter, i in enumerate(self.batch_list):
+            if cancel is not None and cancel.is_set():
+                return False
+            i.create_map(energy_step, delay_step, ordinate=ordinate,
+                         save=save)
+            if BE:
+                i.set_BE()
+            events += len(i.DLD_energy)
+            if progress is not None:
+                progress(counter + 1, total, i.run_num, events,
+                         timer() - start)
+        if cancel is not None and cancel.is_set():
+            return False
+        self.create_map()
+        return True
+
+    def create_dif_map(self, ref_window=None):
+        '''
+        This method generates a difference map by averaging data within
+        the reference window and subtracting it from the delay-energy map.
+        ref_window - a list with limits of the reference region in
+        the units of the time axis; None or 'auto' takes data
+        before -0.25 ps.
+        The reference spectrum is cached per map and window, the difference
+        map itself is calculated on first access of delay_energy_map_dif
+        and kept until the map, its axes or the reference spectrum change.
+        '''
+        base = self.delay_energy_map_plot
+        ref = self.reference_spectrum(ref_window)
+        dif_map = getattr(self, 'dif_map', None)
+        axes = ('Energy axis', 'Time axis')
+        if dif_map is None:
+            self.dif_map = None
+        elif self.dif_base is not base or self.dif_ref is not ref:
+            self.dif_map = None
+        elif any(dif_map.attrs[i] != base.attrs[i] for i in axes):
+            self.dif_map = None
+        self.dif_base = base
+        self.dif_ref = ref
+
+    def reference_spectrum(self, ref_window=None):
+        '''
+        Method returning the averaged energy dispersive curve within
+        the reference window of the visualized delay-energy map.
+        Results are cached per map and reference window.
+        '''
+        arr = self.delay_energy_map_plot
+        name = arr.attrs['Time axis']
+        index = self.map_index()
+        if ref_window is None or ref_window == 'auto':
+            t_axis_step = arr.coords['Delay'].values
+            try:
+                t_axis_step = abs(np.median(np.gradient(t_axis_step)))
+            except ValueError:
+                t_axis_step = 1
+            t_axis_step = int(-2.5*t_axis_step)
+            if index.direction[name] == -1:
+                ref_window = [-np.inf, t_axis_step]
+            else:
+                ref_window = [t_axis_step, np.inf]
+        key = (name, float(np.min(ref_window)), float(np.max(ref_window)))
+
+        if self.ref_cache is None or self.ref_cache['index'] is not index:
+            self.ref_cache = {'index': index}
+        if key not in self.ref_cache:
+            selection = index.positions(name, key[1], key[2])
+            values = arr.values[selection]
+            counts = np.sum(~np.isnan(values), axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ref = np.nansum(values, axis=0, dtype=np.float64)/counts
+            self.ref_cache[key] = ref.astype(float_dtype(arr.values))
+        return self.ref_cache[key]
+
+    @property
+    def delay_energy_map_dif(self):
+        '''
+        Difference map calculated on first access by broadcasting
+        the cached reference spectrum over the map.
+        '''
+        if self.dif_map is None:
+            arr = self.dif_base
+            values = np.subtract(arr.values, self.dif_ref,
+                                 dtype=float_dtype(arr.values),
+                                 casting='unsafe')
+            self.dif_map = arr.copy(data=values)
+        return self.dif_map
 
     def set_BE(self):
         '''
@@ -287,22 +1544,221 @@ class create_batch:
         mod_map - if True, changes the array used for visualization
         returns a new array after cutting out undesired regions
         '''
+        selection = self.ROI_slice(limits, axis)
+        if axis == 'Time axis':
+            dim = 'Delay'
+        else:
+            dim = 'Energy'
+        new_a = self.delay_energy_map_plot.isel({dim: selection})
+        if mod_map is True:
+            new_index = self.map_index().sub(dim, selection)
+            self.delay_energy_map_plot = new_a
+            self.map_index_cache = [new_a, new_index]
+        else:
+            return new_a
+
+    def ROI_slice(self, limits, axis):
+        '''
+        Method for conversion of ROI limits to positions along
+        the 'Delay' (axis='Time axis') or 'Energy' (axis='Energy axis')
+        dimension of the visualized delay-energy map.
+        Returns a slice, so selections are views of the map data.
+        '''
         min_val = np.min(limits)
         max_val = np.max(limits)
+        name = self.delay_energy_map_plot.attrs[axis]
+        return self.map_index().positions(name, min_val, max_val)
+
+    def ROI_windows(self, positions, deltas, axis):
+        '''
+        Method for conversion of many ROIs given by their central positions
+        and widths to a list of selections (see ROI_slice) in one step.
+        '''
+        positions = np.asarray(positions, dtype=np.float64)
+        deltas = np.asarray(deltas, dtype=np.float64)
+        limit_1 = positions - deltas/2
+        limit_2 = positions + deltas/2
+        min_vals = np.minimum(limit_1, limit_2)
+        max_vals = np.maximum(limit_1, limit_2)
+        name = self.delay_energy_map_plot.attrs[axis]
+        windows = self.map_index().windows(name, min_vals, max_vals)
+        if windows is None:
+            return [self.ROI_slice(limits, axis)
+                    for limits in zip(min_vals, max_vals)]
+        return [slice(int(a), int(b)) for a, b in zip(*windows)]
+
+    def sweep(self, step=None, delta=None, axis='Time axis',
+              approach='mean'):
+        '''
+        Method for slicing the whole visualized map along one axis with
+        a constant step. It returns a map_cut object holding all the lines
+        which can be used for fitting, plotting and export (see to_xarray).
+        step - distance between cut positions; the coordinate step
+        of the map is used by default (every line of the map)
+        delta - cut width; equals to step by default
+        axis - 'Time axis' or 'Energy axis' of the delay-energy map
+        approach - 'mean' or 'sum' of individual lines within a slice
+        '''
+        arr = self.delay_energy_map_plot
         if axis == 'Time axis':
-            if self.delay_energy_map_plot.attrs[axis] == 'Delay stage values':
-                new_a = self.delay_energy_map_plot.loc[min_val:max_val]
+            coord = arr.coords['Delay'].values
+        else:
+            coord = arr.coords['Energy'].values
+        if step is None:
+            step = np.abs(np.diff(coord)).min() if coord.shape[0] > 1 else 1
+        if delta is None:
+            delta = step
+        start = np.nanmin(coord)
+        stop = np.nanmax(coord)
+        length = int(np.floor((stop - start)/step + 1e-9)) + 1
+        positions = start + np.arange(length)*step
+        decimals = max(0, int(np.ceil(-np.log10(step))) + 2)
+        positions = np.around(positions, decimals)
+        return map_cut(self, positions.tolist(), [delta], axis, approach)
+
+    def prefix_sums(self, dim):
+        '''
+        Method returning cumulative-sum tables of the visualized map
+        along dim ('Delay' or 'Energy') with a leading line of zeros.
+        The second table counts valid values and is None if the map
+        contains no NaN. The tables are built once per map and dimension.
+        '''
+        arr = self.delay_energy_map_plot
+        if self.prefix_cache is None or self.prefix_cache['map'] is not arr:
+            self.prefix_cache = {'map': arr}
+        if dim not in self.prefix_cache:
+            axis = arr.get_axis_num(dim)
+            values = arr.values
+            pad = [(0, 0)]*values.ndim
+            pad[axis] = (1, 0)
+            counts = None
+            if np.issubdtype(values.dtype, np.floating):
+                valid = ~np.isnan(values)
+                if not valid.all():
+                    values = np.where(valid, values, 0)
+                    counts = np.cumsum(valid, axis=axis, dtype=np.int64)
+                    counts = np.pad(counts, pad)
+            table = np.pad(np.cumsum(values, axis=axis, dtype=np.float64), pad)
+            self.prefix_cache[dim] = (table, counts)
+        return self.prefix_cache[dim]
+
+    def line_sums(self, selections, axis='Time axis', approach='mean'):
+        '''
+        Method for reducing the visualized map within a list of selections
+        (results of ROI_slice) in one vectorized step.
+        Every slice costs two lookups in the prefix_sums tables and
+        a subtraction per output point.
+        axis - 'Time axis' reduces delay lines, 'Energy axis' reduces
+        energy columns
+        approach - 'mean' or 'sum' of individual lines within a selection
+        Returns a 2D array with one line per selection.
+        '''
+        if axis == 'Time axis':
+            dim = 'Delay'
+        else:
+            dim = 'Energy'
+        arr = self.delay_energy_map_plot
+        axis_n = arr.get_axis_num(dim)
+        if not all(isinstance(i, slice) for i in selections):
+            # Non-monotonic coordinates, the selections are position arrays
+            values = np.moveaxis(arr.values, axis_n, 0)
+            if approach == 'sum':
+                lines = [np.nansum(values[i], axis=0) for i in selections]
             else:
-                new_a = self.delay_energy_map_plot.loc[max_val:min_val]
-        if axis == 'Energy axis':
-            if self.delay_energy_map_plot.attrs[axis] == 'Kinetic energy':
-                new_a = self.delay_energy_map_plot.loc[:, min_val:max_val]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    lines = [np.nansum(values[i], axis=0) /
+                             np.sum(~np.isnan(values[i]), axis=0)
+                             for i in selections]
+            return np.array(lines, dtype=np.float64).reshape(
+                len(selections), -1)
+
+        table, counts = self.prefix_sums(dim)
+        start = np.array([i.start for i in selections], dtype=int)
+        stop = np.array([i.stop for i in selections], dtype=int)
+        table = np.moveaxis(table, axis_n, 0)
+        lines = table[stop] - table[start]
+        if approach != 'sum':
+            if counts is None:
+                number = (stop - start)[:, None]
             else:
-                new_a = self.delay_energy_map_plot.loc[:, max_val:min_val]
-        if mod_map is True:
-            self.delay_energy_map_plot = new_a
+                counts = np.moveaxis(counts, axis_n, 0)
+                number = counts[stop] - counts[start]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lines = lines / number
+        return lines
+
+    def map_index(self):
+        '''
+        Method returning the coordinate index of the visualized
+        delay-energy map. The index is built once per map.
+        '''
+        arr = self.delay_energy_map_plot
+        if self.map_index_cache is None or self.map_index_cache[0] is not arr:
+            self.map_index_cache = [arr, coord_index(arr)]
+        return self.map_index_cache[1]
+
+    def bootstrap_index(self):
+        '''
+        Method returning the positions of all events of the batch on
+        the delay-energy map (flat indexes of the map cells)
+        and the macrobunch (B_ID) each event belongs to.
+        Events outside of the map are skipped.
+        It is calculated once per map and allows rebinning of resampled
+        events with a single np.bincount (see replica_counts).
+        '''
+        arr = self.delay_energy_map
+        if self.bootstrap_cache is not None:
+            if self.bootstrap_cache['map'] is arr:
+                return self.bootstrap_cache['index']
+
+        def lookup(coord, values):
+            order = np.argsort(coord)
+            coord = coord[order]
+            pos = np.clip(np.searchsorted(coord, values), 0,
+                          coord.shape[0] - 1)
+            found = np.abs(coord[pos] - values) < 1e-6
+            return np.where(found, order[pos], -1)
+
+        arr = arr.transpose('Delay', 'Energy')
+        delay = arr.coords['Delay stage values'].values
+        energy = arr.coords['Kinetic energy'].values
+        flat, block = [], []
+        n_blocks = 0
+        for i in self.batch_list:
+            delay_r, energy_r = i.event_coords()
+            delay_pos = lookup(delay, delay_r)
+            energy_pos = lookup(energy, energy_r)
+            valid = (delay_pos >= 0) & (energy_pos >= 0)
+            flat.append(delay_pos[valid]*energy.shape[0] + energy_pos[valid])
+            B_ID, B_pos = np.unique(i.B_ID[valid], return_inverse=True)
+            block.append(B_pos.ravel() + n_blocks)
+            n_blocks += B_ID.shape[0]
+        index = {'flat': np.concatenate(flat), 'block': np.concatenate(block),
+                 'n_blocks': n_blocks, 'shape': arr.shape}
+        self.bootstrap_cache = {'map': self.delay_energy_map,
+                                'index': index}
+        return index
+
+    def color_limits(self, image_data, mode='minmax', percentiles=(0.5, 99.5)):
+        '''
+        Method returning color scale limits of the visualized map.
+        mode - 'minmax' or 'percentile' (robust limits given by
+        the percentiles list). Both kinds of limits are calculated once
+        per map, so switching between the modes costs nothing.
+        '''
+        arr = self.delay_energy_map_plot
+        low, high = percentiles
+        if self.clim_cache is None or self.clim_cache['map'] is not arr:
+            self.clim_cache = {'map': arr}
+        key = ('percentile', low, high)
+        if key not in self.clim_cache:
+            self.clim_cache['minmax'] = (float(np.nanmin(image_data)),
+                                         float(np.nanmax(image_data)))
+            self.clim_cache[key] = robust_limits(image_data, low, high)
+        if mode == 'percentile':
+            return self.clim_cache[key]
         else:
-            return new_a
+            return self.clim_cache['minmax']
 
     def norm_total_e(self):
         '''
@@ -312,13 +1768,10 @@ class create_batch:
         energy domain.
         '''
         arr = self.delay_energy_map_plot
-        attrs = self.delay_energy_map_plot.attrs
-
-        norm = arr.sum('Energy', skipna=True)
-        new_arr = arr/norm * norm.mean('Delay')
+        axis = arr.get_axis_num('Energy')
+        new_arr = arr.copy(data=norm_total_e_array(arr.values, axis=axis))
 
         self.delay_energy_map_plot = new_arr
-        self.delay_energy_map_plot.attrs = attrs
         self.delay_energy_map_plot.attrs['Normalized'] = True
 
     def norm_01(self):
@@ -326,17 +1779,9 @@ class create_batch:
         Method for normalization of delay-energy map to zero to one intensity.
         '''
         arr = self.delay_energy_map_plot
-        attrs = self.delay_energy_map_plot.attrs
-
-        norm = arr.min('Energy', skipna=True)
-        norm = norm.min('Delay', skipna=True)
-        new_arr = arr - norm
-        norm = new_arr.max('Energy', skipna=True)
-        norm = norm.max('Delay', skipna=True)
-        new_arr = new_arr/norm
+        new_arr = arr.copy(data=norm_01_array(arr.values))
 
         self.delay_energy_map_plot = new_arr
-        self.delay_energy_map_plot.attrs = attrs
         self.delay_energy_map_plot.attrs['Normalized'] = True
 
     def norm_11(self):
@@ -347,21 +1792,111 @@ class create_batch:
         It suits well for the difference plot.
         '''
         arr = self.delay_energy_map_plot
-        attrs = self.delay_energy_map_plot.attrs
-
-        pos_norm = arr.max('Energy', skipna=True)
-        pos_norm = pos_norm.max('Delay', skipna=True)
-        neg_norm = arr.min('Energy', skipna=True)
-        neg_norm = neg_norm.min('Delay', skipna=True)
-        norm = xr.concat((pos_norm, neg_norm), dim='New')
-        norm = np.abs(norm)
-        norm = norm.max('New', skipna=True)
-        new_arr = arr/norm
+        new_arr = arr.copy(data=norm_11_array(arr.values))
 
         self.delay_energy_map_plot = new_arr
-        self.delay_energy_map_plot.attrs = attrs
         self.delay_energy_map_plot.attrs['Normalized'] = True
 
+    def background(self, model='shirley'):
+        '''
+        Method returning the background of all energy dispersive curves
+        of the delay-energy map (see background_array).
+        The result is cached per map and model.
+        '''
+        arr = self.delay_energy_map
+        cache = self.background_cache
+        if cache is None or cache['map'] is not arr:
+            self.background_cache = {'map': arr}
+        if model not in self.background_cache:
+            energy = arr.coords['Kinetic energy'].values
+            axis_n = arr.get_axis_num('Energy')
+            background = background_array(arr.values, energy, model, axis_n)
+            self.background_cache[model] = background
+        return self.background_cache[model]
+
+    def subtract_background(self, model='shirley'):
+        '''
+        Method for switching visualization to the delay-energy map with
+        subtracted 'shirley', 'linear' or 'constant' background.
+        It should be applied first, when delay_energy_map_plot is equal
+        to delay_energy_map.
+        '''
+        arr = self.delay_energy_map
+        background = self.background(model)
+        values = np.subtract(arr.values, background,
+                             dtype=float_dtype(arr.values), casting='unsafe')
+        self.delay_energy_map_plot = arr.copy(data=values)
+        self.delay_energy_map_plot.attrs['Background'] = model
+
+    def savgol_smooth(self, window_length=3, polyorder=1, cycles=1,
+                      axis='Energy axis'):
+        '''
+        Method which applies Savitzky–Golay filter to the visualized
+        delay-energy map along 'Energy axis' or 'Time axis'.
+        All cycles are applied as one convolution.
+        '''
+        arr = self.delay_energy_map_plot
+        if axis == 'Time axis':
+            axis_n = arr.get_axis_num('Delay')
+        else:
+            axis_n = arr.get_axis_num('Energy')
+        values = savgol_array(arr.values, window_length, polyorder, cycles,
+                              axis=axis_n)
+        self.delay_energy_map_plot = arr.copy(data=values)
+
+    def derivative(self, axis='Time axis'):
+        '''
+        Method which converts the visualized delay-energy map to the absolute
+        value of its derivative along 'Time axis' or 'Energy axis'.
+        '''
+        arr = self.delay_energy_map_plot
+        if axis == 'Time axis':
+            axis_n = arr.get_axis_num('Delay')
+        else:
+            axis_n = arr.get_axis_num('Energy')
+        values = arr.values.astype(float_dtype(arr.values), copy=False)
+        values = np.abs(np.gradient(values, axis=axis_n))
+        self.delay_energy_map_plot = arr.copy(data=values)
+        self.delay_energy_map_plot.attrs['Normalized'] = True
+
+    def global_fit(self, max_iter=200):
+        '''
+        Method for fitting all energy lines (one per delay) of the visualized
+        delay-energy map at once with Voigt + constant curves.
+        sigma and gamma are shared by all lines, while center, amplitude
+        and background are fitted for every delay (see global_voigt_fit).
+        Returns an xarray Dataset with the per-delay parameters, their
+        stderr and the fitted map; global parameters are stored in attrs.
+        '''
+        arr = self.delay_energy_map_plot.transpose('Delay', 'Energy')
+        x = arr.coords['Energy'].values
+        result = global_voigt_fit(x, arr.values, max_iter)
+        table = {'Center': result['center'],
+                 'Center stderr': result['center_std'],
+                 'Amplitude': result['amplitude'],
+                 'Amplitude stderr': result['amplitude_std'],
+                 'Background': result['background'],
+                 'Background stderr': result['background_std']}
+        table = {i: ('Delay', j) for i, j in table.items()}
+        table['Fit'] = arr.copy(data=result['fit'])
+        table = xr.Dataset(table)
+        table.attrs = {'Model': 'Voigt + constant',
+                       'Sigma': result['sigma'],
+                       'Sigma stderr': result['sigma_std'],
+                       'Gamma': result['gamma'],
+                       'Gamma stderr': result['gamma_std'],
+                       'FWHM': result['fwhm'],
+                       'FWHM stderr': result['fwhm_std'],
+                       'Reduced chi-square': result['redchi'],
+                       'Iterations': result['iterations'],
+                       'Converged': str(result['success']),
+                       'Fit message': result['message'],
+                       'Energy axis': arr.attrs['Energy axis'],
+                       'Time axis': arr.attrs['Time axis'],
+                       'Run numbers': str(self.run_num_o)}
+        self.global_fit_table = table
+        return table
+
     def t0_cut(self, position='Main', hv=2.407, axis='Energy axis'):
         '''
         Method for simplification of finding the position of the most
@@ -404,18 +1939,8 @@ class create_batch:
         '''
         arr = self.delay_energy_map_plot
         length = arr.shape[0]
-        ts = calendar.timegm(gmtime())
-        date_time = datetime.fromtimestamp(ts)
-        str_date_time = date_time.strftime("%d.%m.%Y_%H-%M-%S")
-        path = self.file_dir + os.sep + 'ASCII_output'
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
-        path = path + os.sep + 'Maps'
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
-        path = path + os.sep + str_date_time + os.sep
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
+        path = output_folder(self.file_dir + os.sep + 'ASCII_output'
+                             + os.sep + 'Maps')
         with open(path+"Summary.txt", "w") as text_file:
             text_file.write(f'Loaded runs: {self.run_num_o}\n')
             text_file.write(f'Energy step: {self.energy_step} eV\n')
@@ -469,20 +1994,196 @@ class create_batch:
             np.savetxt(file_full, out, delimiter='    ')
             print(f"Saved as {file_full}")
 
+    def map_view(self):
+        '''
+        Method returning the image, extent, color limits and
+        the delay tick labels (for a varied delay step) used for
+        the delay-energy map visualization.
+        '''
+        image_data = self.delay_energy_map_plot.values
+        image_data_y = self.delay_energy_map_plot.coords['Delay'].values
+        image_data_x = self.delay_energy_map_plot.coords['Energy'].values
+        if image_data.shape[0] == 1:
+            image_data = np.pad(image_data, [(1, 1), (0, 0)],
+                                mode='constant')
+            image_data_y = [image_data_y[0]-1,
+                            image_data_y[0],
+                            image_data_y[0]+1]
+            image_data_y = np.array(image_data_y)
+        self.varied_y_step = False
+        y_labels = None
+        if image_data_y.shape[0] > 1:
+            if np.around(np.std(np.gradient(image_data_y)), 3) > 0:
+                self.varied_y_step = True
+                image_data_y = np.arange(image_data_y.shape[0])
+                self.image_data_y = image_data_y
+                if self.delay_energy_map_plot.attrs['Time axis'] == 'Delay relative t0':
+                    pos_list = np.linspace(np.min(image_data_y),
+                                           np.max(image_data_y),
+                                           config.map_n_ticks_y,
+                                           dtype=int)
+                else:
+                    pos_list = np.linspace(np.max(image_data_y),
+                                           np.min(image_data_y),
+                                           config.map_n_ticks_y,
+                                           dtype=int)
+                label_list = self.delay_energy_map_plot.coords['Delay']
+                label_list = label_list[pos_list].values
+                y_labels = (pos_list, label_list)
+        mode = config.get('map_scale_mode', 'minmax')
+        percentiles = config.get('map_percentiles', [0.5, 99.5])
+        vmin, vmax = self.color_limits(image_data, mode, percentiles)
+        self.map_z_max = vmax
+        self.map_z_min = vmin
+        self.map_z_tick = (self.map_z_max - self.map_z_min)/config.map_n_ticks_z
+        if self.map_z_tick < 1:
+            self.map_z_tick_decimal = 1
+        else:
+            self.map_z_tick_decimal = 0
+        self.map_z_tick = round(self.map_z_tick, self.map_z_tick_decimal)
+        if self.map_z_tick == 0:
+            self.map_z_tick = 1
+
+        self.map_y_max = np.nanmax(image_data_y)
+        self.map_y_min = np.nanmin(image_data_y)
+        self.map_y_tick = (self.map_y_max - self.map_y_min)/config.map_n_ticks_y
+        if self.map_y_tick < 1:
+            self.map_y_tick_decimal = 1
+        else:
+            self.map_y_tick_decimal = 0
+        self.map_y_tick = round(self.map_y_tick, self.map_y_tick_decimal)
+        if self.map_y_tick == 0:
+            self.map_y_tick = 1
+
+        self.map_x_max = np.nanmax(image_data_x)
+        self.map_x_min = np.nanmin(image_data_x)
+        self.map_x_tick = (self.map_x_max - self.map_x_min)/config.map_n_ticks_x
+        self.map_x_tick = math.ceil(self.map_x_tick)
+        if self.map_x_tick == 0:
+            self.map_x_tick = 1
+
+        if self.delay_energy_map_plot.attrs['Energy axis'] == 'Kinetic energy':
+            x_start = np.min(image_data_x)
+            x_end = np.max(image_data_x)
+        else:
+            x_start = np.max(image_data_x)
+            x_end = np.min(image_data_x)
+
+        if self.delay_energy_map_plot.attrs['Time axis'] == 'Delay stage values':
+            y_start = np.max(image_data_y)
+            y_end = np.min(image_data_y)
+        elif self.varied_y_step is True:
+            y_start = np.max(image_data_y)
+            y_end = np.min(image_data_y)
+        else:
+            y_start = np.min(image_data_y)
+            y_end = np.max(image_data_y)
+            
+        extent = [x_start, x_end,
+                  y_start, y_end]
+
+        vmax = vmax*config.map_scale
+        self.map_z_tick = self.map_z_tick*config.map_scale
+        if vmin < 0:
+            vmin = vmin*config.map_scale
+        return image_data, extent, vmin, vmax, y_labels
+
+    def map_labels(self, axs, cax1):
+        '''
+        Method for setting the title and axis labels of
+        the delay-energy map and its colorbar.
+        '''
+        if self.delay_energy_map_plot.attrs['Normalized'] is True:
+            cax1.set_ylabel('Intensity (arb. units)', rotation=270,
+                            labelpad=30,
+                            fontsize=config.font_size_axis*0.8)
+        else:
+            cax1.set_ylabel('Intensity (counts)', rotation=270,
+                            labelpad=30,
+                            fontsize=config.font_size_axis*0.8)
+
+        run_list_s = self.run_num.split(', ')
+        run_list = [int(i) for i in run_list_s]
+        run_list.sort()
+        if len(run_list) == 1:
+            run_string = f'Run {run_list[0]}'
+        elif len(run_list) > 4:
+            run_string = f'Runs {np.min(run_list)}-{np.max(run_list)}'
+        else:
+            run_list_s = [str(i) for i in run_list_s]
+            run_string = ', '.join(run_list_s)
+            run_string = 'Runs ' + run_string
+        axs.set_title(run_string, pad=15,
+                      fontsize=config.font_size_axis*1.2,
+                      fontweight="light")
+        if self.delay_energy_map_plot.attrs['Energy axis'] == 'Binding energy':
+            axs.set_xlabel('Binding energy (eV)', labelpad=5,
+                           fontsize=config.font_size_axis)
+        else:
+            axs.set_xlabel('Kinetic energy (eV)', labelpad=5,
+                           fontsize=config.font_size_axis)
+
+        if self.ordinate == 'delay':
+            axs.set_ylabel('Delay (ps)', labelpad=10,
+                           fontsize=config.font_size_axis*0.8)
+        elif self.ordinate == 'MB_ID':
+            axs.set_ylabel('MicroBunch ID (units)', labelpad=10,
+                           fontsize=config.font_size_axis*0.8)
+
+    def t0_position(self):
+        '''
+        Method returning the position of the t0 line on the delay axis
+        of the delay-energy map visualization.
+        '''
+        position = 0
+        if self.varied_y_step is True:
+            coord = self.delay_energy_map_plot.coords['Delay']
+            position = coord.sel(Delay=position, method="nearest")
+            position = coord.where(coord == position, drop=True)
+            position = position['Delay index'].values
+        return position
+
+    def map_ticks(self, axs, cax1, y_labels=None):
+        '''
+        Method for setting the ticks and limits of the delay-energy map
+        axes and its colorbar.
+        '''
+        # y axis
+        if self.varied_y_step is True:
+            decimals = read_file.decimal_n(self.map_y_tick)
+            label_list = [round(i, decimals) for i in y_labels[1]]
+            axs.set_yticks(y_labels[0], label_list)
+        else:
+            axs.yaxis.set_major_locator(ticker.MultipleLocator(self.map_y_tick))
+            axs.yaxis.set_minor_locator(ticker.MultipleLocator(self.map_y_tick /
+                                                        config.map_n_ticks_minor))
+        # x axis
+        axs.xaxis.set_major_locator(ticker.MultipleLocator(self.map_x_tick))
+        axs.xaxis.set_minor_locator(ticker.MultipleLocator(self.map_x_tick /
+                                                    config.map_n_ticks_minor))
+        axs.tick_params(axis='both', which='major',
+                        length=config.map_tick_length,
+                        width=config.map_tick_length/4)
+        axs.tick_params(axis='both', which='minor',
+                        length=config.map_tick_length/1.5,
+                        width=config.map_tick_length/4)
+        cax1.tick_params(axis='both', which='major',
+                         length=config.map_tick_length,
+                         width=config.map_tick_length/4)
+        cax1.tick_params(axis='both', which='minor',
+                         length=config.map_tick_length/1.5,
+                         width=config.map_tick_length/4)
+        if self.map_y_min == self.map_y_max:
+            axs.set_ylim(self.map_y_min-1, self.map_y_max+1)
+        if self.map_x_min == self.map_x_max:
+            axs.set_xlim(self.map_x_min-1, self.map_x_max+1)
+
     def axs_plot(self, axs):
-        # Loading configs from json file.
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
         '''
         Method for creating matplotlib axes for delay-energy map visualization.
         '''
+        from mpl_toolkits.axes_grid1 import make_axes_locatable
+
         if np.min(self.delay_energy_map_plot.values.shape) == 0:
             if self.delay_energy_map_plot.attrs['Merge successful'] is False:
                 label = ['Merge was not successful. You can:',
@@ -499,88 +2200,10 @@ class create_batch:
                 im1 = axs.imshow(text_phantom(label, 1000))
                 axs.axis('off')
         else:
-            image_data = self.delay_energy_map_plot.values
-            image_data_y = self.delay_energy_map_plot.coords['Delay'].values
-            image_data_x = self.delay_energy_map_plot.coords['Energy'].values
-            if image_data.shape[0] == 1:
-                image_data = np.pad(image_data, [(1, 1), (0, 0)],
-                                    mode='constant')
-                image_data_y = [image_data_y[0]-1,
-                                image_data_y[0],
-                                image_data_y[0]+1]
-                image_data_y = np.array(image_data_y)
-            self.varied_y_step = False
-            if image_data_y.shape[0] > 1:
-                if np.around(np.std(np.gradient(image_data_y)), 3) > 0:
-                    self.varied_y_step = True
-                    image_data_y = np.arange(image_data_y.shape[0])
-                    self.image_data_y = image_data_y
-                    if self.delay_energy_map_plot.attrs['Time axis'] == 'Delay relative t0':
-                        pos_list = np.linspace(np.min(image_data_y),
-                                               np.max(image_data_y),
-                                               config.map_n_ticks_y,
-                                               dtype=int)
-                    else:
-                        pos_list = np.linspace(np.max(image_data_y),
-                                               np.min(image_data_y),
-                                               config.map_n_ticks_y,
-                                               dtype=int)
-                    label_list = self.delay_energy_map_plot.coords['Delay']
-                    label_list = label_list[pos_list].values
-            self.map_z_max = np.nanmax(image_data)
-            self.map_z_min = np.nanmin(image_data)
-            self.map_z_tick = (self.map_z_max - self.map_z_min)/config.map_n_ticks_z
-            if self.map_z_tick < 1:
-                self.map_z_tick_decimal = 1
-            else:
-                self.map_z_tick_decimal = 0
-            self.map_z_tick = round(self.map_z_tick, self.map_z_tick_decimal)
-            if self.map_z_tick == 0:
-                self.map_z_tick = 1
-
-            self.map_y_max = np.nanmax(image_data_y)
-            self.map_y_min = np.nanmin(image_data_y)
-            self.map_y_tick = (self.map_y_max - self.map_y_min)/config.map_n_ticks_y
-            if self.map_y_tick < 1:
-                self.map_y_tick_decimal = 1
-            else:
-                self.map_y_tick_decimal = 0
-            self.map_y_tick = round(self.map_y_tick, self.map_y_tick_decimal)
-            if self.map_y_tick == 0:
-                self.map_y_tick = 1
-
-            self.map_x_max = np.nanmax(image_data_x)
-            self.map_x_min = np.nanmin(image_data_x)
-            self.map_x_tick = (self.map_x_max - self.map_x_min)/config.map_n_ticks_x
-            self.map_x_tick = math.ceil(self.map_x_tick)
-            if self.map_x_tick == 0:
-                self.map_x_tick = 1
-
-            if self.delay_energy_map_plot.attrs['Energy axis'] == 'Kinetic energy':
-                x_start = np.min(image_data_x)
-                x_end = np.max(image_data_x)
-            else:
-                x_start = np.max(image_data_x)
-                x_end = np.min(image_data_x)
-
-            if self.delay_energy_map_plot.attrs['Time axis'] == 'Delay stage values':
-                y_start = np.max(image_data_y)
-                y_end = np.min(image_data_y)
-            elif self.varied_y_step is True:
-                y_start = np.max(image_data_y)
-                y_end = np.min(image_data_y)
-            else:
-                y_start = np.min(image_data_y)
-                y_end = np.max(image_data_y)
-                
-            extent = [x_start, x_end,
-                      y_start, y_end]
-
-            vmin = np.min(image_data)
-            vmax = np.max(image_data)*config.map_scale
-            self.map_z_tick = self.map_z_tick*config.map_scale
-            if vmin < 0:
-                vmin = vmin*config.map_scale
+            image_data, extent, vmin, vmax, y_labels = self.map_view()
+            display = map_display(image_data, extent,
+                                  config.get('map_display', 'off'))
+            image_data, extent = display.reduce(axs)
 
             TwoSlopeNorm = config.TwoSlopeNorm
             if TwoSlopeNorm < 1 and TwoSlopeNorm > 0:
@@ -596,90 +2219,79 @@ class create_batch:
                                  vmin=vmin,
                                  vmax=vmax,
                                  cmap=config.cmap, aspect='auto')
+            display.connect(im1)
 
             divider1 = make_axes_locatable(axs)
             cax1 = divider1.append_axes("right", size="3.5%", pad=0.09)
             cbar = plt.colorbar(im1, cax=cax1,
-                                ticks=MultipleLocator(self.map_z_tick))
+                                ticks=ticker.MultipleLocator(self.map_z_tick))
             cbar.minorticks_on()
-            if self.delay_energy_map_plot.attrs['Normalized'] is True:
-                cax1.set_ylabel('Intensity (arb. units)', rotation=270,
-                                labelpad=30,
-                                fontsize=config.font_size_axis*0.8)
-            else:
-                cax1.set_ylabel('Intensity (counts)', rotation=270,
-                                labelpad=30,
-                                fontsize=config.font_size_axis*0.8)
-
-            run_list_s = self.run_num.split(', ')
-            run_list = [int(i) for i in run_list_s]
-            run_list.sort()
-            if len(run_list) == 1:
-                run_string = f'Run {run_list[0]}'
-            elif len(run_list) > 4:
-                run_string = f'Runs {np.min(run_list)}-{np.max(run_list)}'
-            else:
-                run_list_s = [str(i) for i in run_list_s]
-                run_string = ', '.join(run_list_s)
-                run_string = 'Runs ' + run_string
-            axs.set_title(run_string, pad=15,
-                          fontsize=config.font_size_axis*1.2,
-                          fontweight="light")
-            if self.delay_energy_map_plot.attrs['Energy axis'] == 'Binding energy':
-                axs.set_xlabel('Binding energy (eV)', labelpad=5,
-                               fontsize=config.font_size_axis)
-            else:
-                axs.set_xlabel('Kinetic energy (eV)', labelpad=5,
-                               fontsize=config.font_size_axis)
-
-            if self.ordinate == 'delay':
-                axs.set_ylabel('Delay (ps)', labelpad=10,
-                               fontsize=config.font_size_axis*0.8)
-            elif self.ordinate == 'MB_ID':
-                axs.set_ylabel('MicroBunch ID (units)', labelpad=10,
-                               fontsize=config.font_size_axis*0.8)
+            self.map_labels(axs, cax1)
 
             if self.delay_energy_map_plot.attrs['Time axis'] == 'Delay relative t0':
-                position = 0
-                if self.varied_y_step is True:
-                    coord = self.delay_energy_map_plot.coords['Delay']
-                    position = coord.sel(Delay=position, method="nearest")
-                    position = coord.where(coord == position, drop=True)
-                    position = position['Delay index'].values
+                position = self.t0_position()
                 axs.axhline(y=position, color=config.color_t0_line,
                             linewidth=config.line_width_t0_line,
                             alpha=config.line_op_t0_line/100,
-                            linestyle=config.line_type_t0_line)
+                            linestyle=config.line_type_t0_line,
+                            gid='t0 line')
 
-            # y axis
-            if self.varied_y_step is True:
-                decimals = read_file.decimal_n(self.map_y_tick)
-                label_list = [round(i, decimals) for i in label_list]
-                axs.set_yticks(pos_list, label_list)
-            else:
-                axs.yaxis.set_major_locator(MultipleLocator(self.map_y_tick))
-                axs.yaxis.set_minor_locator(MultipleLocator(self.map_y_tick /
-                                                            config.map_n_ticks_minor))
-            # x axis
-            axs.xaxis.set_major_locator(MultipleLocator(self.map_x_tick))
-            axs.xaxis.set_minor_locator(MultipleLocator(self.map_x_tick /
-                                                        config.map_n_ticks_minor))
-            axs.tick_params(axis='both', which='major',
-                            length=config.map_tick_length,
-                            width=config.map_tick_length/4)
-            axs.tick_params(axis='both', which='minor',
-                            length=config.map_tick_length/1.5,
-                            width=config.map_tick_length/4)
-            cax1.tick_params(axis='both', which='major',
-                             length=config.map_tick_length,
-                             width=config.map_tick_length/4)
-            cax1.tick_params(axis='both', which='minor',
-                             length=config.map_tick_length/1.5,
-                             width=config.map_tick_length/4)
-            if self.map_y_min == self.map_y_max:
-                axs.set_ylim(self.map_y_min-1, self.map_y_max+1)
-            if self.map_x_min == self.map_x_max:
-                axs.set_xlim(self.map_x_min-1, self.map_x_max+1)
+            self.map_ticks(axs, cax1, y_labels)
+
+    def axs_update(self, axs):
+        '''
+        Method for updating the delay-energy map on axes created by axs_plot
+        in place (see live_plot). Ticks and limits are changed
+        only when the shape or the extent of the map changes,
+        otherwise the current zoom is kept.
+        '''
+        if np.min(self.delay_energy_map_plot.values.shape) == 0:
+            return
+        image_data, extent, vmin, vmax, y_labels = self.map_view()
+        im1 = axs.images[0]
+        cax1 = im1.colorbar.ax
+        display = im1.display
+        relayout = display.image_data.shape != image_data.shape
+        relayout = relayout or tuple(display.extent) != tuple(extent)
+        display.image_data = image_data
+        display.extent = extent
+        display.set_method(config.get('map_display', 'off'))
+        TwoSlopeNorm = config.TwoSlopeNorm
+        if TwoSlopeNorm < 1 and TwoSlopeNorm > 0:
+            im1.set_norm(colors.TwoSlopeNorm(vmin=vmin,
+                                             vcenter=TwoSlopeNorm*vmax,
+                                             vmax=vmax))
+        else:
+            im1.set_clim(vmin, vmax)
+        im1.set_cmap(config.cmap)
+        im1.colorbar.locator = ticker.MultipleLocator(self.map_z_tick)
+        im1.colorbar.minorticks_on()
+        self.map_labels(axs, cax1)
+        for line in axs.lines:
+            if line.get_gid() == 't0 line':
+                position = self.t0_position()
+                line.set_ydata([position, position])
+        if relayout:
+            display.busy = True
+            im1.set_extent(extent)
+            display.busy = False
+            self.map_ticks(axs, cax1, y_labels)
+        display.zoom(axs)
+
+    def plot_signature(self):
+        '''
+        Method returning the properties of the delay-energy map which
+        define the artists created by axs_plot (see live_plot).
+        '''
+        arr = self.delay_energy_map_plot
+        if np.min(arr.values.shape) == 0:
+            return ('map', 'empty', arr.attrs['Merge successful'])
+        image_data_y = arr.coords['Delay'].values
+        varied_y_step = False
+        if image_data_y.shape[0] > 1:
+            varied_y_step = bool(np.around(np.std(np.gradient(image_data_y)), 3) > 0)
+        TwoSlopeNorm = config.TwoSlopeNorm < 1 and config.TwoSlopeNorm > 0
+        return ('map', arr.attrs['Time axis'], varied_y_step, TwoSlopeNorm)
 
 
 class read_file:
@@ -687,6 +2299,18 @@ class read_file:
     The object for storing data from individual hdf5 files.
     It is used further for creating create_batch objects.
     '''
+    # Methods shared with the create_batch object.
+    map_index = create_batch.map_index
+    color_limits = create_batch.color_limits
+    reference_spectrum = create_batch.reference_spectrum
+    delay_energy_map_dif = create_batch.delay_energy_map_dif
+    view_step = create_batch.view_step
+    map_view = create_batch.map_view
+    map_labels = create_batch.map_labels
+    map_ticks = create_batch.map_ticks
+    t0_position = create_batch.t0_position
+    axs_update = create_batch.axs_update
+    plot_signature = create_batch.plot_signature
 
     def __init__(self, file_full, DLD='DLD4Q'):
         '''
@@ -783,6 +2407,9 @@ class read_file:
         self.B_filter = False
         self.Macro_B_filter = 'All_Macro_B'
         self.Micro_B_filter = 'All_Micro_B'
+        self.map_index_cache = None
+        self.ref_cache = None
+        self.clim_cache = None
 
     def Bunch_filter(self, B_range, B_type='MacroBunch'):
         '''
@@ -860,7 +2487,7 @@ class read_file:
             image_data_x = loaded_map.variables['Kinetic energy'].values
             coords = {"Delay stage values": ("Delay", image_data_y),
                       "Kinetic energy": ("Energy", image_data_x)}
-            delay_energy_map = xr.DataArray(np.array(image_data),
+            delay_energy_map = xr.DataArray(counts_array(image_data),
                                             dims=["Delay", "Energy"],
                                             coords=coords)
             delay_energy_map.name = data_name
@@ -907,17 +2534,7 @@ class read_file:
             '''
             Picking Delay or MB_ID as the ordinate axis.
             '''
-            if ordinate == 'delay':
-                parameter = self.DLD_delay
-            elif ordinate == 'MB_ID':
-                parameter = self.MB_ID
-
-            DLD_delay_r = self.rounding(parameter, delay_step)
-            DLD_energy_r = self.rounding(self.DLD_energy, energy_step)
-            DLD_delay_r = np.around(DLD_delay_r,
-                                    self.decimal_n(delay_step))
-            DLD_energy_r = np.around(DLD_energy_r,
-                                     self.decimal_n(energy_step))
+            DLD_delay_r, DLD_energy_r = self.event_coords()
 
             if config.map_counting == 'classic':
                 '''
@@ -1021,7 +2638,7 @@ class read_file:
 
             coords = {"Delay stage values": ("Delay", image_data_y),
                       "Kinetic energy": ("Energy", image_data_x)}
-            delay_energy_map = xr.DataArray(np.array(image_data),
+            delay_energy_map = xr.DataArray(counts_array(image_data),
                                             dims=["Delay", "Energy"],
                                             coords=coords)
             delay_energy_map.name = 'Run ' + str(self.run_num)
@@ -1064,22 +2681,15 @@ class read_file:
         self.delay_energy_map.coords['Delay relative t0'] = t0_coord
         self.delay_energy_map.coords['Delay'] = t0_coord
         self.delay_energy_map.attrs['Time axis'] = 'Delay relative t0'
+        self.map_index_cache = None
 
-    def create_dif_map(self):
+    def create_dif_map(self, ref_window=None):
         '''
-        This method generates a difference map by averaging data before
-        -0.25 ps and subtracting it from the delay-energy map.
+        This method generates a difference map by averaging data within
+        the reference window and subtracting it from the delay-energy map.
+        Uses the corresponding method from the create_batch object.
         '''
-        attrs = self.delay_energy_map_plot.attrs
-        t_axis_step = self.delay_energy_map_plot.coords['Delay'].values
-        try:
-            t_axis_step = abs(np.median(np.gradient(t_axis_step)))
-        except ValueError:
-            t_axis_step = 1
-        t_axis_step = int(-2.5*t_axis_step)
-        norm = self.delay_energy_map.loc[t_axis_step:].mean('Delay')
-        self.delay_energy_map_dif = self.delay_energy_map_plot - norm
-        self.delay_energy_map_dif.attrs = attrs
+        create_batch.create_dif_map(self, ref_window)
 
     def set_BE(self):
         '''
@@ -1091,22 +2701,30 @@ class read_file:
         self.delay_energy_map.attrs['Energy axis'] = 'Binding energy'
 
     def axs_plot(self, axs):
-        # Loading configs from json file.
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
         '''
         Method for creating matplotlib axes for delay-energy map visualization.
         Uses the corresponding method from the create_batch object.
         '''
         create_batch.axs_plot(self, axs)
 
+    def event_coords(self):
+        '''
+        Method returning delay (or MB_ID) and kinetic energy values of
+        the individual events rounded to the bins of the delay-energy map.
+        '''
+        if self.ordinate == 'delay':
+            parameter = self.DLD_delay
+        elif self.ordinate == 'MB_ID':
+            parameter = self.MB_ID
+
+        DLD_delay_r = self.rounding(parameter, self.delay_step)
+        DLD_energy_r = self.rounding(self.DLD_energy, self.energy_step)
+        DLD_delay_r = np.around(DLD_delay_r,
+                                self.decimal_n(self.delay_step))
+        DLD_energy_r = np.around(DLD_energy_r,
+                                 self.decimal_n(self.energy_step))
+        return DLD_delay_r, DLD_energy_r
+
     @staticmethod
     def rounding(x, y):
         '''
@@ -1155,6 +2773,13 @@ class map_cut:
         self.plot_dif = False
         self.plot_dif = False
         self.delay_energy_map_plot = obj.delay_energy_map_plot
+        self.obj = obj
+        # operations which made the map and the cuts (see replay_cut)
+        if obj.delay_energy_map_plot is obj.delay_energy_map:
+            self.view_steps = ()
+        else:
+            self.view_steps = getattr(obj, 'view_steps', ())
+        self.cut_steps = ()
         try:
             self.varied_y_step = obj.varied_y_step
         except AttributeError:
@@ -1165,51 +2790,34 @@ class map_cut:
             deltas = [deltas]
 
         if len(deltas) < len(positions):  # filling in missing delta values
-            for i in range(len(positions)):
-                try:
-                    deltas[i]
-                except IndexError:
-                    try:
-                        deltas.append(deltas[i-1])
-                    except IndexError:
-                        deltas.append(0.5)
+            if len(deltas) == 0:
+                deltas = [0.5]
+            deltas = deltas + [deltas[-1]]*(len(positions) - len(deltas))
         self.axis = axis
         self.arb_u = False
         self.positions = []
         self.deltas = []
-        self.cuts = []
         self.map_show = []
         self.fit = False
-        for counter, position in enumerate(positions):
-            self.positions.append(position)
-            self.deltas.append(deltas[counter])
-            limit_1 = position - deltas[counter]/2
-            limit_2 = position + deltas[counter]/2
-            limits = [limit_1, limit_2]
-            cut = obj.ROI(limits, axis, mod_map=False)
-            self.e_axis = cut.attrs['Energy axis']
-            self.t_axis = cut.attrs['Time axis']
-            if axis == 'Time axis':
-                self.coords = cut.coords['Energy'].values
-                self.units = cut.attrs['Delay units']
-                if approach == 'sum':
-                    cut = cut.sum('Delay')
-                else:
-                    cut = cut.mean('Delay')
-            else:
-                self.coords = cut.coords['Delay'].values
-                self.units = cut.attrs['Energy units']
-                if approach == 'sum':
-                    cut = cut.sum('Energy')
-                else:
-                    cut = cut.mean('Energy')
-            if cut.isnull().values.all():
-                dummy = np.zeros(self.coords.shape)
-                self.cuts.append(dummy)
-                self.map_show.append(False)
-            else:
-                self.cuts.append(cut.values)
-                self.map_show.append(True)
+        self.approach = approach
+        self.positions = list(positions)
+        self.deltas = list(deltas[:len(positions)])
+        selections = obj.ROI_windows(self.positions, self.deltas, axis)
+        arr = obj.delay_energy_map_plot
+        self.e_axis = arr.attrs['Energy axis']
+        self.t_axis = arr.attrs['Time axis']
+        if axis == 'Time axis':
+            self.coords = arr.coords['Energy'].values
+            self.units = arr.attrs['Delay units']
+        else:
+            self.coords = arr.coords['Delay'].values
+            self.units = arr.attrs['Energy units']
+        # all slices are stored as lines of one 2D array
+        cuts = obj.line_sums(selections, axis, approach)
+        show = ~np.isnan(cuts).all(axis=1)
+        cuts[~show] = 0  # dummy lines for slices outside of the map
+        self.cuts = analysis_array(cuts)
+        self.map_show = show.tolist()
 
         if self.units == 'ps':
             self.units_r = 'eV'
@@ -1229,171 +2837,212 @@ class map_cut:
         Method for fitting of the very first slice with singular Voigt curve.
         It is supposed to be used for finding time zero.
         '''
+        from lmfit.models import VoigtModel, ConstantModel
+
         e_axis_step = np.gradient(self.delay_energy_map_plot.coords['Energy'].values).mean()
-        x = self.coords
-        y = self.cuts[0]
+        # lmfit works with float64 arrays
+        x = np.asarray(self.coords, dtype=np.float64)
+        y = np.asarray(self.cuts[0], dtype=np.float64)
 
         model = VoigtModel() + ConstantModel()
-
-        amplitude_g = np.max(y)/2
-        center_g = x[np.argmax(y)]
-        c_g = np.median(y)
-
-        # create parameters with initial values
-        params = model.make_params(amplitude=amplitude_g, center=center_g,
-                                   sigma=abs(e_axis_step)*2,
-                                   gamma=abs(e_axis_step)*2, c=c_g)
-
-        # maybe place bounds on some parameters
-        params['center'].min = np.min(x)
-        params['center'].max = np.max(x)
-        params['sigma'].min = abs(e_axis_step)
-        params['sigma'].max = abs(e_axis_step)*200
-        params['gamma'].min = abs(e_axis_step)
-        params['gamma'].max = abs(e_axis_step)*200
-        if amplitude_g != 0:
-            params['amplitude'].min = amplitude_g/10
-            params['amplitude'].max = amplitude_g*100
-        if np.min(y) + np.max(y) != 0:
-            params['c'].min = np.min(y)
-            params['c'].max = np.max(y)
-
-        # do the fit, print out report with results
-        result = model.fit(y, params, x=x)
-        print(result.fit_report())
-
-        self.center = np.around(result.params['center'].value, 2)
-        sigma = result.params['sigma'].value
-        gamma = result.params['gamma'].value
-        amplitude = result.params['amplitude'].value
-        c = result.params['amplitude'].value
-        self.fwhm = np.around(result.params['fwhm'].value, 2)
-
-        center_std = result.params['center'].stderr
-        sigma_std = result.params['sigma'].stderr
-        gamma_std = result.params['gamma'].stderr
-        amplitude_std = result.params['amplitude'].stderr
-        c_std = result.params['amplitude'].stderr
-        fwhm_std = result.params['fwhm'].stderr
-
-        self.x_fit = np.arange(x[0], x[-1], np.diff(x)[0]/10)
-        self.y_fit = result.eval(x=self.x_fit)
+        params = voigt_params(model, x, y, e_axis_step)
+
+        # identical fits are taken from the cache
+        key = fit_cache.key(x, y, model, params)
+        path = None
+        if config.get('save_fit', 'off') == 'on':
+            path = self.file_dir + os.sep + 'netCDF_maps'
+            path = path + os.sep + 'fit_cache'
+        entry = fit_results.get(key, path)
+        if entry is None:
+            # do the fit, print out report with results
+            result = model.fit(y, params, x=x)
+            x_fit = np.arange(x[0], x[-1], np.diff(x)[0]/10)
+            entry = {'report': result.fit_report(),
+                     'values': {}, 'stderr': {},
+                     'x_fit': x_fit.tolist(),
+                     'y_fit': result.eval(x=x_fit).tolist()}
+            for name, param in result.params.items():
+                entry['values'][name] = param.value
+                entry['stderr'][name] = param.stderr
+            fit_results.put(key, entry, path)
+        print(entry['report'])
+
+        self.center = np.around(entry['values']['center'], 2)
+        self.fwhm = np.around(entry['values']['fwhm'], 2)
+        self.fit_values = entry['values']
+        self.fit_stderr = entry['stderr']
+
+        self.x_fit = np.array(entry['x_fit'])
+        self.y_fit = np.array(entry['y_fit'])
         self.fit = True
 
+    def voigt_fit_all(self, processes=None):
+        '''
+        Method for fitting of every slice with Voigt+constant curve,
+        e.g. for tracking of peak positions across delays.
+        The slices are split into contiguous chunks fitted in a process
+        pool; within a chunk every fit starts from the previous result.
+        processes - number of worker processes (all CPUs by default)
+        Returns and stores (fit_table) an xarray Dataset with the fit
+        parameters and their stderr for every slice position.
+        '''
+        # lmfit works with float64 arrays
+        x = np.asarray(self.coords, dtype=np.float64)
+        lines = np.asarray(self.cuts, dtype=np.float64)
+        step = np.abs(np.gradient(x)).mean()
+        index = np.nonzero(self.map_show)[0]
+        if processes is None:
+            processes = os.cpu_count() or 1
+        chunks = np.array_split(index, max(1, min(processes, index.shape[0])))
+        chunks = [i for i in chunks if i.shape[0] > 0]
+        if processes == 1 or len(chunks) < 2:
+            results = [voigt_fit_lines(x, lines[i], step) for i in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+                futures = [pool.submit(voigt_fit_lines, x, lines[i], step)
+                           for i in chunks]
+                results = [i.result() for i in futures]
+
+        names = ['Reduced chi-square']
+        for label in fit_names.values():
+            names = names + [label, f'{label} stderr']
+        table = {i: np.full(lines.shape[0], np.nan) for i in names}
+        for chunk, rows in zip(chunks, results):
+            for position, row in zip(chunk, rows):
+                for name in names:
+                    table[name][position] = row[name]
+        table = xr.Dataset({i: ('Position', j) for i, j in table.items()},
+                           coords={'Position': np.array(self.positions),
+                                   'Width': ('Position',
+                                             np.array(self.deltas))})
+        table.attrs = {'Cuts across': self.axis,
+                       'Position units': self.units,
+                       'Fit units': self.units_r,
+                       'Model': 'Voigt + constant',
+                       'Run numbers': str(self.run_num_o)}
+        self.fit_table = table
+        return table
+
+    def voigt_bootstrap(self, n_bootstrap=None, processes=None, seed=None):
+        '''
+        Method for estimation of confidence intervals of the Voigt fit
+        (see voigt_fit) of the very first slice by bootstrap.
+        Macrobunches of the uploaded runs are resampled with replacement,
+        the events are rebinned to the delay-energy map, the operations
+        which made the visualized map and the slices (background,
+        normalization, difference map, smoothing etc.) are repeated and
+        the slice is fitted again for every replica.
+        The replicas are split between processes of a process pool.
+        n_bootstrap - number of replicas (config.n_bootstrap by default)
+        Returns and stores (bootstrap_table) an xarray Dataset with
+        the parameters of all replicas; 95% intervals are in attrs.
+        Raises ValueError if the slices can not be reproduced from
+        the events of the batch (e.g. the map was changed after
+        the slices were made).
+        '''
+        if n_bootstrap is None:
+            n_bootstrap = config.get('n_bootstrap', 200)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, n_bootstrap))
+        index = self.obj.bootstrap_index()
+        # the batch is passed to the workers without the events
+        batch = copy.copy(self.obj)
+        batch.batch_list = []
+        batch.static_cut_list = []
+        batch.dif_map = None
+        batch.clear_caches()
+        cut = {'view_steps': self.view_steps, 'cut_steps': self.cut_steps,
+               'positions': self.positions, 'deltas': self.deltas,
+               'axis': self.axis, 'approach': self.approach}
+        counts = replica_counts(index)
+        if batch.delay_energy_map.dims[0] != 'Delay':
+            counts = counts.T
+        check = replay_cut(batch, batch.delay_energy_map.values, cut).cuts
+        if not np.allclose(counts, batch.delay_energy_map.values):
+            raise ValueError('The delay-energy map does not match the events '
+                             'of the batch, create the map again')
+        if not np.allclose(check, self.cuts, equal_nan=True):
+            raise ValueError('The slices can not be reproduced from '
+                             'the delay-energy map, create them again')
+        e_axis_step = np.gradient(self.delay_energy_map_plot.coords['Energy'].values).mean()
+        x = np.asarray(self.coords, dtype=np.float64)
+
+        seeds = np.random.SeedSequence(seed).spawn(processes)
+        chunks = [len(i) for i in np.array_split(np.arange(n_bootstrap),
+                                                 processes)]
+        args = (index, batch, cut, x, e_axis_step)
+        if processes == 1:
+            rows = bootstrap_replicas(*args, seeds[0], chunks[0])
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [pool.submit(bootstrap_replicas, *args, i, j)
+                           for i, j in zip(seeds, chunks)]
+                rows = [k for i in futures for k in i.result()]
+
+        table = {}
+        for label in ['Center', 'FWHM', 'Amplitude', 'Background']:
+            table[label] = ('Replica', np.array([i[label] for i in rows]))
+        table = xr.Dataset(table)
+        table.attrs = {'Cuts across': self.axis,
+                       'Position': self.positions[0],
+                       'Width': self.deltas[0],
+                       'Replicas': n_bootstrap,
+                       'Resampling': 'Macrobunch (B_ID)',
+                       'Run numbers': str(self.run_num_o)}
+        for label in ['Center', 'FWHM']:
+            values = table[label].values
+            table.attrs[f'{label} std'] = np.nanstd(values)
+            table.attrs[f'{label} 95% interval'] = np.nanpercentile(
+                values, [2.5, 97.5])
+        self.bootstrap_table = table
+        return table
+
     def dif_plot(self):
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
         self.plot_dif = True
         magn = config.t_dif_magn
-        dif_labels = []
-        t_cut_plot = self.cuts
-        counter = 0
-        t_cut_plot_dif = []
-        for i in range(len(t_cut_plot)):
-            if counter == 0:
-                reference = t_cut_plot[i]
-            else:
-                dif_line = [a - b for a, b in zip(t_cut_plot[i], reference)]
-                if magn > 1 or magn < 1:
-                    dif_line = [a*magn for a in dif_line]
-                    dif_labels.append(f'Difference {self.var_n}$_{counter+1}$-{self.var_n}$_1$ x {magn}')
-                else:
-                    dif_labels.append(f'Difference {self.var_n}$_{counter+1}$-{self.var_n}$_1$')
-                t_cut_plot_dif.append(np.array(dif_line))
-            counter += 1
-        self.dif_cuts = t_cut_plot_dif
+        # every cut minus the first one in one broadcast
+        self.dif_cuts = self.cuts[1:] - self.cuts[:1]
+        dif_labels = [f'Difference {self.var_n}$_{i+1}$-{self.var_n}$_1$'
+                      for i in range(1, self.cuts.shape[0])]
+        if magn > 1 or magn < 1:
+            self.dif_cuts *= magn
+            dif_labels = [f'{i} x {magn}' for i in dif_labels]
         self.dif_labels = dif_labels
 
     def waterfall(self):
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
         cut_y_max = np.nanmax(self.cuts)
         cut_y_min = np.nanmin(self.cuts)
         offset = (cut_y_max - cut_y_min)*config.t_wat_offset
-        t_cut_plot = self.cuts
-        for i in range(len(t_cut_plot)-1):
-            t_cut_plot_wf_1 = np.delete(np.array(t_cut_plot), -1, axis=0)
-            t_cut_plot_wf_2 = np.delete(np.array(t_cut_plot), 0, axis=0)
-            t_cut_plot_wf_delta = t_cut_plot_wf_2 - t_cut_plot_wf_1
-            t_cut_plot_wf_delta = np.abs(np.min(t_cut_plot_wf_delta, axis=1))
-            t_cut_plot_wf_delta = list(t_cut_plot_wf_delta)
-            t_cut_plot_wf = []
-            counter = 0
-            for i in t_cut_plot:
-                if counter == 0:
-                    t_cut_plot_wf.append(i)
-                else:
-                    line = [a + t_cut_plot_wf_delta[counter - 1] for a in i]
-                    t_cut_plot_wf.append(line)
-                counter += 1
-            t_cut_plot = t_cut_plot_wf
-
-        t_cut_plot_wf = []
+        # every line is lifted by the deepest drop below the previous one,
+        # so the lifts accumulate from the bottom line upwards
+        lift = np.abs(np.min(np.diff(self.cuts, axis=0), axis=1))
+        lift = np.concatenate([[0], np.cumsum(lift)])
         if offset > 0:
-            counter = 0
-            for i in t_cut_plot:
-                if counter == 0:
-                    t_cut_plot_wf.append(i)
-                else:
-                    line = [a + offset*counter for a in i]
-                    t_cut_plot_wf.append(line)
-                counter += 1
-            t_cut_plot = t_cut_plot_wf
-        self.cuts = list(t_cut_plot)
+            lift = lift + offset*np.arange(self.cuts.shape[0])
+        self.cuts = self.cuts + analysis_array(lift[:, None])
 
     def savgol_smooth(self, window_length=3, polyorder=1, cycles=1):
         '''
         Method which applies Savitzky–Golay filter to all the stored slices.
         '''
-        cuts = []
-        for i in self.cuts:
-            cut = i
-            for j in range(cycles):
-                cut = savgol_filter(cut, window_length, polyorder,
-                                    mode='nearest')
-            cuts.append(cut)
-        self.cuts = cuts
+        self.cuts = savgol_array(self.cuts, window_length, polyorder, cycles,
+                                 axis=1)
 
     def derivative(self, cycles=3):
         '''
         Method which converts curves of slices to their derivatives.
         It can help to find time zero for slices with exponential behavior.
         '''
-        cuts = []
-        for i in self.cuts:
-            cut = i
-            cut = np.abs(np.gradient(cut))
-            cuts.append(cut)
-        self.cuts = cuts
+        self.cuts = np.abs(np.gradient(self.cuts, axis=1))
         self.arb_u = True
 
     def norm_01(self):
         '''
         Method for normalization of slices to zero to one intensity.
         '''
-        cuts = []
-        for i in self.cuts:
-            cut = i
-            norm = np.min(cut)
-            cut = cut - norm
-            norm = np.max(cut)
-            cut = cut/norm
-            cuts.append(cut)
-        self.cuts = cuts
+        self.cuts = norm_01_array(self.cuts, axis=1)
         self.arb_u = True
 
     def norm_11(self):
@@ -1403,37 +3052,26 @@ class map_cut:
         The other limit is scaled accordingly.
         It suits well for the difference plot.
         '''
-        pos_norm = np.max(self.cuts, axis=0)
-        pos_norm = np.max(pos_norm)
-        neg_norm = np.min(self.cuts, axis=0)
-        neg_norm = np.min(neg_norm)
-        norm = [neg_norm, pos_norm]
-        norm = np.max(np.abs(norm))
-        cuts = []
-        for i in self.cuts:
-            cut = i
-            cut = cut/norm
-            cuts.append(cut)
-        self.cuts = cuts
+        self.cuts = norm_11_array(self.cuts)
         self.arb_u = True
 
-    def axs_plot(self, axs):
+    def view_step(self, name, *args, values=True):
         '''
-        Method for creating matplotlib axes for map_cut slices.
+        Method for recording an operation applied to the slices
+        (method name and arguments) for replay_cut.
         '''
-        # Loading configs from json file.
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
-        if self.plot_dif is True:
-            self.cut_y_max = np.nanmax(self.cuts+self.dif_cuts)
-            self.cut_y_min = np.nanmin(self.cuts+self.dif_cuts)
+        self.cut_steps += ((name, args),)
+
+    def cut_ranges(self):
+        '''
+        Method for calculating the axis ranges and tick steps
+        of the map_cut slices visualization.
+        '''
+        if self.plot_dif is True and self.dif_cuts.size > 0:
+            self.cut_y_max = max(np.nanmax(self.cuts),
+                                 np.nanmax(self.dif_cuts))
+            self.cut_y_min = min(np.nanmin(self.cuts),
+                                 np.nanmin(self.dif_cuts))
         else:
             self.cut_y_max = np.nanmax(self.cuts)
             self.cut_y_min = np.nanmin(self.cuts)
@@ -1454,58 +3092,59 @@ class map_cut:
         if self.cut_x_tick == 0:
             self.cut_x_tick = 1
 
-        axs.set_title(f'Cuts across {self.axis}', pad=15,
-                      fontsize=config.font_size_axis*1.2,
-                      fontweight="light")
-
+    def line_labels(self):
+        '''
+        Method returning the legend labels of the slices (or of the slice
+        and its fit) and of the difference plots.
+        '''
         if self.axis == 'Energy axis':
-            axs.set_xlabel('Delay (ps)', labelpad=10,
-                           fontsize=config.font_size_axis)
             var_n = 'E'
         else:
-            axs.set_xlabel(f'{self.e_axis} (eV)', labelpad=10,
-                           fontsize=config.font_size_axis)
             var_n = 'T'
 
+        labels = []
         if self.fit is False:
-            for i, cut in enumerate(self.cuts):
+            n_cuts = len(self.cuts)
+            for i in range(n_cuts):
                 label = f'{var_n}$_{i+1}$ = {self.positions[i]} {self.units}, '
                 label = label + f'd{var_n}$_{i+1}$ = {self.deltas[i]} {self.units}'
-                axs.plot(self.coords, cut, config.line_type_d,
-                         color=color_dict[i],
-                         label=label,
-                         markersize=config.marker_size_d,
-                         linewidth=config.line_width_d,
-                         alpha=config.line_op_d/100)
+                # only the first and last lines of a sweep are labeled
+                if n_cuts > len(color_dict) and 0 < i < n_cuts - 1:
+                    label = '_nolegend_'
+                labels.append(label)
         else:
             label = f'{var_n} = {self.positions[0]} {self.units}, '
             label = label + f'd{var_n} = {self.deltas[0]} {self.units}'
-            axs.plot(self.coords, self.cuts[0], 'o',
-                     markerfacecolor='none',
-                     markeredgewidth=config.line_width_d*2,
-                     color=color_dict[0],
-                     label=label,
-                     markersize=config.marker_size_d*2,
-                     alpha=config.line_op_d/100)
-
+            labels.append(label)
             label = f'Fit: {self.var_n_r} = {self.center} {self.units_r}, '
             label = label + f'FWHM = {self.fwhm} {self.units_r}'
-            axs.plot(self.x_fit, self.y_fit, '-',
-                     color=color_dict[1],
-                     label=label,
-                     linewidth=config.line_width_d*4,
-                     alpha=config.line_op_d/100)
-            self.fit = False
+            labels.append(label)
 
+        dif_labels = []
         if self.plot_dif is True:
-            for i, cut in enumerate(self.dif_cuts):
+            for i in range(len(self.dif_cuts)):
                 label = self.dif_labels[i]
-                axs.plot(self.coords, cut, config.line_type_d,
-                         color=color_dict[i],
-                         label=label,
-                         markersize=config.marker_size_d,
-                         linewidth=config.line_width_d,
-                         alpha=config.line_op_d/100)
+                if len(self.dif_cuts) > len(color_dict):
+                    if 0 < i < len(self.dif_cuts) - 1:
+                        label = '_nolegend_'
+                dif_labels.append(label)
+        return labels, dif_labels
+
+    def cut_layout(self, axs):
+        '''
+        Method for setting the title, labels, ticks and limits
+        of the map_cut slices axes.
+        '''
+        axs.set_title(f'Cuts across {self.axis}', pad=15,
+                      fontsize=config.font_size_axis*1.2,
+                      fontweight="light")
+
+        if self.axis == 'Energy axis':
+            axs.set_xlabel('Delay (ps)', labelpad=10,
+                           fontsize=config.font_size_axis)
+        else:
+            axs.set_xlabel(f'{self.e_axis} (eV)', labelpad=10,
+                           fontsize=config.font_size_axis)
 
         if self.arb_u is True:
             axs.set_ylabel('Intensity (arb. units)', labelpad=10,
@@ -1514,14 +3153,14 @@ class map_cut:
             axs.set_ylabel('Intensity (counts)', labelpad=10,
                            fontsize=config.font_size_axis)
         # y axis
-        axs.yaxis.set_major_locator(MultipleLocator(self.cut_y_tick))
+        axs.yaxis.set_major_locator(ticker.MultipleLocator(self.cut_y_tick))
         axs.set_ylim(self.cut_y_min-self.cut_y_tick/2,
                      self.cut_y_max + self.cut_y_tick)
-        axs.yaxis.set_minor_locator(MultipleLocator(self.cut_y_tick /
+        axs.yaxis.set_minor_locator(ticker.MultipleLocator(self.cut_y_tick /
                                                     config.t_n_ticks_minor))
         # x axis
-        axs.xaxis.set_major_locator(MultipleLocator(self.cut_x_tick))
-        axs.xaxis.set_minor_locator(MultipleLocator(self.cut_x_tick /
+        axs.xaxis.set_major_locator(ticker.MultipleLocator(self.cut_x_tick))
+        axs.xaxis.set_minor_locator(ticker.MultipleLocator(self.cut_x_tick /
                                                     config.t_n_ticks_minor))
         axs.set_xlim(self.cut_x_min, self.cut_x_max)
 
@@ -1540,26 +3179,120 @@ class map_cut:
         if self.e_axis == 'Binding energy' and self.axis == 'Time axis':
             axs.invert_xaxis()
 
+    def axs_plot(self, axs):
+        '''
+        Method for creating matplotlib axes for map_cut slices.
+        '''
+        self.cut_ranges()
+        labels, dif_labels = self.line_labels()
+
+        if self.fit is False:
+            for i, cut in enumerate(self.cuts):
+                axs.plot(self.coords, cut, config.line_type_d,
+                         color=line_color(i),
+                         label=labels[i],
+                         markersize=config.marker_size_d,
+                         linewidth=config.line_width_d,
+                         alpha=config.line_op_d/100)
+        else:
+            axs.plot(self.coords, self.cuts[0], 'o',
+                     markerfacecolor='none',
+                     markeredgewidth=config.line_width_d*2,
+                     color=color_dict[0],
+                     label=labels[0],
+                     markersize=config.marker_size_d*2,
+                     alpha=config.line_op_d/100)
+            axs.plot(self.x_fit, self.y_fit, '-',
+                     color=color_dict[1],
+                     label=labels[1],
+                     linewidth=config.line_width_d*4,
+                     alpha=config.line_op_d/100)
+            self.fit = False
+
+        if self.plot_dif is True:
+            for i, cut in enumerate(self.dif_cuts):
+                axs.plot(self.coords, cut, config.line_type_d,
+                         color=line_color(i),
+                         label=dif_labels[i],
+                         markersize=config.marker_size_d,
+                         linewidth=config.line_width_d,
+                         alpha=config.line_op_d/100)
+
+        self.cut_layout(axs)
+
+    def axs_update(self, axs):
+        '''
+        Method for updating the lines on axes created by axs_plot
+        in place (see live_plot).
+        '''
+        self.cut_ranges()
+        labels, dif_labels = self.line_labels()
+        if self.fit is False:
+            data = [(self.coords, cut) for cut in self.cuts]
+        else:
+            data = [(self.coords, self.cuts[0]), (self.x_fit, self.y_fit)]
+            self.fit = False
+        if self.plot_dif is True:
+            data = data + [(self.coords, cut) for cut in self.dif_cuts]
+        for line, (x, y), label in zip(axs.lines, data, labels + dif_labels):
+            line.set_data(x, y)
+            line.set_label(label)
+        self.cut_layout(axs)
+
+    def plot_signature(self):
+        '''
+        Method returning the properties of the slices which
+        define the artists created by axs_plot (see live_plot).
+        '''
+        if self.fit is True:
+            n_lines = 2
+        else:
+            n_lines = len(self.cuts)
+        n_dif = 0
+        if self.plot_dif is True:
+            n_dif = len(self.dif_cuts)
+        return ('cut', self.axis, self.fit, n_lines, n_dif)
+
+    def to_xarray(self):
+        '''
+        Method returning the stored slices as one 2D xarray
+        with the cut positions and widths as coordinates.
+        '''
+        if self.axis == 'Time axis':
+            dim = 'Energy'
+            name = self.e_axis
+            units = 'eV'
+            pos_name = 'Delay'
+        else:
+            dim = 'Delay'
+            name = self.t_axis
+            units = self.units_r
+            pos_name = 'Energy'
+        cuts = xr.DataArray(self.cuts,
+                            dims=['Position', dim],
+                            coords={'Position': np.array(self.positions),
+                                    'Width': ('Position',
+                                              np.array(self.deltas)),
+                                    dim: self.coords})
+        cuts.attrs = {'Cuts across': self.axis,
+                      'Position axis': pos_name,
+                      'Position units': self.units,
+                      f'{dim} axis': name,
+                      f'{dim} units': units,
+                      'Approach': self.approach,
+                      'Run numbers': str(self.run_num_o)}
+        return cuts
+
     def save_cut_dat(self):
         '''
         Method for saving the delay-energy map cuts from visualization
         to ASCII format.
         One can find the saved result in the 'ASCII_output' folder.
         '''
-        arr = np.array(self.cuts)
+        arr = self.cuts
         length = arr.shape[0]
-        ts = calendar.timegm(gmtime())
-        date_time = datetime.fromtimestamp(ts)
-        str_date_time = date_time.strftime("%d.%m.%Y_%H-%M-%S")
-        path = self.file_dir + os.sep + 'ASCII_output'
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
-        path = path + os.sep + 'Cuts'
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
-        path = path + os.sep + str_date_time + os.sep
-        if os.path.isdir(path) is False:
-            os.mkdir(path)
+        path = output_folder(self.file_dir + os.sep + 'ASCII_output'
+                             + os.sep + 'Cuts')
         with open(path+"Summary.txt", "w") as text_file:
             text_file.write(f'Loaded runs: {self.run_num_o}\n')
             text_file.write(f'Cuts across: {self.axis}\n')
@@ -1617,6 +3350,771 @@ class map_cut:
             print(f"Saved as {file_full}")
 
 
+def t0_fit(file_dir, run_list, DLD='DLD4Q', energy_step=0.05,
+           delay_step=0.1, position='Main', delta=0.5, method='derivative'):
+    '''
+    Automated time zero determination for one group of runs.
+    The delay-energy map is created and sliced across 'Energy axis' at
+    the position given by create_batch.t0_cut ('Main', 'SB', 'SB, hv'
+    or a value), the slice is smoothed and t0 is found either from
+    the Voigt fit of its derivative (method='derivative') or from
+    the error function fit of the slice itself (method='erf').
+    Energies above create_batch.en_threshold are cut off as for
+    the maps of the GUI (see spec_map).
+    A few points at both edges of the slice are not fitted, since
+    smoothing and the gradient are distorted there.
+    Returns a dictionary with t0 (delay stage values) and its stderr.
+    Raises ValueError if t0 is found at the edge of the delay range.
+    '''
+    from lmfit.models import VoigtModel, ConstantModel, StepModel
+
+    batch = create_batch(file_dir, run_list, DLD=DLD)
+    for i in batch.batch_list:
+        i.create_map(energy_step, delay_step, save=config.save_nc)
+    batch.create_map()
+    batch.ROI([0, batch.en_threshold], 'Energy axis')
+    batch.set_Tds()
+    position = batch.t0_cut(position, axis='Energy axis')
+    cut = map_cut(batch, [position], [delta], axis='Energy axis')
+    cut.savgol_smooth()
+    # points affected by the edges of smoothing and of the gradient
+    edge = 3
+    # lmfit works with float64 arrays
+    x = np.asarray(cut.coords, dtype=np.float64)
+    step = np.abs(np.gradient(x)).mean()
+    if method == 'erf':
+        y = np.asarray(cut.cuts[0], dtype=np.float64)
+        order = np.argsort(x)
+        x, y = x[order][edge:-edge], y[order][edge:-edge]
+        model = StepModel(form='erf') + ConstantModel()
+        center_g = x[np.argmax(np.abs(np.gradient(y)))]
+        params = model.make_params(amplitude=y[-1] - y[0], center=center_g,
+                                   sigma=step*2, c=y[0])
+        params['center'].min = np.min(x)
+        params['center'].max = np.max(x)
+        params['sigma'].min = step/10
+        result = model.fit(y, params, x=x)
+        width = result.params['sigma']
+    else:
+        cut.derivative()
+        y = np.asarray(cut.cuts[0], dtype=np.float64)
+        x, y = x[edge:-edge], y[edge:-edge]
+        model = VoigtModel() + ConstantModel()
+        result = model.fit(y, voigt_params(model, x, y, step), x=x)
+        width = result.params['fwhm']
+    center = result.params['center']
+    if min(center.value - np.min(x), np.max(x) - center.value) < step/2:
+        raise ValueError(f't0 = {center.value:.2f} is at the edge of '
+                         f'the fitted delay range {np.min(x):.2f}-'
+                         f'{np.max(x):.2f}')
+    return {'t0': center.value,
+            't0 stderr': np.nan if center.stderr is None else center.stderr,
+            'Width': width.value,
+            'Width stderr': np.nan if width.stderr is None else width.stderr,
+            'Slice position': position}
+
+
+def t0_finder(file_dir, run_groups, DLD='DLD4Q', energy_step=0.05,
+              delay_step=0.1, position='Main', delta=0.5,
+              method='derivative', processes=None):
+    '''
+    Time zero determination (see t0_fit) for a list of run groups,
+    e.g. [[37378, 37379], [37380]], performed in a process pool.
+    Returns an xarray Dataset with t0 values, their uncertainties
+    and the slice positions for every group. The t0 values can be
+    passed to create_batch.time_zero directly.
+    '''
+    run_groups = [i if isinstance(i, list) else [i] for i in run_groups]
+    args = (DLD, energy_step, delay_step, position, delta, method)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(run_groups)))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(t0_fit, file_dir, i, *args)
+                   for i in run_groups]
+        rows = []
+        for group, future in zip(run_groups, futures):
+            try:
+                rows.append(future.result())
+            except Exception as err:
+                print(f'Time zero search failed for runs {group}: {err}')
+                rows.append({})
+    names = ['t0', 't0 stderr', 'Width', 'Width stderr', 'Slice position']
+    table = {i: ('Group', np.array([row.get(i, np.nan) for row in rows]))
+             for i in names}
+    runs = [', '.join([str(j) for j in i]) for i in run_groups]
+    table = xr.Dataset(table, coords={'Runs': ('Group', runs)})
+    table.attrs = {'Method': method, 'Slice': str(position),
+                   'Slice width': delta, 'Energy step': energy_step,
+                   'Delay step': delay_step, 'Units': 'ps'}
+    return table
+
+
+def figure_name(spec, dpi=300, fig_width=7, fig_height=5):
+    '''
+    Returns a file name (without extension) defined by the content of
+    a rendering spec (see render_figure), so the same figure always gets
+    the same name, unlike names based on the time of saving.
+    '''
+    runs = sorted([int(i) for i in spec['runs']])
+    if len(runs) == 1:
+        run_string = f'Run_{runs[0]}'
+    else:
+        run_string = f'Runs_{runs[0]}-{runs[-1]}'
+    key = [runs, spec.get('view', {}), spec.get('cut'),
+           dpi, fig_width, fig_height]
+    key = json.dumps(key, sort_keys=True, default=str)
+    key = hashlib.md5(key.encode()).hexdigest()[:10]
+    return f'Fig_{run_string}_{key}'
+
+
+def apply_view(batch, view):
+    '''
+    Applies the visualization settings of a rendering spec
+    (see render_figure) to a create_batch object in the same order
+    as Section III of the GUI. Keys of view (all optional):
+    'background', 'norm_total_e', 'time_axis', 'energy_axis',
+    'dif_map', 'norm' ('01' or '11'), 'ROI_E' and 'ROI_D'.
+    '''
+    batch.delay_energy_map_plot = batch.delay_energy_map
+    if view.get('background', 'off') != 'off':
+        batch.subtract_background(view['background'])
+    if view.get('norm_total_e', False) is True:
+        batch.norm_total_e()
+    if view.get('time_axis', 'Delay relative t0') == 'Delay relative t0':
+        try:
+            batch.set_T0()
+        except KeyError:
+            pass
+    else:
+        batch.set_Tds()
+    if view.get('energy_axis', 'Kinetic energy') == 'Kinetic energy':
+        batch.set_KE()
+    else:
+        batch.set_BE()
+    if view.get('dif_map', False) is True:
+        batch.create_dif_map(config.get('dif_ref_window', 'auto'))
+        batch.set_dif_map()
+    if view.get('norm') == '01':
+        batch.norm_01()
+    elif view.get('norm') == '11':
+        batch.norm_11()
+    if view.get('ROI_E') is not None:
+        batch.ROI(view['ROI_E'], 'Energy axis')
+    if view.get('ROI_D') is not None:
+        batch.ROI(view['ROI_D'], 'Time axis')
+
+
+def apply_cut(batch, cut):
+    '''
+    Returns the map_cut object described by the cut dictionary of
+    a rendering spec (see render_figure) as in Section IV of the GUI.
+    Keys of cut: 'positions' (a list or a string for
+    create_batch.t0_cut), 'deltas', 'axis', 'norm' ('01' or '11'),
+    'smooth', 'derivative', 'dif_plot', 'waterfall' and 'fit'.
+    '''
+    axis = cut.get('axis', 'Time axis')
+    positions = cut['positions']
+    if isinstance(positions, str):
+        positions = batch.t0_cut(positions, axis=axis)
+    if not isinstance(positions, list):
+        positions = [positions]
+    cut_obj = map_cut(batch, positions, cut.get('deltas', [0.5]), axis)
+    if cut.get('norm') == '01':
+        cut_obj.norm_01()
+    elif cut.get('norm') == '11':
+        cut_obj.norm_11()
+    if cut.get('smooth', False) is True:
+        cut_obj.savgol_smooth()
+    if cut.get('derivative', False) is True:
+        cut_obj.derivative()
+    if cut.get('fit', False) is True:
+        cut_obj.voigt_fit()
+    else:
+        if cut.get('dif_plot', False) is True:
+            cut_obj.dif_plot()
+        if cut.get('waterfall', False) is True:
+            cut_obj.waterfall()
+    return cut_obj
+
+
+# Operations recorded for bootstrap replicas (see record_view)
+for name in ['create_dif_map', 'set_dif_map', 'ROI', 'norm_total_e',
+             'norm_01', 'norm_11', 'subtract_background', 'savgol_smooth',
+             'derivative']:
+    setattr(create_batch, name, record_view(getattr(create_batch, name)))
+for name in ['set_BE', 'set_KE', 'set_T0', 'set_Tds']:
+    setattr(create_batch, name,
+            record_view(getattr(create_batch, name), values=False))
+for name in ['waterfall', 'savgol_smooth', 'derivative', 'norm_01',
+             'norm_11']:
+    setattr(map_cut, name, record_view(getattr(map_cut, name)))
+
+# Keys of the view dictionary of a spec defining the delay-energy map
+map_settings = ('energy_step', 'delay_step', 'ordinate', 'B_filters',
+                'BE', 't0')
+map_locks = {}
+map_locks_lock = threading.Lock()
+
+
+def map_key(file_dir, spec, DLD='DLD4Q'):
+    '''
+    Returns the key of the delay-energy map of a spec (see render_figure)
+    in map_results: the runs with modification times and sizes of their
+    files, the detector, the map settings and the settings of config
+    used by map creation.
+    '''
+    view = spec.get('view', {})
+    runs = sorted([int(i) for i in spec['runs']])
+    stamps = []
+    for run in runs:
+        path = file_dir + os.sep + f'{run}' + os.sep + f'{run}_energy.mat'
+        try:
+            stat = os.stat(path)
+            stamps.append([stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            stamps.append(None)
+    key = [os.path.abspath(file_dir), runs, stamps, DLD]
+    key += [view.get(i) for i in map_settings]
+    key += [config.get('map_counting', 'new'),
+            config.get('precision', 'float64'),
+            config.get('save_nc', 'on')]
+    key = json.dumps(key, default=str)
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def spec_map(file_dir, spec, DLD='DLD4Q', batch=None, progress=None,
+             cancel=None):
+    '''
+    Returns the create_batch object with the delay-energy map of a spec
+    (see render_figure) as 'Calculate delay-energy map' does.
+    Maps are kept in map_results, so the same map is calculated once
+    for the GUI and all jobs (see job_queue); a copy is returned.
+    batch - uploaded runs to use instead of reading them again
+    (the object is modified, pass create_batch.map_copy); runs which
+    were bunch filtered before are read again, so stored maps are always
+    made from all events of the runs
+    progress, cancel - see create_batch.create_maps
+    Returns None if the calculation was cancelled.
+    '''
+    key = map_key(file_dir, spec, DLD)
+    with map_locks_lock:
+        lock = map_locks.setdefault(key, threading.Lock())
+    with lock:
+        cached = map_results.get(key)
+        if cached is not None:
+            return cached.map_copy()
+        view = spec.get('view', {})
+        ordinate = view.get('ordinate', 'delay')
+        delay_step = view.get('delay_step', 0.1)
+        if ordinate == 'MB_ID':
+            delay_step = 1
+        if batch is not None:
+            if any(i.B_filter for i in batch.batch_list):
+                batch = None
+        if batch is None:
+            batch = create_batch(file_dir, spec['runs'], DLD=DLD)
+        done = batch.create_maps(view.get('energy_step', 0.05), delay_step,
+                                 ordinate=ordinate, save=config.save_nc,
+                                 B_filters=view.get('B_filters', ()),
+                                 BE=view.get('BE', False),
+                                 progress=progress, cancel=cancel)
+        if not done:
+            return None
+        if view.get('t0') is not None:
+            batch.create_dif_map()
+            batch.time_zero(view['t0'])
+        batch.ROI([0, batch.en_threshold], 'Energy axis')
+        map_results.put(key, batch)
+        return batch.map_copy()
+
+
+def render_figure(file_dir, spec, DLD='DLD4Q', dpi=300,
+                  fig_width=7, fig_height=5):
+    '''
+    Creates one figure described by a spec dictionary and saves it
+    to the 'fig_output' folder. The figure is made with the current
+    pyplot backend; the workers of render_figures use Agg (render_init),
+    so nothing is shown on screen there.
+    Keys of spec: 'runs' (list of run numbers), 'view' (map settings:
+    'energy_step', 'delay_step', 'ordinate', 'B_filters' (a list of
+    [B_range, B_type] for Bunch_filter), 'BE', 't0' and the keys of
+    apply_view), 'cut' (optional, see apply_cut; 'add_map' and
+    'legend' control the layout) and 'name' (optional file name,
+    see figure_name otherwise).
+    Returns the path of the saved figure.
+    '''
+    view = spec.get('view', {})
+    cut = spec.get('cut')
+    batch = spec_map(file_dir, spec, DLD=DLD)
+    apply_view(batch, view)
+
+    objects = [batch]
+    if cut is not None:
+        cut_obj = apply_cut(batch, cut)
+        if cut.get('add_map', True) is True:
+            objects.append(cut_obj)
+        else:
+            objects = [cut_obj]
+    plot = plot_files(objects, dpi=dpi, fig_width=fig_width,
+                      fig_height=fig_height)
+    if cut is not None:
+        if len(objects) > 1:
+            plot.span_plot(cut_obj)
+        if cut.get('legend', True) is True:
+            plot.legend_plot()
+
+    path = file_dir + os.sep + 'fig_output'
+    if os.path.isdir(path) is False:
+        os.makedirs(path, exist_ok=True)
+    name = spec.get('name')
+    if name is None:
+        name = figure_name(spec, dpi, fig_width, fig_height)
+    path = path + os.sep + name + '.png'
+    plot.fig.tight_layout()
+    plot.fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close(plot.fig)
+    return path
+
+
+def render_init():
+    '''
+    Initializer of the render_figures workers: off-screen rendering
+    with the Agg backend, the backend of the GUI process is untouched.
+    '''
+    plt.switch_backend('Agg')
+
+
+def render_figures(file_dir, specs, DLD='DLD4Q', dpi=300,
+                   fig_width=7, fig_height=5, processes=None):
+    '''
+    Creates the figures for a list of rendering specs (see render_figure)
+    in a process pool, e.g. one figure for every run group of
+    a beamtime, without blocking the GUI process with plotting.
+    Identical specs are rendered once.
+    Returns the paths of the saved figures (None for failed ones).
+    '''
+    args = (DLD, dpi, fig_width, fig_height)
+    names = [i.get('name') or figure_name(i, dpi, fig_width, fig_height)
+             for i in specs]
+    unique = {}
+    for name, spec in zip(names, specs):
+        unique.setdefault(name, dict(spec, name=name))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(unique)))
+    paths = {}
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=render_init) as pool:
+        futures = {name: pool.submit(render_figure, file_dir, spec, *args)
+                   for name, spec in unique.items()}
+        for name, future in futures.items():
+            try:
+                paths[name] = future.result()
+                print(f'Saved as {paths[name]}')
+            except Exception as err:
+                print(f'Figure {name} failed: {err}')
+                paths[name] = None
+    return [paths[i] for i in names]
+
+
+def find_runs(file_dir):
+    '''
+    Returns the sorted run numbers of all runs in file_dir
+    (folders with {run number}_energy.mat files).
+    '''
+    runs = []
+    for name in os.listdir(file_dir):
+        file_full = file_dir + os.sep + name + os.sep + f'{name}_energy.mat'
+        if name.isdigit() and os.path.isfile(file_full):
+            runs.append(int(name))
+    return sorted(runs)
+
+
+def quick_look_path(file_dir, run_number, DLD='DLD4Q'):
+    '''
+    Returns the path (without extension) of the cached quick look
+    of a run in the 'quick_look' folder.
+    '''
+    return file_dir + os.sep + 'quick_look' + os.sep + f'{run_number}_{DLD}'
+
+
+def quick_look_stamp(file_dir, run_number, shape, max_events):
+    '''
+    Returns the values identifying a valid quick look cache:
+    modification time and size of the run file and the thumbnail
+    parameters.
+    '''
+    file_full = file_dir + os.sep + f'{run_number}'
+    file_full = file_full + os.sep + f'{run_number}_energy.mat'
+    stat = os.stat(file_full)
+    return np.array([stat.st_mtime_ns, stat.st_size,
+                     shape[0], shape[1], max_events], dtype=np.int64)
+
+
+# Values of the quick look summary (see quick_look)
+quick_look_names = ['Events', 'Sampled events', 'Static',
+                    'KE min', 'KE max', 'Delay min', 'Delay max']
+
+
+def quick_look_cached(path, stamp):
+    '''
+    Returns the summary of a cached quick look or None if the cache
+    is missing or outdated.
+    '''
+    try:
+        with np.load(path + '.npz') as cached:
+            if np.array_equal(cached['stamp'], stamp) is False:
+                return None
+            if os.path.isfile(path + '.png') is False:
+                return None
+            return {i: cached[i][()] for i in quick_look_names}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def quick_look(file_dir, run_number, DLD='DLD4Q', shape=(64, 128),
+               max_events=200000):
+    '''
+    Creates a coarse delay-energy map (thumbnail) of one run with
+    shape (delay bins, energy bins) from at most max_events events taken
+    with a regular stride. Only the energy and delay datasets are read
+    and the histogram is a single np.bincount call. The thumbnail is
+    saved to the 'quick_look' folder as an npz array and a png image
+    and reused while the run file and the parameters do not change.
+    Returns a dictionary with the summary of the run.
+    '''
+    path = quick_look_path(file_dir, run_number, DLD)
+    stamp = quick_look_stamp(file_dir, run_number, shape, max_events)
+    summary = quick_look_cached(path, stamp)
+    if summary is not None:
+        return summary
+
+    file_full = file_dir + os.sep + f'{run_number}'
+    file_full = file_full + os.sep + f'{run_number}_energy.mat'
+    with h5py.File(file_full, 'r') as f:
+        hdf5_path_read = scan_hdf5(f)
+        hdf5_path = hdf5_path_read[0]
+        for path_i in hdf5_path_read:
+            if DLD in path_i:
+                hdf5_path = path_i
+                break
+        energy = f[f'{hdf5_path}/energy_Grid_ROI']
+        n_events = energy.shape[-1]
+        stride = max(1, int(np.ceil(n_events/max_events)))
+        energy = energy[0, ::stride]
+        is_static = f'{hdf5_path}/delay' not in f
+        if is_static:
+            delay = np.zeros(energy.shape)
+        else:
+            delay = f[f'{hdf5_path}/delay'][0, ::stride]
+
+    finite = np.isfinite(energy) & np.isfinite(delay)
+    energy, delay = energy[finite], delay[finite]
+    image = np.zeros(shape, dtype=np.int64)
+    edges = []
+    for values, n in zip([delay, energy], shape):
+        if values.size == 0:
+            edges.append(np.zeros(n + 1))
+            continue
+        v_min, v_max = np.min(values), np.max(values)
+        edges.append(np.linspace(v_min, v_max, n + 1))
+    if energy.size > 0:
+        index = []
+        for values, n, edge in zip([delay, energy], shape, edges):
+            width = edge[-1] - edge[0]
+            if width == 0:
+                width = 1
+            index.append(np.clip(((values - edge[0])/width*n).astype(int),
+                                 0, n - 1))
+        image = np.bincount(index[0]*shape[1] + index[1],
+                            minlength=shape[0]*shape[1]).reshape(shape)
+
+    summary = {'Events': n_events,
+               'Sampled events': energy.size,
+               'Static': is_static,
+               'KE min': edges[1][0],
+               'KE max': edges[1][-1],
+               'Delay min': edges[0][0],
+               'Delay max': edges[0][-1]}
+    folder = file_dir + os.sep + 'quick_look'
+    if os.path.isdir(folder) is False:
+        os.makedirs(folder, exist_ok=True)
+    plt.imsave(path + '.png', image, origin='lower', cmap=config.cmap)
+    # the npz file is written last and replaced atomically,
+    # so a valid cache always has its png image
+    np.savez_compressed(path + '_tmp.npz', image=image, delay=edges[0],
+                        energy=edges[1], stamp=stamp, **summary)
+    os.replace(path + '_tmp.npz', path + '.npz')
+    return summary
+
+
+def quick_looks(file_dir, runs=None, DLD='DLD4Q', shape=(64, 128),
+                max_events=200000, processes=None, progress=None):
+    '''
+    Creates quick looks (see quick_look) of runs (all runs in file_dir
+    by default) in a process pool. Runs with a valid cache are not
+    processed again, so repeated calls only handle new or changed runs.
+    progress - a function called as progress(run, summary) for every
+    run as soon as its thumbnail is ready (cached runs first)
+    Returns an xarray Dataset with the summary of every run; the
+    thumbnails are available at quick_look_path(...) + '.png'/'.npz'.
+    '''
+    if runs is None:
+        runs = find_runs(file_dir)
+    rows = {}
+    new_runs = []
+    for run in runs:
+        path = quick_look_path(file_dir, run, DLD)
+        stamp = quick_look_stamp(file_dir, run, shape, max_events)
+        summary = quick_look_cached(path, stamp)
+        if summary is None:
+            new_runs.append(run)
+        else:
+            rows[run] = summary
+            if progress is not None:
+                progress(run, summary)
+
+    if len(new_runs) > 0:
+        args = (DLD, shape, max_events)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, len(new_runs)))
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(quick_look, file_dir, i, *args): i
+                       for i in new_runs}
+            for future in as_completed(futures):
+                run = futures[future]
+                try:
+                    rows[run] = future.result()
+                except Exception as err:
+                    print(f'Quick look failed for run {run}: {err}')
+                    rows[run] = {}
+                    continue
+                if progress is not None:
+                    progress(run, rows[run])
+        print(f'Quick looks created: {len(new_runs)}, '
+              f'cached: {len(runs) - len(new_runs)}')
+
+    table = {i: ('Run', np.array([rows[run].get(i, np.nan) for run in runs]))
+             for i in quick_look_names}
+    table = xr.Dataset(table, coords={'Run': np.array(runs)})
+    table.attrs = {'Detector': DLD, 'Delay bins': shape[0],
+                   'Energy bins': shape[1], 'Max events': max_events}
+    return table
+
+
+def run_job(kind, file_dir, spec, DLD='DLD4Q', progress=None, cancel=None):
+    '''
+    Performs one job of job_queue for a spec (see render_figure).
+    kind - 'map' returns the create_batch object with the view applied,
+    'cut' returns the map_cut object of spec['cut'],
+    'fit' is a cut with Voigt fits (the results go to fit_results),
+    'export' saves the map and the cut (if given) in ASCII format
+    and returns the cut or the map.
+    Maps are taken from or stored in map_results (see spec_map).
+    Returns None if the job was cancelled.
+    '''
+    batch = spec_map(file_dir, spec, DLD, progress=progress, cancel=cancel)
+    if batch is None:
+        return None
+    apply_view(batch, spec.get('view', {}))
+    if kind == 'export':
+        batch.save_map_dat()
+    if kind == 'map' or spec.get('cut') is None:
+        return batch
+    cut = dict(spec['cut'])
+    if kind == 'fit':
+        cut['fit'] = True
+    cut_obj = apply_cut(batch, cut)
+    if kind == 'export':
+        cut_obj.save_cut_dat()
+    return cut_obj
+
+
+class queue_job:
+    '''
+    One job of job_queue. status is 'queued', 'running', 'done',
+    'failed' or 'cancelled'; times are given by time.monotonic.
+    '''
+
+    def __init__(self, number, kind, file_dir, spec, DLD='DLD4Q',
+                 priority=0):
+        self.number = number
+        self.kind = kind
+        self.file_dir = file_dir
+        self.spec = spec
+        self.DLD = DLD
+        self.priority = priority
+        self.status = 'queued'
+        self.progress = ''
+        self.result = None
+        self.error = None
+        self.submitted = monotonic()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.finished_event = threading.Event()
+
+    def wait(self, timeout=None):
+        '''
+        Waits until the job is finished, returns its result.
+        '''
+        self.finished_event.wait(timeout)
+        return self.result
+
+    def timings(self):
+        '''
+        Returns the waiting and the running time of the job in seconds.
+        '''
+        now = monotonic()
+        started = self.started or self.finished or now
+        waiting = started - self.submitted
+        if self.started is None:
+            return waiting, 0
+        return waiting, (self.finished or now) - self.started
+
+    def summary(self):
+        '''
+        Returns a one line description of the job for the job list.
+        '''
+        runs = sorted([int(i) for i in self.spec['runs']])
+        if len(runs) == 1:
+            runs = f'Run {runs[0]}'
+        else:
+            runs = f'Runs {runs[0]}-{runs[-1]}'
+        view = self.spec.get('view', {})
+        step = f"{view.get('energy_step', 0.05)} eV"
+        if view.get('ordinate', 'delay') == 'delay':
+            step += f", {view.get('delay_step', 0.1)} ps"
+        waiting, running = self.timings()
+        line = f'#{self.number} {self.kind} (priority {self.priority}): '
+        line += f'{runs}, {self.DLD}, {step} - {self.status}'
+        if self.status == 'running' and self.progress:
+            line += f' {self.progress}'
+        line += f', waiting {waiting:.1f} s'
+        if self.started is not None:
+            line += f', running {running:.1f} s'
+        return line
+
+
+class job_queue:
+    '''
+    Queue of map, cut, fit and export jobs (see run_job) performed by
+    a bounded pool of worker threads, jobs with a higher priority first
+    and in the order of submission otherwise. Threads are used instead
+    of processes, so the results stay in map_results and fit_results
+    of this process and are reused by the GUI.
+    workers - the number of worker threads
+    on_change - a function called with the job after every change
+    of its status (from the thread making the change)
+    '''
+    kinds = ('map', 'cut', 'fit', 'export')
+
+    def __init__(self, workers=2, on_change=None):
+        self.workers = max(1, int(workers))
+        self.on_change = on_change
+        self.jobs = []
+        self.heap = []
+        self.threads = []
+        self.counter = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def submit(self, kind, file_dir, spec, DLD='DLD4Q', priority=0):
+        '''
+        Method for adding a job to the queue, returns the queue_job.
+        '''
+        if kind not in self.kinds:
+            raise ValueError(f'Unknown job kind: {kind}')
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('The job queue is shut down')
+            self.counter += 1
+            job = queue_job(self.counter, kind, file_dir, spec, DLD=DLD,
+                            priority=priority)
+            self.jobs.append(job)
+            heapq.heappush(self.heap, (-priority, job.number, job))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify()
+        self.changed(job)
+        return job
+
+    def cancel(self, job):
+        '''
+        Method for cancelling a job. A running map calculation
+        stops before the next run.
+        '''
+        with self.condition:
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished = monotonic()
+                job.finished_event.set()
+            elif job.status == 'running':
+                job.cancel_event.set()
+        self.changed(job)
+
+    def clear(self):
+        '''
+        Method for removing finished jobs from the job list.
+        '''
+        with self.condition:
+            self.jobs = [i for i in self.jobs
+                         if i.status in ('queued', 'running')]
+
+    def shutdown(self, wait=True):
+        '''
+        Method for stopping the workers after the queued jobs.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def changed(self, job):
+        if self.on_change is not None:
+            self.on_change(job)
+
+    def worker(self):
+        while True:
+            with self.condition:
+                while len(self.heap) == 0 and not self.closed:
+                    self.condition.wait()
+                if len(self.heap) == 0:
+                    return
+                job = heapq.heappop(self.heap)[2]
+                if job.status != 'queued':
+                    continue
+                job.status = 'running'
+                job.started = monotonic()
+            self.changed(job)
+
+            def progress(done, total, run_num, events, elapsed, job=job):
+                job.progress = f'({done}/{total} runs)'
+                self.changed(job)
+
+            try:
+                job.result = run_job(job.kind, job.file_dir, job.spec,
+                                     job.DLD, progress=progress,
+                                     cancel=job.cancel_event)
+                if job.result is None and job.cancel_event.is_set():
+                    job.status = 'cancelled'
+                else:
+                    job.status = 'done'
+            except Exception as err:
+                print(f'Job {job.number} ({job.kind}) failed: {err}')
+                job.error = err
+                job.status = 'failed'
+            job.finished = monotonic()
+            job.finished_event.set()
+            self.changed(job)
+
+
 class plot_files:
     '''
     The class for creating matplotlib plots from a list of objects.
@@ -1624,18 +4122,13 @@ class plot_files:
     '''
 
     def __init__(self, objects, direction='down', dpi=300,
-                 fig_width=7, fig_height=5):
-        # Loading configs from json file.
-        try:
-            with open('config.json', 'r') as json_file:
-                config = json.load(json_file)
-        except FileNotFoundError:
-            with open('packages/config.json', 'r') as json_file:
-                config = json.load(json_file)
-        config = json.dumps(config)
-        config = json.loads(config,
-                            object_hook=lambda d: SimpleNamespace(**d))
+                 fig_width=7, fig_height=5, fig=None):
+        '''
+        If fig is given, the figure is cleared and reused
+        instead of creating a new one.
+        '''
         self.direction = direction
+        self.span_artists = []
 
         if not isinstance(objects, list):
             objects = [objects]
@@ -1645,17 +4138,24 @@ class plot_files:
         except TypeError:
             fig_number = 1
 
-        matplotlib.rcParams.update({'font.size': config.font_size,
-                                    'font.family': config.font_family,
-                                    'axes.linewidth': config.axes_linewidth})
+        # reloads changed settings and applies them to matplotlib
+        config.load()
 
-        fig, axs = plt.subplots(nrows=fig_number, ncols=1, sharex=False,
-                                figsize=(fig_width,
-                                         fig_height*fig_number),
-                                dpi=dpi,
-                                gridspec_kw={'hspace': 0.5*5/fig_height}
-                                )
+        if fig is None:
+            fig, axs = plt.subplots(nrows=fig_number, ncols=1, sharex=False,
+                                    figsize=(fig_width,
+                                             fig_height*fig_number),
+                                    dpi=dpi,
+                                    gridspec_kw={'hspace': 0.5*5/fig_height}
+                                    )
+        else:
+            fig.clf()
+            fig.set_size_inches(fig_width, fig_height*fig_number)
+            fig.set_dpi(dpi)
+            axs = fig.subplots(nrows=fig_number, ncols=1, sharex=False,
+                               gridspec_kw={'hspace': 0.5*5/fig_height})
 
+        self.object_axes = []
         for fig_p, object_i in enumerate(objects):
             fig_p_real = fig_p
             if direction == 'up':
@@ -1663,9 +4163,11 @@ class plot_files:
                 fig_p = -fig_p
 
             if fig_number == 1:
-                object_i.axs_plot(axs)
+                object_axs = axs
             else:
-                object_i.axs_plot(axs[fig_p])
+                object_axs = axs[fig_p]
+            object_i.axs_plot(object_axs)
+            self.object_axes.append(object_axs)
 
         self.axs = axs
         self.fig = fig
@@ -1682,18 +4184,24 @@ class plot_files:
         '''
         for i in self.fig.axes:
             if i.yaxis.get_label()._text.split(' ')[0] != 'Intensity':
+                if len(cut_obj.positions) > len(color_dict):
+                    # a sweep is shown as one region
+                    self.sweep_span_plot(i, cut_obj)
+                    continue
                 for counter, position in enumerate(cut_obj.positions):
                     if cut_obj.map_show[counter]:
                         limit_1 = position - cut_obj.deltas[counter]/2
                         limit_2 = position + cut_obj.deltas[counter]/2
                         if cut_obj.axis == 'Energy axis':
-                            i.axvspan(limit_1, limit_2,
-                                      facecolor=color_dict[counter],
-                                      alpha=0.25)
+                            span = i.axvspan(limit_1, limit_2,
+                                             facecolor=line_color(counter),
+                                             alpha=0.25)
+                            self.span_artists.append(span)
                             for j in [position, limit_1, limit_2]:
-                                i.axvline(x=j, color=color_dict[counter],
-                                          linewidth=2, zorder=10, alpha=0.4,
-                                          linestyle='--')
+                                line = i.axvline(x=j, color=line_color(counter),
+                                                 linewidth=2, zorder=10,
+                                                 alpha=0.4, linestyle='--')
+                                self.span_artists.append(line)
                         else:
                             if self.varied_y_step != 'ND':
                                 if self.varied_y_step is True:
@@ -1707,13 +4215,43 @@ class plot_files:
                                     position = position['Delay index'].values
                                     limit_1 = limit_1['Delay index'].values
                                     limit_2 = limit_2['Delay index'].values
-                            i.axhspan(limit_1, limit_2,
-                                      facecolor=color_dict[counter],
-                                      alpha=0.25)
+                            span = i.axhspan(limit_1, limit_2,
+                                             facecolor=line_color(counter),
+                                             alpha=0.25)
+                            self.span_artists.append(span)
                             for j in [position, limit_1, limit_2]:
-                                i.axhline(y=j, color=color_dict[counter],
-                                          linewidth=2, zorder=10, alpha=0.4,
-                                          linestyle='--')
+                                line = i.axhline(y=j, color=line_color(counter),
+                                                 linewidth=2, zorder=10,
+                                                 alpha=0.4, linestyle='--')
+                                self.span_artists.append(line)
+
+    def sweep_span_plot(self, axs, cut_obj):
+        '''
+        Method which highlights the region covered by a sweep
+        (see create_batch.sweep) instead of every slice.
+        '''
+        positions = np.array(cut_obj.positions)[np.array(cut_obj.map_show)]
+        if positions.shape[0] == 0:
+            return
+        deltas = np.array(cut_obj.deltas)[np.array(cut_obj.map_show)]
+        limit_1 = np.min(positions - deltas/2)
+        limit_2 = np.max(positions + deltas/2)
+        if cut_obj.axis == 'Energy axis':
+            span = axs.axvspan(limit_1, limit_2, facecolor=color_dict[0],
+                               alpha=0.1)
+            self.span_artists.append(span)
+        elif self.varied_y_step is not True:
+            span = axs.axhspan(limit_1, limit_2, facecolor=color_dict[0],
+                               alpha=0.1)
+            self.span_artists.append(span)
+
+    def clear_spans(self):
+        '''
+        Method removing the regions added by span_plot.
+        '''
+        for artist in self.span_artists:
+            artist.remove()
+        self.span_artists = []
 
     def legend_plot(self):
         '''
@@ -1726,19 +4264,56 @@ class plot_files:
                              fontsize=config.font_size-2, markerscale=2)
 
 
+class live_plot(plot_files):
+    '''
+    The class for showing objects in one persistent figure.
+    If the objects passed to plot create the same artists as the ones
+    in the figure (see plot_signature methods), the image data,
+    color limits and lines are updated in place (axs_update methods).
+    Otherwise (or if the figure was closed) the figure is built again.
+    '''
+
+    def __init__(self):
+        self.fig = None
+        self.axs = None
+        self.object_axes = []
+        self.span_artists = []
+        self.signature = None
+
+    def plot(self, objects, direction='down', dpi=300,
+             fig_width=7, fig_height=5):
+        '''
+        Method for showing a list of objects in the figure.
+        Returns the live_plot object, so span_plot and legend_plot
+        can be used as with plot_files.
+        '''
+        if not isinstance(objects, list):
+            objects = [objects]
+
+        config.load()
+        signature = [direction, dpi, fig_width, fig_height, config.stamp]
+        signature = signature + [i.plot_signature() for i in objects]
+        alive = self.fig is not None and plt.fignum_exists(self.fig.number)
+        if alive and signature == self.signature:
+            self.clear_spans()
+            for axs in self.object_axes:
+                if axs.get_legend() is not None:
+                    axs.get_legend().remove()
+            for object_i, axs in zip(objects, self.object_axes):
+                object_i.axs_update(axs)
+        else:
+            if alive is False:
+                self.fig = None
+            plot_files.__init__(self, objects, direction, dpi,
+                                fig_width, fig_height, fig=self.fig)
+            self.signature = signature
+        self.fig.canvas.draw_idle()
+        return self
+
+
 if __name__ == "__main__":
-    # Loading configs from json file.
     dir_path = os.path.dirname(os.path.realpath(__file__))
     os.chdir(dir_path)
-    try:
-        with open('config.json', 'r') as json_file:
-            config = json.load(json_file)
-    except FileNotFoundError:
-        with open('packages/config.json', 'r') as json_file:
-            config = json.load(json_file)
-    config = json.dumps(config)
-    config = json.loads(config,
-                        object_hook=lambda d: SimpleNamespace(**d))
 
     file_dir = 'D:/Data/Extension_2021_final'
     run_numbers = [37378, 37379, 37380, 37381, 37382, 37383]
@@ -1757,14 +4332,3 @@ if __name__ == "__main__":
     # b.set_BE()
     # c = map_cut(b, [101], [0.3], axis='Energy axis')
     plot_files([b])
-else:
-    # Loading configs from json file.
-    try:
-        with open('config.json', 'r') as json_file:
-            config = json.load(json_file)
-    except FileNotFoundError:
-        with open('packages/config.json', 'r') as json_file:
-            config = json.load(json_file)
-    config = json.dumps(config)
-    config = json.loads(config,
-                        object_hook=lambda d: SimpleNamespace(**d))
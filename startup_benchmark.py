@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: measures the import time of the analysis module
+(packages/WESPE_data_OOP.py) and of the GUI (WESPE_data_viewer.py)
+in fresh python processes and lists the heavy modules executed on import.
+It also starts the GUI and measures the time until its window is drawn
+and interactive, which is compared with window_target.
+
+Usage: python startup_benchmark.py [number of repeats]
+"""
+import os
+import sys
+import subprocess
+import numpy as np
+
+entry_points = {'Analysis module': 'packages.WESPE_data_OOP',
+                'GUI': 'WESPE_data_viewer'}
+
+heavy_modules = ['matplotlib', 'matplotlib.pyplot', 'xarray', 'scipy', 'lmfit',
+                 'PIL.Image', 'mpl_toolkits.axes_grid1', 'IPython']
+
+# Time (s) for the GUI window to become interactive
+window_target = 3.0
+
+# modules loaded by lazy_import stay _LazyModule objects until first use
+code = '''
+import sys
+import time
+import importlib.util
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [i for i in {heavy_modules}
+          if i in sys.modules and
+          not isinstance(sys.modules[i], importlib.util._LazyModule)]
+print(elapsed)
+print(', '.join(loaded))
+'''
+
+
+def measure(module, repeats=5):
+    '''
+    Returns import times (s) of module in repeats fresh processes
+    and the heavy modules executed on import.
+    '''
+    env = dict(os.environ, KIVY_NO_ARGS='1', KIVY_NO_CONSOLELOG='1')
+    cwd = os.path.dirname(os.path.realpath(__file__))
+    times = []
+    for i in range(repeats):
+        result = subprocess.run([sys.executable, '-c',
+                                 code.format(module=module,
+                                             heavy_modules=heavy_modules)],
+                                capture_output=True, text=True,
+                                cwd=cwd, env=env)
+        if result.returncode != 0:
+            error = result.stderr.strip().split('\n')[-1]
+            raise RuntimeError(error)
+        output = result.stdout.split('\n')[:-1]
+        times.append(float(output[-2]))
+    return np.array(times), output[-1]
+
+
+def measure_window(repeats=3, timeout=120):
+    '''
+    Returns the times (s) from the start of the GUI to its first frame
+    reported by MainApp.startup_done in repeats launches.
+    '''
+    env = dict(os.environ, KIVY_NO_ARGS='1', WESPE_STARTUP_BENCHMARK='1')
+    cwd = os.path.dirname(os.path.realpath(__file__))
+    times = []
+    for i in range(repeats):
+        result = subprocess.run([sys.executable, 'WESPE_data_viewer.py'],
+                                capture_output=True, text=True,
+                                cwd=cwd, env=env, timeout=timeout)
+        output = [line for line in result.stdout.split('\n')
+                  if line.startswith('Window is ready in')]
+        if len(output) == 0:
+            error = result.stderr.strip().split('\n')[-1]
+            raise RuntimeError(error)
+        times.append(float(output[-1].split()[-2]))
+    return np.array(times)
+
+
+if __name__ == "__main__":
+    repeats = 5
+    if len(sys.argv) > 1:
+        repeats = int(sys.argv[1])
+    for name, module in entry_points.items():
+        try:
+            times, loaded = measure(module, repeats)
+        except RuntimeError as err:
+            print(f'{name} ({module}): import failed - {err}')
+            continue
+        print(f'{name} ({module}): median {np.median(times):.3f} s, '
+              f'min {np.min(times):.3f} s, max {np.max(times):.3f} s '
+              f'({repeats} runs)')
+        if loaded == '':
+            loaded = 'none'
+        print(f'    heavy modules executed on import: {loaded}')
+
+    try:
+        times = measure_window(min(repeats, 3))
+        if np.median(times) <= window_target:
+            result = 'target met'
+        else:
+            result = 'target missed'
+        print(f'GUI window ready: median {np.median(times):.3f} s '
+              f'(target {window_target} s, {result})')
+    except (RuntimeError, subprocess.TimeoutExpired) as err:
+        print(f'GUI window: measurement failed - {err}')
@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+
+import h5py
+import matplotlib
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+matplotlib.use('Agg')
+
+T0 = 1328.2
+
+
+def write_run(file_dir, run, rng, n=200000):
+    '''
+    Writes a synthetic delay scan: a peak at 100 eV shifted by 0.3 eV
+    after time zero (T0) on a flat background.
+    '''
+    os.makedirs(os.path.join(file_dir, str(run)), exist_ok=True)
+    delay = rng.uniform(1325, 1332, n)
+    t = T0 - delay
+    center = 100 + 0.3*(t > 0)*np.exp(-np.clip(t, 0, None)/2)
+    energy = np.where(rng.random(n) < 0.6, rng.normal(center, 0.4),
+                      rng.uniform(95, 105, n))
+    path = os.path.join(file_dir, str(run), f'{run}_energy.mat')
+    with h5py.File(path, 'w') as f:
+        g = f.create_group('DLD4Q')
+        g['energy_Grid_ROI'] = energy[None]
+        g['BAM'] = rng.normal(0, 1, n)[None]
+        g['GMDBDA_Electrons'] = rng.normal(50, 5, n)[None]
+        g['mono'] = np.full(n, 400.0)[None]
+        g['bunchID'] = np.sort(rng.integers(0, 5000, n))[None]
+        g['microbunchID'] = rng.integers(0, 400, n)[None]
+        g['Pulse_Energy_DiodeBB'] = rng.normal(1, .1, n)[None]
+        g['delay'] = delay[None]
+        p = f.create_group('param_backconvert_GUI')
+        p['kinenergie_4Q'] = np.array([[100]])
+        p['passenergie_4Q'] = np.array([[20]])
+
+
+@pytest.fixture(autouse=True)
+def repo_dir(monkeypatch):
+    # config.json is looked up relative to the working directory
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('data'))
+    rng = np.random.default_rng(0)
+    for run in (1001, 1002):
+        write_run(path, run, rng)
+    return path
+
+
+@pytest.fixture
+def batch(data_dir):
+    from packages.WESPE_data_OOP import create_batch
+    batch = create_batch(data_dir, ['1001', '1002'])
+    for i in batch.batch_list:
+        # the 'new' map counting compares float32 events with the energy
+        # grid, so a step exact in float32 keeps every bin populated
+        i.create_map(0.125, 0.1, save='off')
+    batch.create_map()
+    batch.time_zero(T0)
+    batch.set_T0()
+    return batch
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    '''
+    Returns a function writing a config file and returning
+    a config_file object reading it. The file holds default_config.json
+    without the keys in drop and with values on top of it, or only
+    values if defaults is False.
+    '''
+    from packages.WESPE_data_OOP import config_file
+
+    def make(defaults=True, drop=(), **values):
+        settings = {}
+        if defaults:
+            with open(config_file.defaults) as json_file:
+                settings = json.load(json_file)
+        for name in drop:
+            del settings[name]
+        settings.update(values)
+        path = tmp_path / 'config.json'
+        path.write_text(json.dumps(settings))
+        return config_file([str(path)])
+    return make
+
+
+@pytest.fixture
+def use_config(make_config, monkeypatch):
+    '''
+    Returns a function making a config file (see make_config) used
+    as the settings of the analysis module.
+    '''
+    import packages.WESPE_data_OOP as W
+
+    def use(**kwargs):
+        config = make_config(**kwargs)
+        monkeypatch.setattr(W, 'config', config)
+        return config
+    return use
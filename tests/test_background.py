@@ -0,0 +1,45 @@
+import numpy as np
+
+from packages.WESPE_data_OOP import background_array
+
+
+def spectra():
+    energy = np.linspace(95, 105, 120)
+    step = 10/(1 + np.exp((energy - 100)/0.3))
+    peaks = [a*np.exp(-(energy - c)**2/0.5) for a, c in [(40, 100),
+                                                           (25, 99.5)]]
+    return energy, np.array([5 + step + i for i in peaks])
+
+
+def shirley(y, n_avg=3, max_iter=50):
+    '''
+    Iterative Shirley background of one curve (ascending kinetic energy).
+    '''
+    low, high = y[:n_avg].mean(), y[-n_avg:].mean()
+    background = np.full(y.shape, high)
+    for i in range(max_iter):
+        signal = y - background
+        area = np.array([signal[j + 1:].sum() for j in range(y.shape[0])])
+        background = high + (low - high)*area/area[0]
+    return background
+
+
+def test_shirley_matches_iterative_reference():
+    energy, y = spectra()
+    expected = np.array([shirley(i) for i in y])
+    result = background_array(y, energy, 'shirley', tol=1e-12)
+    np.testing.assert_allclose(result, expected, atol=1e-8)
+    # descending energy and the other axis give the same curves
+    result = background_array(y[:, ::-1].T, energy[::-1], 'shirley',
+                              axis=0, tol=1e-12)
+    np.testing.assert_allclose(result.T[:, ::-1], expected, atol=1e-8)
+
+
+def test_linear_background():
+    energy, y = spectra()
+    low = y[:, :3].mean(axis=1)[:, None]
+    high = y[:, -3:].mean(axis=1)[:, None]
+    expected = low + (high - low)*(energy - energy[0])/(energy[-1]
+                                                        - energy[0])
+    result = background_array(y, energy, 'linear')
+    np.testing.assert_allclose(result, expected, atol=1e-12)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from packages.WESPE_data_OOP import map_cut
+
+
+def derived_cut(batch):
+    batch.subtract_background('shirley')
+    batch.norm_total_e()
+    cut = map_cut(batch, [1.0, 2.0], [1.0], 'Time axis')
+    cut.savgol_smooth(5, 2)
+    cut.norm_01()
+    return cut
+
+
+def test_bootstrap_mean_matches_fit_on_derived_cut(batch):
+    cut = derived_cut(batch)
+    cut.voigt_fit()
+    table = cut.voigt_bootstrap(n_bootstrap=24, processes=2, seed=1)
+    center = table['Center'].values
+    amplitude = table['Amplitude'].values
+    assert np.abs(np.nanmean(center) - cut.fit_values['center']) < 0.02
+    # replicas of a map normalized to 0-1 keep the amplitude of the fit,
+    # raw counts would give an amplitude larger by orders of magnitude
+    assert np.isclose(np.nanmean(amplitude), cut.fit_values['amplitude'],
+                      rtol=0.05)
+    assert np.nanstd(center) > 0
+
+
+def test_bootstrap_rejects_changed_cuts(batch):
+    cut = derived_cut(batch)
+    cut.cuts = cut.cuts*2
+    with pytest.raises(ValueError):
+        cut.voigt_bootstrap(n_bootstrap=2, processes=1)
+
+
+def test_view_steps_are_recorded_by_the_wrappers(batch):
+    batch.ROI([0, 5], 'Energy axis', mod_map=False)
+    batch.subtract_background('shirley')
+    batch.set_BE()
+    batch.norm_01()
+    assert batch.view_steps == (('subtract_background', ('shirley',)),
+                                ('set_BE', ()), ('norm_01', ()))
+    cut = map_cut(batch, [1.0], [1.0], 'Time axis')
+    cut.savgol_smooth(5, 2)
+    assert cut.cut_steps == (('savgol_smooth', (5, 2, 1)),)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from packages.WESPE_data_OOP import robust_limits
+
+
+def test_robust_limits_of_small_maps_are_exact():
+    values = np.random.default_rng(1).normal(size=(300, 200))
+    low, high = robust_limits(values, 0.5, 99.5)
+    k_low = int(round(0.005*(values.size - 1)))
+    k_high = int(round(0.995*(values.size - 1)))
+    ordered = np.sort(values, axis=None)
+    assert (low, high) == (ordered[k_low], ordered[k_high])
+
+
+def test_robust_limits_do_not_alias_onto_columns():
+    # columns repeat with the period of a regular subsampling stride
+    columns = np.tile(np.arange(8, dtype=float), 1000*128)
+    values = columns.reshape(1000, 1024)
+    low, high = robust_limits(values, 1, 99, max_samples=2**16)
+    assert (low, high) == (0, 7)
+    assert robust_limits(values, 1, 99, max_samples=2**16) == (low, high)
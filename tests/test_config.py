@@ -0,0 +1,38 @@
+import json
+
+import packages.WESPE_data_OOP as W
+
+NEW_KEYS = ['dif_ref_window', 'precision', 'map_scale_mode', 'map_percentiles',
+            'save_fit', 'n_bootstrap', 'background', 'persistent_figure',
+            'map_display', 'job_workers']
+
+
+def test_missing_settings_come_from_defaults(make_config):
+    # a config file written before the settings above existed
+    config = make_config(drop=NEW_KEYS, dpi=123)
+    assert config.dpi == 123
+    assert config.n_bootstrap == 200
+    assert config.map_percentiles == [0.5, 99.5]
+    assert config.save_fit == 'off'
+    assert 'dif_ref_window' in config.as_dict()
+
+
+def test_old_config_runs_the_pipeline(use_config, batch):
+    use_config(drop=NEW_KEYS)
+    W.apply_view(batch, {'dif_map': True})
+    cut = W.map_cut(batch, [1.0], [1.0], 'Time axis')
+    cut.voigt_fit()
+    assert cut.fit is True
+
+
+def test_settings_are_saved_to_the_file_in_use(tmp_path):
+    # config.json in the working directory shadows packages/config.json
+    (tmp_path / 'packages').mkdir()
+    paths = [tmp_path / 'config.json', tmp_path / 'packages' / 'config.json']
+    for dpi, path in zip([100, 200], paths):
+        path.write_text(json.dumps({'dpi': dpi}))
+    config = W.config_file([str(i) for i in paths])
+    config.save({'dpi': 300})
+    assert config.dpi == 300
+    assert json.loads(paths[0].read_text()) == {'dpi': 300}
+    assert json.loads(paths[1].read_text()) == {'dpi': 200}
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def test_dif_map_is_kept_for_the_same_map(batch):
+    batch.create_dif_map()
+    dif_map = batch.delay_energy_map_dif
+    batch.delay_energy_map_plot = batch.delay_energy_map
+    batch.create_dif_map()
+    assert batch.delay_energy_map_dif is dif_map
+
+
+def test_dif_map_follows_axes_and_window(batch):
+    batch.create_dif_map()
+    dif_map = batch.delay_energy_map_dif
+    batch.set_BE()
+    batch.create_dif_map()
+    assert batch.delay_energy_map_dif is not dif_map
+    batch.create_dif_map([-5, -1])
+    ref = batch.reference_spectrum([-5, -1])
+    expected = batch.delay_energy_map.values - ref
+    assert np.allclose(batch.delay_energy_map_dif.values, expected)
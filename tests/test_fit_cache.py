@@ -0,0 +1,25 @@
+import packages.WESPE_data_OOP as W
+
+
+def test_identical_fits_come_from_the_cache(batch, monkeypatch):
+    monkeypatch.setattr(W, 'fit_results', W.fit_cache())
+    cut = W.map_cut(batch, [-2.0], [1.0], 'Time axis')
+    cut.voigt_fit()
+    assert len(W.fit_results.entries) == 1
+    entry = next(iter(W.fit_results.entries.values()))
+    again = W.map_cut(batch, [-2.0], [1.0], 'Time axis')
+    again.voigt_fit()
+    assert len(W.fit_results.entries) == 1
+    assert again.fit_values == cut.fit_values == entry['values']
+    W.map_cut(batch, [1.0], [1.0], 'Time axis').voigt_fit()
+    assert len(W.fit_results.entries) == 2
+
+
+def test_fit_cache_is_lru_and_persistent(tmp_path):
+    cache = W.fit_cache(maxsize=2)
+    for key in 'abc':
+        cache.put(key, {'values': key}, str(tmp_path))
+    assert list(cache.entries) == ['b', 'c']
+    assert cache.get('a') is None
+    assert cache.get('a', str(tmp_path)) == {'values': 'a'}
+    assert list(cache.entries) == ['c', 'a']
@@ -0,0 +1,44 @@
+import numpy as np
+
+from packages.WESPE_data_OOP import global_voigt_fit, voigt_profile
+
+
+def test_global_fit_recovers_parameters():
+    rng = np.random.default_rng(4)
+    x = np.linspace(95, 105, 201)
+    centers = np.linspace(99.5, 100.5, 30)
+    amplitudes = rng.uniform(50, 150, 30)
+    backgrounds = rng.uniform(0, 5, 30)
+    sigma, gamma = 0.3, 0.1
+    lines = (amplitudes[:, None]*voigt_profile(x, centers[:, None],
+                                               sigma, gamma)
+             + backgrounds[:, None])
+    lines = lines + rng.normal(0, 0.05, lines.shape)
+    lines[3, 10:20] = np.nan
+    result = global_voigt_fit(x, lines)
+    assert result['success']
+    assert abs(result['sigma'] - sigma) < 0.01
+    assert abs(result['gamma'] - gamma) < 0.01
+    assert np.allclose(result['center'], centers, atol=2e-3)
+    assert np.allclose(result['amplitude'], amplitudes, rtol=1e-2)
+    assert np.allclose(result['background'], backgrounds, atol=0.05)
+
+
+def test_global_fit_of_map_follows_the_shift(batch):
+    table = batch.global_fit()
+    center = table['Center']
+    delay = center.coords['Delay']
+    before = center.where(delay < -0.5, drop=True)
+    after = center.where((delay > 0) & (delay < 0.5), drop=True)
+    assert abs(float(before.mean()) - 100) < 0.05
+    assert float(after.mean()) - float(before.mean()) > 0.15
+
+
+def test_stalled_fit_is_not_successful():
+    # lines without any peak: the cost stops decreasing long before tol
+    rng = np.random.default_rng(0)
+    rng.normal(size=(4, 201))
+    x = np.linspace(95, 105, 201)
+    result = global_voigt_fit(x, rng.normal(0, 1, (3, 201)))
+    assert result['message'].startswith('Stalled')
+    assert not result['success']
@@ -0,0 +1,61 @@
+import threading
+
+import packages.WESPE_data_OOP as W
+
+
+def spec(run):
+    return {'runs': [str(run)], 'view': {'energy_step': 0.125}}
+
+
+def fake_jobs(monkeypatch):
+    started = []
+    running = threading.Event()
+    gate = threading.Event()
+
+    def run_job(kind, file_dir, spec, DLD='DLD4Q', progress=None,
+                cancel=None):
+        run = int(spec['runs'][0])
+        started.append(run)
+        if run == 1:
+            running.set()
+            gate.wait(10)
+        if kind == 'fit':
+            raise RuntimeError('fit failed')
+        return run
+
+    monkeypatch.setattr(W, 'run_job', run_job)
+    return started, running, gate
+
+
+def test_priority_and_cancel(monkeypatch):
+    started, running, gate = fake_jobs(monkeypatch)
+    queue = W.job_queue(workers=1)
+    # the worker holds the first job until the gate opens
+    first = queue.submit('map', 'dir', spec(1))
+    running.wait(10)
+    low = queue.submit('map', 'dir', spec(2), priority=0)
+    cancelled = queue.submit('map', 'dir', spec(3), priority=5)
+    high = queue.submit('map', 'dir', spec(4), priority=10)
+    queue.cancel(cancelled)
+    gate.set()
+    queue.shutdown()
+    assert started == [1, 4, 2]
+    assert [first.result, high.result, low.result] == [1, 4, 2]
+    assert cancelled.status == 'cancelled' and cancelled.started is None
+    assert 'cancelled' in cancelled.summary()
+
+
+def test_failed_job_records_error(monkeypatch):
+    started, running, gate = fake_jobs(monkeypatch)
+    changes = []
+    queue = W.job_queue(workers=1, on_change=lambda job: changes.append(
+        job.status))
+    job = queue.submit('fit', 'dir', spec(5))
+    job.wait(10)
+    queue.shutdown()
+    assert job.status == 'failed'
+    assert isinstance(job.error, RuntimeError)
+    assert job.result is None
+    assert changes == ['queued', 'running', 'failed']
+    assert job.summary().startswith('#1 fit (priority 0): Run 5, DLD4Q')
+    assert 'failed' in job.summary()
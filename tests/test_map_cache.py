@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+import packages.WESPE_data_OOP as W
+
+
+def map_spec(B_filters=()):
+    return {'runs': ['1001', '1002'],
+            'view': {'energy_step': 0.125, 'delay_step': 0.1,
+                     'ordinate': 'delay', 'B_filters': list(B_filters),
+                     'BE': False, 't0': None}}
+
+
+def test_map_key_covers_map_inputs(use_config, data_dir):
+    use_config(save_nc='off')
+    key = W.map_key(data_dir, map_spec())
+    assert W.map_key(data_dir, map_spec()) == key
+    assert W.map_key(data_dir, map_spec([[[0, 50], 'MacroBunch']])) != key
+    for name, value in [('map_counting', 'classic'),
+                        ('precision', 'float32'), ('save_nc', 'on')]:
+        use_config(**{'save_nc': 'off', name: value})
+        assert W.map_key(data_dir, map_spec()) != key, name
+    use_config(save_nc='off')
+    path = os.path.join(data_dir, '1001', '1001_energy.mat')
+    stat = os.stat(path)
+    try:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert W.map_key(data_dir, map_spec()) != key
+    finally:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_filtered_batch_does_not_poison_the_store(monkeypatch, use_config,
+                                                  data_dir):
+    use_config(save_nc='off')
+    monkeypatch.setattr(W, 'map_results', W.map_store())
+    fresh = W.spec_map(data_dir, map_spec())
+    W.map_results.clear()
+
+    filtered = W.create_batch(data_dir, ['1001', '1002'])
+    filtered.create_maps(0.125, 0.1, save='off',
+                         B_filters=[([0, 50], 'MacroBunch')])
+    batch = W.spec_map(data_dir, map_spec(), batch=filtered.map_copy())
+    total = fresh.delay_energy_map.values.sum()
+    assert batch.delay_energy_map.values.sum() == total
+
+    cached = W.spec_map(data_dir, map_spec())
+    assert cached is not batch
+    assert np.array_equal(cached.delay_energy_map.values,
+                          batch.delay_energy_map.values)
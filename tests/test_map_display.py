@@ -0,0 +1,46 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+from packages.WESPE_data_OOP import block_reduce, map_display
+
+
+def test_block_reduce_crops_partial_blocks():
+    values = np.arange(5*7, dtype=float).reshape(5, 7)
+    reduced = block_reduce(values, [2, 3])
+    assert reduced.shape == (2, 2)
+    assert reduced[1, 1] == values[2:4, 3:6].mean()
+    assert block_reduce(values, [2, 3], 'max')[1, 1] == values[3, 5]
+
+
+def test_reduced_pixels_stay_in_place():
+    # the value of every pixel is its x coordinate (pixel center)
+    n_y, n_x = 301, 1003
+    x = np.arange(n_x) + 0.5
+    image_data = np.tile(x, (n_y, 1))
+    display = map_display(image_data, [0, n_x, 0, n_y], 'mean')
+    fig, axs = plt.subplots(figsize=(2, 1), dpi=100)
+    reduced, extent = display.reduce(axs)
+    plt.close(fig)
+    assert reduced.shape[1] < n_x
+    width = (extent[1] - extent[0])/reduced.shape[1]
+    centers = extent[0] + width*(np.arange(reduced.shape[1]) + 0.5)
+    assert np.allclose(reduced[0], centers)
+    assert extent[3] == n_y
+
+
+def test_zoom_is_connected_only_for_aggregation():
+    image_data = np.random.default_rng(0).random((300, 1000))
+    fig, axs = plt.subplots(figsize=(2, 1), dpi=100)
+    display = map_display(image_data, [0, 1000, 0, 300], 'off')
+    im = axs.imshow(image_data, extent=display.extent, aspect='auto')
+    display.connect(im)
+    assert display.callbacks == []
+    axs.set_xlim(100, 200)
+    assert im.get_array().shape == image_data.shape
+
+    display.set_method('mean')
+    axs.set_xlim(0, 500)
+    assert im.get_array().shape[1] < 500
+    display.set_method('off')
+    assert display.callbacks == []
+    plt.close(fig)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from packages.WESPE_data_OOP import (norm_01_array, norm_11_array,
+                                     norm_total_e_array)
+
+
+def values():
+    rng = np.random.default_rng(3)
+    values = rng.uniform(-2, 5, (6, 40))
+    values[1] = 0  # all-zero line
+    values[2] = 1.5  # line without range
+    values[3, 5] = np.nan
+    return values
+
+
+def close(a, b):
+    np.testing.assert_allclose(a, b, rtol=1e-12, equal_nan=True)
+
+
+def test_norm_total_e():
+    v = values()
+    sums = np.nansum(v, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        close(norm_total_e_array(v), v*(sums.mean()/sums)[:, None])
+        sums = np.nansum(v, axis=0)
+        close(norm_total_e_array(v, axis=0), v*sums.mean()/sums)
+
+
+def test_norm_01():
+    v = values()
+    v_min, v_max = np.nanmin(v), np.nanmax(v)
+    close(norm_01_array(v), (v - v_min)/(v_max - v_min))
+    v_min = np.nanmin(v, axis=1)[:, None]
+    v_max = np.nanmax(v, axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        close(norm_01_array(v, axis=1), (v - v_min)/(v_max - v_min))
+    assert np.all(np.isnan(norm_01_array(v, axis=1)[1:3]))
+
+
+def test_norm_11():
+    v = values()
+    close(norm_11_array(v), v/np.nanmax(np.abs(v)))
+    norm = np.nanmax(np.abs(v), axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        close(norm_11_array(v, axis=1), v/norm)
+    assert np.all(np.isnan(norm_11_array(v, axis=1)[1]))
+    close(norm_11_array(np.zeros((2, 3))), np.full((2, 3), np.nan))
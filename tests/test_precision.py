@@ -0,0 +1,22 @@
+import numpy as np
+
+import packages.WESPE_data_OOP as W
+
+
+def test_float64_is_the_default(use_config):
+    # config files written before the precision setting existed
+    use_config(defaults=False, dpi=300)
+    counts = np.arange(10)
+    assert W.float_dtype(counts) == np.float64
+    assert W.analysis_array(counts) is counts
+    assert W.counts_array(counts) is counts
+
+
+def test_float32_is_opt_in(use_config):
+    use_config(defaults=False, precision='float32')
+    assert W.float_dtype(np.arange(10)) == np.float32
+    assert W.counts_array(np.arange(10)).dtype == np.uint8
+
+
+def test_default_maps_are_float64(batch):
+    assert batch.delay_energy_map.dtype == np.float64
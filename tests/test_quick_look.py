@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+from conftest import write_run
+from packages.WESPE_data_OOP import quick_look_path, quick_looks
+
+
+def test_quick_looks_of_synthetic_runs(tmp_path):
+    file_dir = str(tmp_path)
+    rng = np.random.default_rng(2)
+    for run in (2001, 2002):
+        write_run(file_dir, run, rng, n=20000)
+    done = []
+    table = quick_looks(file_dir, processes=2,
+                        progress=lambda run, summary: done.append(run))
+    assert sorted(done) == [2001, 2002]
+    assert list(table.coords['Run'].values) == [2001, 2002]
+    assert np.all(table['Events'].values == 20000)
+    assert not np.any(table['Static'].values)
+    for run in (2001, 2002):
+        assert os.path.isfile(quick_look_path(file_dir, run) + '.png')
+
+    # the second call takes the thumbnails from the cache
+    done.clear()
+    cached = quick_looks(file_dir,
+                         progress=lambda run, summary: done.append(run))
+    assert done == [2001, 2002]
+    assert np.array_equal(cached['Events'], table['Events'])
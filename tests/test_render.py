@@ -0,0 +1,34 @@
+import os
+
+import matplotlib.pyplot as plt
+
+from conftest import T0
+from packages.WESPE_data_OOP import figure_name, render_figures
+
+
+def spec(runs, **view):
+    view = dict({'energy_step': 0.125, 'delay_step': 0.1, 't0': T0}, **view)
+    return {'runs': runs, 'view': view}
+
+
+def test_figure_name_is_stable():
+    name = figure_name(spec(['1002', '1001'], BE=False))
+    assert name.startswith('Fig_Runs_1001-1002_')
+    # the order of runs and view keys does not matter
+    assert figure_name({'runs': [1001, 1002],
+                        'view': dict(reversed(list(
+                            spec([], BE=False)['view'].items())))}) == name
+    assert figure_name(spec(['1001', '1002'], BE=True)) != name
+    assert figure_name(spec(['1001', '1002'], BE=False), dpi=100) != name
+
+
+def test_render_figures_writes_one_file_per_spec(data_dir):
+    backend = plt.get_backend()
+    specs = [spec(['1001']), spec(['1001', '1002']), spec(['1001'])]
+    paths = render_figures(data_dir, specs, dpi=50, processes=2)
+    assert paths[0] == paths[2]
+    assert len(set(paths)) == 2
+    for path in paths:
+        assert os.path.isfile(path)
+        assert os.path.dirname(path) == os.path.join(data_dir, 'fig_output')
+    assert plt.get_backend() == backend
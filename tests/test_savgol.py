@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+
+from packages.WESPE_data_OOP import savgol_array
+
+
+@pytest.mark.parametrize('window_length, polyorder, cycles',
+                         [(3, 1, 1), (5, 2, 3), (7, 3, 4), (11, 2, 2),
+                          (5, 2, 10)])
+@pytest.mark.parametrize('n', [9, 40, 200])
+def test_cycles_match_successive_filters(n, window_length, polyorder,
+                                         cycles):
+    values = np.random.default_rng(n).normal(size=(3, n))
+    expected = values
+    for i in range(cycles):
+        expected = savgol_filter(expected, window_length, polyorder,
+                                 mode='nearest', axis=1)
+    result = savgol_array(values, window_length, polyorder, cycles, axis=1)
+    # the edges are where the composite kernel alone would differ
+    np.testing.assert_allclose(result, expected, atol=1e-12)
+    result = savgol_array(values.T, window_length, polyorder, cycles, axis=0)
+    np.testing.assert_allclose(result, expected.T, atol=1e-12)
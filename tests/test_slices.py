@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from packages.WESPE_data_OOP import map_cut
+
+
+def brute_force_lines(arr, positions, deltas, axis, approach):
+    if axis == 'Time axis':
+        dim = 'Delay'
+    else:
+        dim = 'Energy'
+    coord = arr.coords[dim].values
+    values = np.moveaxis(arr.values, arr.get_axis_num(dim), 0)
+    lines = []
+    for position, delta in zip(positions, deltas):
+        mask = (coord >= position - delta/2) & (coord <= position + delta/2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if approach == 'sum':
+                lines.append(np.nansum(values[mask], axis=0))
+            else:
+                lines.append(np.nansum(values[mask], axis=0) /
+                             np.sum(~np.isnan(values[mask]), axis=0))
+    return np.array(lines)
+
+
+@pytest.mark.parametrize('axis, dim', [('Time axis', 'Delay'),
+                                       ('Energy axis', 'Energy')])
+def test_roi_matches_brute_force(batch, axis, dim):
+    arr = batch.delay_energy_map_plot
+    coord = arr.coords[dim].values
+    rng = np.random.default_rng(2)
+    for limits in rng.uniform(coord.min() - 1, coord.max() + 1, (50, 2)):
+        selection = batch.ROI_slice(limits, axis)
+        mask = (coord >= limits.min()) & (coord <= limits.max())
+        assert np.array_equal(coord[selection], coord[mask])
+
+
+@pytest.mark.parametrize('axis', ['Time axis', 'Energy axis'])
+@pytest.mark.parametrize('approach', ['mean', 'sum'])
+@pytest.mark.parametrize('with_nan', [False, True])
+def test_cuts_match_brute_force(batch, axis, approach, with_nan):
+    if with_nan:
+        values = batch.delay_energy_map_plot.values.astype(float)
+        values[np.random.default_rng(3).random(values.shape) < 0.1] = np.nan
+        batch.delay_energy_map_plot = batch.delay_energy_map_plot.copy(
+            data=values)
+    if axis == 'Time axis':
+        positions, deltas = [-2.0, 0.0, 0.3, 1.5], [0.5, 0.2, 1.0, 3.0]
+    else:
+        positions, deltas = [97.0, 100.0, 100.3], [0.5, 0.1, 2.0]
+    cut = map_cut(batch, positions, deltas, axis, approach)
+    expected = brute_force_lines(batch.delay_energy_map_plot, positions,
+                                 deltas, axis, approach)
+    assert np.allclose(cut.cuts, expected, equal_nan=True)
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from test_slices import brute_force_lines
+
+
+@pytest.mark.parametrize('axis, dim', [('Time axis', 'Delay'),
+                                       ('Energy axis', 'Energy')])
+def test_sweep_returns_every_line(batch, axis, dim):
+    arr = batch.delay_energy_map_plot
+    cut = batch.sweep(axis=axis)
+    coord = arr.coords[dim].values
+    assert len(cut.positions) == coord.shape[0]
+    values = np.moveaxis(arr.values, arr.get_axis_num(dim), 0)
+    order = np.argsort(coord)
+    assert np.allclose(cut.cuts, values[order])
+
+
+def test_sweep_with_step_matches_brute_force(batch):
+    cut = batch.sweep(step=0.5, delta=0.3, axis='Time axis')
+    expected = brute_force_lines(batch.delay_energy_map_plot, cut.positions,
+                                 cut.deltas, 'Time axis', 'mean')
+    assert np.allclose(cut.cuts, np.nan_to_num(expected))
@@ -0,0 +1,34 @@
+import numpy as np
+
+from conftest import T0
+from packages import WESPE_data_OOP as W
+from packages.WESPE_data_OOP import t0_fit, t0_finder
+
+
+def test_derivative_and_erf_agree(data_dir):
+    runs = ['1001', '1002']
+    derivative = t0_fit(data_dir, runs, energy_step=0.125, position='100.5')
+    erf = t0_fit(data_dir, runs, energy_step=0.125, position='100.5',
+                 method='erf')
+    assert abs(derivative['t0'] - T0) < 0.1
+    assert abs(erf['t0'] - T0) < 0.15
+    assert abs(derivative['t0'] - erf['t0']) < 0.15
+
+
+def test_t0_finder_table(data_dir):
+    table = t0_finder(data_dir, [['1001'], '1002'], energy_step=0.125,
+                      position='100.5', processes=2)
+    assert list(table.coords['Runs'].values) == ['1001', '1002']
+    assert np.all(np.abs(table['t0'].values - T0) < 0.15)
+
+
+def test_t0_fit_applies_energy_threshold(data_dir, monkeypatch):
+    calls = []
+    roi = W.create_batch.ROI
+
+    def spy(self, limits, axis, mod_map=True):
+        calls.append((list(limits), axis, self.en_threshold))
+        return roi(self, limits, axis, mod_map)
+    monkeypatch.setattr(W.create_batch, 'ROI', spy)
+    t0_fit(data_dir, ['1001'], energy_step=0.125, position='100.5')
+    assert calls == [([0, 450.0], 'Energy axis', 450.0)]
@@ -0,0 +1,16 @@
+import numpy as np
+
+from packages.WESPE_data_OOP import map_cut
+
+
+def test_pool_matches_serial_fits(batch):
+    cut = map_cut(batch, [-3.0, -1.0, 0.5, 1.0, 1.5, 2.5], [1.0],
+                  'Time axis')
+    serial = cut.voigt_fit_all(processes=1)
+    pool = cut.voigt_fit_all(processes=3)
+    for name in serial.data_vars:
+        if 'stderr' in name or name == 'Reduced chi-square':
+            continue
+        assert np.allclose(pool[name], serial[name], rtol=1e-3,
+                           atol=1e-3*np.abs(serial[name]).max()), name
+    assert np.all(np.abs(serial['Center'] - 100) < 0.5)